@@ -1,23 +1,40 @@
-import time
 import hashlib
 import re
 from datetime import datetime, timedelta
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-import undetected_chromedriver as uc
-from supabase_utils import insert_review
+from review_writer import RowsDropped, create_writer, flush_for_checkpoint
+from browser import create_driver, ResponseCapture
+from driver_pool import MemoryPressure, pool
+from extractors import BookMyShowExtractor
+from failures import SelectorBroken
+from rate_limiter import OK, limiter, page_outcome
+from checkpoints import CheckpointStore, review_hash
+from metrics import registry as metrics
+from records import Movie, Review
+from waits import AdaptiveTimeout, wait_for_count_growth, wait_for_dom_quiet, stats as wait_stats
+
+PAGE_SETTLE = AdaptiveTimeout(initial=10, floor=2, ceiling=30)
+# Next batch of the infinite list after a scroll
+SCROLL_LOAD = AdaptiveTimeout(initial=10, floor=2, ceiling=60)
+
+REVIEW_BOXES_XPATH = '//*[@id="super-container"]/div[1]/div/div/section[3]/div[1]/div[3]/div'
+# JSON responses (other types are ignored) whose URL names reviews, as fetched
+# by the infinite list
+REVIEW_API = r"[Rr]eviews?"
 
 def get_movie_id(movie_url):
     return hashlib.md5(movie_url.encode('utf-8')).hexdigest()
 
+@metrics.timed("consent")
 def close_consent_popup(driver):
     try:
         consent_btn = WebDriverWait(driver, 5).until(
             EC.element_to_be_clickable((By.XPATH, "//button[contains(translate(text(),'ABCDEFGHIJKLMNOPQRSTUVWXYZ','abcdefghijklmnopqrstuvwxyz'),'accept') or contains(translate(text(),'ABCDEFGHIJKLMNOPQRSTUVWXYZ','abcdefghijklmnopqrstuvwxyz'),'agree')]"))
         )
         consent_btn.click()
-        time.sleep(1)
+        wait_for_dom_quiet(driver, timeout=3, label="consent")
     except Exception:
         pass
 
@@ -42,168 +59,288 @@ def parse_relative_date(date_str):
         return date_str
 
 def wait_for_more_reviews(driver, review_xpath, previous_count, timeout=60):
-    """Wait until more reviews are loaded (number of elements increases), up to 60 seconds."""
-    start_time = time.time()
-    while time.time() - start_time < timeout:
-        current_count = len(driver.find_elements(By.XPATH, review_xpath))
-        if current_count > previous_count:
-            return True
-        time.sleep(0.5)
-    return False
+    """Wait until more reviews are loaded (number of elements increases), up to `timeout`."""
+    return wait_for_count_growth(driver, review_xpath, previous_count, timeout=timeout, label="scroll") > previous_count
+
+def review_row(review, movie_id, movie, source_site):
+    return Review(Movie.of(movie_id, movie["movie_name"], movie["movie_release_year"], source_site),
+                  review["reviewer_name"], parse_relative_date(review["review_date"]), review["review_text"],
+                  review["star_rating"], review["likes_count"])
+
+def write_reviews(reviews, movie_id, movie_url, movie, source_site, writer, progress):
+    """Write reviews not seen before (up to 200 per movie) and return their hashes.
+
+    Updates progress["review_count"] and progress["seen"] in place.
+    """
+    new_hashes = []
+    for review in reviews:
+        if progress["review_count"] >= 200:
+            break
+        reviewer_name = review["reviewer_name"]
+        review_text = review["review_text"]
+
+        digest = review_hash(reviewer_name, review_text)
+        if digest in progress["seen"] or not review_text:
+            continue
+        progress["seen"].add(digest)
+        new_hashes.append(digest)
+
+        writer.add(review_row(review, movie_id, movie, source_site))
+        progress["review_count"] += 1
+    return new_hashes
+
+def scroll_to_bottom(driver, movie_url):
+    limiter.acquire(movie_url)
+    with metrics.stage("expand"):
+        driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+
+def restore_scroll(driver, movie_url, offset):
+    """Scroll until the list holds `offset` reviews again, without reading them; returns how many it holds."""
+    count = 0
+    while count < offset:
+        scroll_to_bottom(driver, movie_url)
+        loaded = wait_for_count_growth(driver, REVIEW_BOXES_XPATH, count, timeout=SCROLL_LOAD, label="scroll")
+        if loaded <= count:
+            break
+        count = loaded
+    return count
 
-def scrape_bookmyshow_reviews(movie_urls: list, source_site: str = "bookmyshow"):
-    options = uc.ChromeOptions()
-    # options.add_argument("--headless=new")
-    options.add_argument("--disable-gpu")
-    driver = uc.Chrome(options=options)
+def open_movie(driver, capture, extractor, movie_url, scroll_offset=0):
+    """Load the movie page and scroll back to `scroll_offset` reviews.
 
-    for movie_url in movie_urls:
+    Returns the movie fields, or None if the page shows no movie or no reviews.
+    """
+    if capture:
+        capture.clear()
+    limiter.acquire(movie_url)
+    with metrics.stage("navigation"):
         driver.get(movie_url)
-        time.sleep(3)
+    wait_for_dom_quiet(driver, timeout=PAGE_SETTLE, label="page_load")
+    if pool.first_visit(driver, "bookmyshow"):
         close_consent_popup(driver)
 
-        # Movie name
-        try:
-            movie_name = WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((By.XPATH, '//*[@id="super-container"]/div[1]/div/div/div[1]'))
-            ).text.strip()
-        except Exception as e:
-            print(f"Failed to extract movie name for {movie_url}: {e}")
-            continue
+    # Movie name
+    try:
+        WebDriverWait(driver, 10).until(
+            EC.presence_of_element_located((By.XPATH, '//*[@id="super-container"]/div[1]/div/div/div[1]'))
+        )
+    except Exception as e:
+        limiter.report(movie_url, page_outcome(driver.page_source, 0))
+        print(f"Failed to extract movie name for {movie_url}: {e}")
+        return None
 
-        # Release year
-        try:
-            release_date_elem = driver.find_element(By.XPATH, '//*[@id="super-container"]/div[1]/div/div/section[1]/div[1]/div[1]/div[2]/span')
-            release_date_text = release_date_elem.text.strip()
-            match = re.search(r'(\d{4})', release_date_text)
-            movie_release_year = match.group(1) if match else ""
-        except Exception:
-            movie_release_year = ""
-
-        movie_id = get_movie_id(movie_url)
-        reviews_scraped = 0
-        seen_reviews = set()
-        batch = []
-
-        review_boxes_xpath = '//*[@id="super-container"]/div[1]/div/div/section[3]/div[1]/div[3]/div'
-
-        # Wait for the first batch of reviews to load
-        try:
-            WebDriverWait(driver, 10).until(
-                EC.presence_of_all_elements_located((By.XPATH, review_boxes_xpath))
-            )
-        except Exception as e:
-            print(f"No reviews found for {movie_name}: {e}")
-            continue
+    with metrics.stage("extract"):
+        movie = extractor.extract_movie(extractor.parse(driver.page_source))
+
+    # Wait for the first batch of reviews to load
+    try:
+        WebDriverWait(driver, 10).until(
+            EC.presence_of_all_elements_located((By.XPATH, REVIEW_BOXES_XPATH))
+        )
+    except Exception as e:
+        print(f"No reviews found for {movie['movie_name']}: {e}")
+        return None
+
+    if scroll_offset:
+        # Responses the scrolling fetches stay captured: reviews already stored are skipped by hash
+        restore_scroll(driver, movie_url, scroll_offset)
+    return movie
+
+def scrape_movie_dom(driver, extractor, movie_id, movie_url, movie, source_site, writer, checkpoints, progress,
+                     watch=True):
+    """Scroll the review list, re-reading the page after each batch. Returns True when the list ran out.
+
+    With `watch`, raises MemoryPressure (after a checkpoint) once the tab has grown too big.
+    """
+    last_review_count = 0
+    scroll_attempts = 0
+
+    while progress["review_count"] < 200:
+        with metrics.stage("extract"):
+            html = driver.page_source
+            reviews = extractor.extract_reviews(extractor.parse(html), movie_url)
+        total_reviews = len(reviews)
+        limiter.report(movie_url, page_outcome(html, total_reviews))
 
-        last_review_count = 0
-        scroll_attempts = 0
+        # Scrape only new reviews
+        new_hashes = write_reviews(reviews[last_review_count:], movie_id, movie_url, movie, source_site,
+                                   writer, progress)
 
-        while reviews_scraped < 200:
-            review_boxes = driver.find_elements(By.XPATH, review_boxes_xpath)
-            total_reviews = len(review_boxes)
+        # Checkpoint the round once its reviews are stored
+        flush_for_checkpoint(writer, progress)
+        progress["scroll_offset"] = max(progress["scroll_offset"], total_reviews)
+        checkpoints.save(movie_id, movie_url=movie_url, scroll_offset=progress["scroll_offset"],
+                         review_count=progress["review_count"], new_hashes=new_hashes,
+                         done=progress["review_count"] >= 200)
 
-            # Scrape only new reviews
-            for idx in range(last_review_count + 1, total_reviews + 1):
-                if reviews_scraped >= 200:
-                    break
+        if progress["review_count"] >= 200:
+            print(f"Collected 200 reviews for {movie['movie_name']}. Moving to next movie.")
+            return False
+        if watch:
+            pool.watch(driver)
+
+        if total_reviews == last_review_count:
+            # No new reviews loaded, try scrolling
+            scroll_attempts += 1
+            scroll_to_bottom(driver, movie_url)
+            loaded = wait_for_more_reviews(driver, REVIEW_BOXES_XPATH, last_review_count, timeout=SCROLL_LOAD)
+            if not loaded or scroll_attempts > 5:
+                print(f"No more reviews loaded after scrolling for {movie['movie_name']}.")
+                return True
+        else:
+            scroll_attempts = 0
+            last_review_count = total_reviews
+            # Ask for the next batch and continue as soon as it lands
+            scroll_to_bottom(driver, movie_url)
+            wait_for_more_reviews(driver, REVIEW_BOXES_XPATH, total_reviews, timeout=SCROLL_LOAD)
+    return False
+
+def scrape_movie_network(driver, capture, extractor, movie_id, movie_url, movie, source_site, writer,
+                         checkpoints, progress, watch=True):
+    """Read reviews from the JSON responses the page fetches as it scrolls.
+
+    The first batch is server-rendered, so it is read from the page once;
+    after that each scroll waits for the next reviews response and parses
+    it, without touching the DOM. Returns True when the list ran out, False
+    at the 200 cap, and None if no usable response arrived (the caller then
+    falls back to the DOM). Raises MemoryPressure like scrape_movie_dom.
+    """
+    with metrics.stage("extract"):
+        html = driver.page_source
+        reviews = extractor.extract_reviews(extractor.parse(html), movie_url)
+    limiter.report(movie_url, page_outcome(html, len(reviews)))
+    new_hashes = write_reviews(reviews, movie_id, movie_url, movie, source_site, writer, progress)
+    flush_for_checkpoint(writer, progress)
+    # The list holds every distinct review read from the page or its responses, so their
+    # number is the scroll offset; responses fetched while restoring the scroll repeat the page's
+    on_page = {review_hash(review["reviewer_name"], review["review_text"]) for review in reviews}
+    progress["scroll_offset"] = max(progress["scroll_offset"], len(on_page))
+    checkpoints.save(movie_id, movie_url=movie_url, scroll_offset=progress["scroll_offset"],
+                     review_count=progress["review_count"], new_hashes=new_hashes)
+
+    batch_size = 0
+    while progress["review_count"] < 200:
+        scroll_to_bottom(driver, movie_url)
+        payloads = capture.wait(SCROLL_LOAD)
+        with metrics.stage("extract"):
+            batches = [extractor.reviews_from_json(payload) for payload in payloads]
+        reviews = [review for batch in batches for review in batch]
+        if not reviews:
+            if not batch_size:
+                return None
+            print(f"No more review responses after scrolling for {movie['movie_name']}.")
+            return True
+        limiter.report(movie_url, OK)
+
+        new_hashes = write_reviews(reviews, movie_id, movie_url, movie, source_site, writer, progress)
+        flush_for_checkpoint(writer, progress)
+        on_page.update(review_hash(review["reviewer_name"], review["review_text"]) for review in reviews)
+        progress["scroll_offset"] = max(progress["scroll_offset"], len(on_page))
+        checkpoints.save(movie_id, movie_url=movie_url, scroll_offset=progress["scroll_offset"],
+                         review_count=progress["review_count"], new_hashes=new_hashes,
+                         done=progress["review_count"] >= 200)
+
+        # The latest response says whether more follow; without a flag, a response
+        # shorter than the earlier ones is the last one. One poll can hold several
+        # responses (e.g. after restore_scroll), so sizes are per response.
+        answered = [(payload, len(batch)) for payload, batch in zip(payloads, batches) if batch]
+        last_payload, last_size = answered[-1]
+        more = extractor.has_more(last_payload)
+        if more is False or (more is None and last_size < batch_size):
+            print(f"Reached the end of the reviews for {movie['movie_name']}.")
+            return True
+        batch_size = max(batch_size, *(size for _, size in answered))
+        if watch and progress["review_count"] < 200:
+            pool.watch(driver)
+
+    print(f"Collected 200 reviews for {movie['movie_name']}. Moving to next movie.")
+    return False
+
+def scrape_bookmyshow_reviews(movie_urls: list, source_site: str = "bookmyshow", writer=None,
+        user_data_dir=None, checkpoints=None, lean=False, mode="network"):
+    """Scrape BookMyShow user reviews.
+
+    mode="network" parses the review responses captured from Chrome's
+    network log and falls back to the DOM for a movie whose responses it
+    cannot read; mode="dom" always reads the rendered list.
+    """
+    network = mode == "network"
+    owns_writer = writer is None
+    if owns_writer:
+        writer = create_writer()
+    extractor = BookMyShowExtractor()
+    if checkpoints is None:
+        checkpoints = CheckpointStore()
+    total_scraped = 0
+
+    driver = pool.acquire(create_driver, user_data_dir=user_data_dir, lean=lean, network_log=network)
+    capture = ResponseCapture(driver, REVIEW_API) if network else None
+    try:
+        for movie_url in movie_urls:
+            metrics.set_movie("bookmyshow", movie_url)
+            movie_id = get_movie_id(movie_url)
+            progress = checkpoints.load(movie_id)
+            if progress["done"]:
+                print(f"Skipping {movie_url}: already finished with {progress['review_count']} reviews")
+                continue
+            progress["failed"] = getattr(writer, "failed", 0)
+            # Reviews written by an interrupted run are in progress["seen"] and get skipped
+            previous_count = progress["review_count"]
+
+            driver = pool.checkup(driver)
+            if capture and capture.driver is not driver:
+                capture = ResponseCapture(driver, REVIEW_API)
+            movie = open_movie(driver, capture, extractor, movie_url, progress["scroll_offset"])
+            if movie is None:
+                continue
+
+            dom = not capture
+            watch = True
+            resumed_at = None
+            while True:
+                args = (extractor, movie_id, movie_url, movie, source_site, writer, checkpoints, progress)
                 try:
-                    box_xpath = f'{review_boxes_xpath}[{idx}]'
-                    box = driver.find_element(By.XPATH, box_xpath)
-
-                    # Review text
-                    try:
-                        review_text = box.find_element(By.XPATH, './div[1]/div/p').text.strip()
-                    except Exception:
-                        review_text = ""
-
-                    reviewer_name = "user"
-
-                    # Review date
-                    try:
-                        review_date_str = box.find_element(By.XPATH, './div[2]/div[2]/span').text.strip()
-                        review_date = parse_relative_date(review_date_str)
-                    except Exception:
-                        review_date = ""
-
-                    # Star rating (out of 10, convert to 5)
-                    try:
-                        rating_xpath = f'{box_xpath}/div[1]/section/div[2]/div'
-                        rating_text = driver.find_element(By.XPATH, rating_xpath).text.strip()
-                        rating_match = re.search(r'(\d+(\.\d+)?)/10', rating_text)
-                        if rating_match:
-                            star_rating = float(rating_match.group(1)) / 2
-                        else:
-                            star_rating = 0.0
-                    except Exception:
-                        star_rating = 0.0
-
-                    # Likes count
-                    try:
-                        likes_xpath = f'{box_xpath}/div[2]/div[1]/button[1]/span'
-                        likes_text = driver.find_element(By.XPATH, likes_xpath).text.strip()
-                        likes_count = int(''.join(filter(str.isdigit, likes_text))) if likes_text else 0
-                    except Exception:
-                        likes_count = 0
-
-                    review_hash = hashlib.md5((reviewer_name + review_text).encode('utf-8')).hexdigest()
-                    if review_hash in seen_reviews or not review_text:
+                    done = None if dom else scrape_movie_network(driver, capture, *args, watch=watch)
+                    if done is None:
+                        if not dom:
+                            print(f"No review responses captured for {movie['movie_name']}, reading the page instead")
+                            dom = True
+                        done = scrape_movie_dom(driver, *args, watch=watch)
+                except (SelectorBroken, RowsDropped) as e:
+                    # Left unfinished, so a rerun picks it up
+                    print(f"Skipping the rest of {movie['movie_name']}: {e}")
+                    done = False
+                except MemoryPressure as e:
+                    if progress["review_count"] == resumed_at:
+                        # Scrolling back to the checkpoint alone fills the tab: carry on in it
+                        print(f"{e}; a fresh tab did not help, finishing {movie['movie_name']} in this one")
+                        watch = False
                         continue
-                    seen_reviews.add(review_hash)
-
-                    data = {
-                        "movie_id": movie_id,
-                        "reviewer_name": reviewer_name,
-                        "movie_name": movie_name,
-                        "movie_release_year": movie_release_year,
-                        "review_date": review_date,
-                        "review_text": review_text,
-                        "star_rating": star_rating,
-                        "likes_count": likes_count,
-                        "source_site": source_site,
-                        "language": "english"
-                    }
-                    batch.append(data)
-                    reviews_scraped += 1
-
-                    if len(batch) == 20:
-                        for review in batch:
-                            insert_review(review)
-                        batch = []
-
-                except Exception as e:
-                    print(f"Error extracting review {idx}: {e}")
-                    continue
-
-            if reviews_scraped >= 200:
-                print(f"Collected 200 reviews for {movie_name}. Moving to next movie.")
+                    resumed_at = progress["review_count"]
+                    # Everything up to the checkpoint is stored; pick up from its scroll offset
+                    print(f"{e}; resuming {movie['movie_name']} at review {progress['scroll_offset']}")
+                    driver = pool.recycle(driver)
+                    if capture and capture.driver is not driver:
+                        capture = ResponseCapture(driver, REVIEW_API)
+                    if open_movie(driver, capture, extractor, movie_url, progress["scroll_offset"]) is not None:
+                        continue
+                    done = False
                 break
 
-            if total_reviews == last_review_count:
-                # No new reviews loaded, try scrolling
-                scroll_attempts += 1
-                driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-                # Wait up to 60s for more reviews to load
-                loaded = wait_for_more_reviews(driver, review_boxes_xpath, last_review_count, timeout=60)
-                if not loaded or scroll_attempts > 5:
-                    print(f"No more reviews loaded after scrolling for {movie_name}.")
-                    break
-            else:
-                scroll_attempts = 0
-                last_review_count = total_reviews
-                time.sleep(3)  # Allow more reviews to load
-
-        # Insert any remaining reviews in the last batch
-        if batch:
-            for review in batch:
-                insert_review(review)
-
-        print(f"Scraped {reviews_scraped} reviews for {movie_name}")
+            if done:
+                checkpoints.mark_done(movie_id, progress["review_count"])
 
-    try:
-        driver.quit()
-    except Exception:
-        pass
+            print(f"Scraped {progress['review_count']} reviews for {movie['movie_name']}")
+            total_scraped += progress["review_count"] - previous_count
+    finally:
+        pool.release(driver)
+        if owns_writer:
+            writer.close()
+
+    print(wait_stats.report())
+    print(metrics.summary())
+    metrics.export()
+    return total_scraped
 
 if __name__ == "__main__":
     movie_urls = [
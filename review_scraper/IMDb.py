@@ -1,16 +1,30 @@
-import time
 import hashlib
-import re
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.common.keys import Keys
-import undetected_chromedriver as uc
-from supabase_utils import insert_review
+from review_writer import RowsDropped, create_writer, flush_for_checkpoint
+from browser import create_driver
+from driver_pool import pool
+from extractors import IMDbExtractor
+from failures import SelectorBroken
+from full_text import expand_all
+from rate_limiter import limiter, page_outcome
+from checkpoints import CheckpointStore, review_hash
+from metrics import registry as metrics
+from records import Movie, Review
+from waits import AdaptiveTimeout, wait_for_count_growth, wait_for_dom_quiet, stats as wait_stats
+
+PAGE_SETTLE = AdaptiveTimeout(initial=10, floor=2, ceiling=30)
+# One "25 more" batch (or "All" on the last round)
+LOAD_MORE = AdaptiveTimeout(initial=8, floor=2, ceiling=60)
+# Spoiler buttons and the expander of long reviews
+EXPAND_BUTTONS = ('article button.review-spoiler-button,'
+                  ' article > div:first-child > div:first-child > div:nth-child(3) > button')
 
 def get_movie_id(movie_url):
     return hashlib.md5(movie_url.encode('utf-8')).hexdigest()
 
+@metrics.timed("consent")
 def close_consent_popup(driver):
     try:
         consent_btn = WebDriverWait(driver, 5).until(
@@ -19,172 +33,152 @@ def close_consent_popup(driver):
             ))
         )
         consent_btn.click()
-        time.sleep(1)
+        wait_for_dom_quiet(driver, timeout=3, label="consent")
     except Exception:
         pass
 
-def click_all_button(driver):
-    all_button_xpath = '//*[@id="__next"]/main/div/section/div/section/div/div[1]/section[1]/div[3]/div/span[2]/button'
-    try:
-        all_button = WebDriverWait(driver, 10).until(
-            EC.element_to_be_clickable((By.XPATH, all_button_xpath))
-        )
-        all_button.click()
-        time.sleep(2)
-    except Exception as e1:
-        try:
-            all_button = driver.find_element(By.XPATH, all_button_xpath)
-            all_button.send_keys(Keys.ENTER)
-            time.sleep(2)
-        except Exception as e2:
-            try:
-                driver.execute_script("arguments[0].focus(); arguments[0].click();", all_button)
-                time.sleep(2)
-            except Exception as e3:
-                print(f"Could not click 'All' button: {e1} | {e2} | {e3}")
-
-def extract_release_year_from_title(title):
-    # Extracts year from "Movie Name (1994) - IMDb" or similar
-    match = re.search(r"\((\d{4})\)", title)
-    return match.group(1) if match else ""
-
-def scrape_imdb_reviews(movie_urls: list, source_site: str = "imdb"):
-    options = uc.ChromeOptions()
-    # options.add_argument("--headless=new")
-    options.add_argument("--disable-gpu")
-    driver = uc.Chrome(options=options)
-
-    for movie_url in movie_urls:
+# Clicks the "25 more" button, or "All" when that is the only one left, and
+# says which it clicked
+_LOAD_MORE_JS = """
+const label = button => button.textContent.trim().toLowerCase();
+const buttons = [...document.querySelectorAll('button')];
+const more = buttons.find(button => /^\\d+ more$/.test(label(button)));
+const all = buttons.find(button => label(button) === 'all');
+const choice = more || all;
+if (!choice) return null;
+choice.click();
+return label(choice);
+"""
+
+@metrics.timed("expand")
+def load_reviews(driver, target=200, max_rounds=20):
+    """Load at least `target` reviews, one batch per round-trip; returns how many are on the page.
+
+    Each round clicks "25 more" and returns as soon as the new articles are
+    in the DOM, so a movie needs about target/25 clicks instead of loading
+    its whole review history with "All".
+    """
+    review_xpath = IMDbExtractor.review_boxes.path
+    count = len(driver.find_elements(By.XPATH, review_xpath))
+    for _ in range(max_rounds):
+        if count >= target:
+            break
+        limiter.acquire("imdb.com")
+        if not driver.execute_script(_LOAD_MORE_JS):
+            break
+        new_count = wait_for_count_growth(driver, review_xpath, count, timeout=LOAD_MORE, label="load_more")
+        if new_count <= count:
+            break
+        count = new_count
+    return count
+
+def load_movie_page(driver, movie_url):
+    """Open a movie's reviews, load about 200 and expand them; returns the page source (None if no reviews)."""
+    limiter.acquire(movie_url)
+    with metrics.stage("navigation"):
         driver.get(movie_url)
-        time.sleep(3)
+    wait_for_dom_quiet(driver, timeout=PAGE_SETTLE, label="page_load")
+    if pool.first_visit(driver, "imdb"):
         close_consent_popup(driver)
-        click_all_button(driver)
-
-        try:
-            # Movie name from the h1 title
-            movie_name = WebDriverWait(driver, 20).until(
-                EC.presence_of_element_located((By.XPATH, '//h1[contains(@data-testid, "hero-title-block__title")]'))
-            ).text
-            # Release year from the page title
-            movie_release_year = extract_release_year_from_title(driver.title)
-        except Exception as e:
-            try:
-                movie_name = driver.title.split("-")[0].strip()
-                movie_release_year = extract_release_year_from_title(driver.title)
-            except Exception:
-                print(f"Failed to extract movie name or release year for {movie_url}: {e}")
-                continue
-
-        movie_id = get_movie_id(movie_url)
-        reviews_scraped = 0
-        seen_reviews = set()
-        batch = []
 
-        base_xpath = '//*[@id="__next"]/main/div/section/div/section/div/div[1]/section[1]/article'
-        review_index = 1
+    try:
+        WebDriverWait(driver, 20).until(
+            EC.presence_of_element_located((By.TAG_NAME, 'article'))
+        )
+    except Exception as e:
+        limiter.report(movie_url, page_outcome(driver.page_source, 0))
+        print(f"No reviews found for {movie_url}: {e}")
+        return None
+
+    load_reviews(driver, target=200)
+    # Spoiler and long reviews open in place, so wait for the DOM rather than the network
+    expand_all(driver, EXPAND_BUTTONS,
+               wait=lambda d: wait_for_dom_quiet(d, timeout=3, quiet_ms=150, label="expand"))
+    with metrics.stage("extract"):
+        return driver.page_source
+
+def review_row(review, movie_id, movie, source_site):
+    return Review(Movie.of(movie_id, movie["movie_name"], movie["movie_release_year"], source_site),
+                  review["reviewer_name"], review["review_date"], review["review_text"],
+                  review["star_rating"], review["likes_count"])
+
+def scrape_imdb_reviews(movie_urls: list, source_site: str = "imdb", writer=None,
+        user_data_dir=None, checkpoints=None, lean=False):
+    owns_writer = writer is None
+    if owns_writer:
+        writer = create_writer()
+    if checkpoints is None:
+        checkpoints = CheckpointStore()
+    extractor = IMDbExtractor()
+    total_scraped = 0
+
+    driver = pool.acquire(create_driver, user_data_dir=user_data_dir, lean=lean)
+    try:
+        for movie_url in movie_urls:
+            metrics.set_movie("imdb", movie_url)
+            movie_id = get_movie_id(movie_url)
+            progress = checkpoints.load(movie_id)
+            if progress["done"]:
+                print(f"Skipping {movie_url}: already finished with {progress['review_count']} reviews")
+                continue
+            progress["failed"] = getattr(writer, "failed", 0)
 
-        while reviews_scraped < 200:
-            review_xpath = f"{base_xpath}[{review_index}]"
+            driver = pool.checkup(driver)
+            html = load_movie_page(driver, movie_url)
+            if html is None:
+                continue
             try:
-                box = WebDriverWait(driver, 5).until(
-                    EC.presence_of_element_located((By.XPATH, review_xpath))
-                )
-            except Exception:
-                print(f"No more reviews found after {reviews_scraped} unique reviews.")
-                break
+                with metrics.stage("extract"):
+                    movie, reviews = extractor.extract(html, movie_url)
+            except SelectorBroken as e:
+                print(f"Skipping {movie_url}: {e}")
+                continue
+            limiter.report(movie_url, page_outcome(html, len(reviews)))
+            movie_name = movie["movie_name"]
+            if not movie_name:
+                print(f"Failed to extract movie name or release year for {movie_url}")
+                continue
 
-            try:
-                # Star rating (out of 10, convert to 0-5)
-                try:
-                    star_xpath = f'{review_xpath}/div[1]/div[1]/div[1]/span/span[1]'
-                    score_element = driver.find_element(By.XPATH, star_xpath)
-                    score = score_element.text.strip()
-                    star_rating = float(score) / 2
-                except Exception:
-                    star_rating = 0.0
-
-                # Reviewer name
-                try:
-                    reviewer_xpath = f'{review_xpath}/div[2]/ul/li[1]/a'
-                    reviewer_name = driver.find_element(By.XPATH, reviewer_xpath).text.strip()
-                except Exception:
-                    reviewer_name = ""
-
-                # Review date
-                try:
-                    date_xpath = f'{review_xpath}/div[2]/ul/li[2]'
-                    review_date = driver.find_element(By.XPATH, date_xpath).text.strip()
-                except Exception:
-                    review_date = ""
-
-                # Expand long review if button exists
-                try:
-                    expand_button_xpath = f'{review_xpath}/div[1]/div[1]/div[3]/button'
-                    expand_button = driver.find_element(By.XPATH, expand_button_xpath)
-                    driver.execute_script("arguments[0].click();", expand_button)
-                    time.sleep(0.2)
-                except Exception:
-                    pass
-
-                # Review text (always use the div you specified)
-                try:
-                    text_xpath = f'{review_xpath}/div[1]/div[1]/div[3]/div/div/div'
-                    review_text = driver.find_element(By.XPATH, text_xpath).text.strip()
-                except Exception:
-                    review_text = ""
+            # Reviews written by an interrupted run are in progress["seen"]
+            reviews_scraped = progress["review_count"]
+            seen_reviews = progress["seen"]
+            new_hashes = []
+
+            for review in reviews:
+                if reviews_scraped >= 200:
+                    break
+                reviewer_name = review["reviewer_name"]
+                review_text = review["review_text"]
 
                 # Unique hash for reviewer+review
-                review_hash = hashlib.md5((reviewer_name + review_text).encode('utf-8')).hexdigest()
-                if review_hash in seen_reviews or not review_text.strip():
-                    review_index += 1
+                digest = review_hash(reviewer_name, review_text)
+                if digest in seen_reviews or not review_text.strip():
                     continue
-                seen_reviews.add(review_hash)
-
-                # Likes count ("X out of Y found this helpful")
-                try:
-                    helpfulness = box.find_element(By.XPATH, './/div[contains(@class,"actions")]/span').text
-                    likes_count = int(helpfulness.split(" out of ")[0].replace(",", "").strip())
-                except Exception:
-                    likes_count = 0
-
-                data = {
-                    "movie_id": movie_id,
-                    "reviewer_name": reviewer_name,
-                    "movie_name": movie_name,
-                    "movie_release_year": movie_release_year,
-                    "review_date": review_date,
-                    "review_text": review_text,
-                    "star_rating": star_rating,
-                    "likes_count": likes_count,
-                    "source_site": source_site,
-                    "language": "english"
-                }
-                batch.append(data)
-                reviews_scraped += 1
-
-                # Insert in batches of 20
-                if len(batch) == 20:
-                    for review in batch:
-                        insert_review(review)
-                    batch = []
-
-            except Exception as e:
-                print(f"Error extracting review {review_index}: {e}")
-                print("Review HTML:", box.get_attribute('outerHTML'))
-
-            review_index += 1
-
-        # Insert any remaining reviews in the last batch
-        if batch:
-            for review in batch:
-                insert_review(review)
+                seen_reviews.add(digest)
+                new_hashes.append(digest)
 
-        print(f"Scraped {reviews_scraped} unique reviews for {movie_name}")
+                writer.add(review_row(review, movie_id, movie, source_site))
+                reviews_scraped += 1
 
-    try:
-        driver.quit()
-    except Exception:
-        pass
+            try:
+                flush_for_checkpoint(writer, progress)
+            except RowsDropped as e:
+                print(f"Leaving {movie_name} unfinished: {e}")
+                continue
+            checkpoints.save(movie_id, movie_url=movie_url, scroll_offset=len(reviews), review_count=reviews_scraped,
+                             new_hashes=new_hashes, done=True)
+
+            print(f"Scraped {reviews_scraped} unique reviews for {movie_name}")
+            total_scraped += reviews_scraped - progress["review_count"]
+    finally:
+        pool.release(driver)
+        if owns_writer:
+            writer.close()
+
+    print(wait_stats.report())
+    print(metrics.summary())
+    metrics.export()
+    return total_scraped
 
 if __name__ == "__main__":
     movie_urls = [
@@ -0,0 +1,255 @@
+import argparse
+import math
+import os
+import sqlite3
+import threading
+from datetime import date, datetime
+from functools import lru_cache
+
+DEFAULT_PATH = os.getenv("CINEDRIFT_AGGREGATES", "aggregates.sqlite3")
+
+# Half-star histogram: bucket i counts ratings in ((i - 1) / 2, i / 2], so 5.0
+# lands in h10 and 0.3 in h1. Unrated reviews (0.0) are only in `reviews`.
+BUCKETS = 10
+_HISTOGRAM = [f"h{i}" for i in range(1, BUCKETS + 1)]
+_SUMS = ["reviews", "rated", "rating_sum", "rating_sq", "likes"] + _HISTOGRAM
+
+# Date formats the sites print, tried after ISO 8601 (slashed dates are US-style, as on RT)
+_DATE_FORMATS = ("%b %d, %Y", "%B %d, %Y", "%d %b %Y", "%d %B %Y", "%m/%d/%Y", "%d/%m/%Y")
+
+
+@lru_cache(maxsize=4096)
+def review_day(review_date):
+    """The ISO day a review's date string falls on, or "" when it cannot be read."""
+    text = (review_date or "").strip()
+    try:
+        return date.fromisoformat(text[:10]).isoformat()
+    except ValueError:
+        pass
+    for date_format in _DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).date().isoformat()
+        except ValueError:
+            continue
+    return ""
+
+
+def _number(value, cast):
+    try:
+        return cast(value or 0)
+    except (TypeError, ValueError):
+        return cast(0)
+
+
+def summarize(rows):
+    """Fold review rows (Review records or dicts) into {(movie_id, source_site, day): sums}, in the order of _SUMS."""
+    groups = {}
+    for row in rows:
+        key = (row.get("movie_id"), row.get("source_site"), review_day(row.get("review_date")))
+        sums = groups.get(key)
+        if sums is None:
+            sums = groups[key] = [0] * len(_SUMS)
+        rating = _number(row.get("star_rating"), float)
+        sums[0] += 1
+        sums[4] += _number(row.get("likes_count"), int)
+        if rating > 0:
+            sums[1] += 1
+            sums[2] += rating
+            sums[3] += rating * rating
+            sums[4 + min(BUCKETS, max(1, math.ceil(rating * 2)))] += 1
+    return groups
+
+
+class AggregateStore:
+    """Running rating aggregates per (movie_id, source_site, day) in a local SQLite file.
+
+    Each group holds the review count, the number of rated reviews with the
+    sum and sum of squares of their ratings, a half-star histogram and the
+    likes total, so a mean, variance or distribution for any movie and
+    period is a read of its groups rather than a scan of its reviews.
+    ReviewWriter adds every batch it stores; `rebuild` recomputes it all
+    from the rows of record.
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        histogram = ",\n".join(f"                {column} INTEGER NOT NULL DEFAULT 0" for column in _HISTOGRAM)
+        self._conn.executescript(f"""
+            CREATE TABLE IF NOT EXISTS rating_aggregates (
+                movie_id TEXT NOT NULL,
+                source_site TEXT NOT NULL,
+                day TEXT NOT NULL,
+                reviews INTEGER NOT NULL DEFAULT 0,
+                rated INTEGER NOT NULL DEFAULT 0,
+                rating_sum REAL NOT NULL DEFAULT 0,
+                rating_sq REAL NOT NULL DEFAULT 0,
+                likes INTEGER NOT NULL DEFAULT 0,
+{histogram},
+                PRIMARY KEY (movie_id, source_site, day)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS movie_names (
+                movie_id TEXT PRIMARY KEY,
+                movie_name TEXT
+            );
+        """)
+        self._conn.commit()
+        columns = ", ".join(_SUMS)
+        self._upsert = f"""
+            INSERT INTO rating_aggregates (movie_id, source_site, day, {columns})
+            VALUES (?, ?, ?, {", ".join("?" for _ in _SUMS)})
+            ON CONFLICT(movie_id, source_site, day) DO UPDATE SET
+                {", ".join(f"{column} = {column} + excluded.{column}" for column in _SUMS)}
+        """
+
+    def add_many(self, rows):
+        """Fold a batch of stored review rows into the aggregates, in one transaction."""
+        groups = summarize(rows)
+        if not groups:
+            return
+        names = {row.get("movie_id"): row.get("movie_name") for row in rows}
+        with self._lock, self._conn:
+            self._conn.executemany(self._upsert, (key + tuple(sums) for key, sums in groups.items()))
+            self._conn.executemany("INSERT OR REPLACE INTO movie_names (movie_id, movie_name) VALUES (?, ?)",
+                                   names.items())
+
+    def rated_sums(self):
+        """(movie_id, source_site, day, rated, rating_sum, rating_sq) of every dated group with a rating, as tuples."""
+        with self._lock:
+            return self._conn.execute("""
+                SELECT movie_id, source_site, day, rated, rating_sum, rating_sq FROM rating_aggregates
+                WHERE rated > 0 AND day != ''
+            """).fetchall()
+
+    def groups(self, movie_id=None, source_site=None, since=None):
+        """Aggregate rows as dicts (with `mean` and `variance` of the ratings), oldest day first."""
+        where, params = [], []
+        for clause, value in (("movie_id = ?", movie_id), ("source_site = ?", source_site), ("day >= ?", since)):
+            if value is not None:
+                where.append(clause)
+                params.append(value)
+        query = f"SELECT movie_id, source_site, day, {', '.join(_SUMS)} FROM rating_aggregates"
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY movie_id, source_site, day", params).fetchall()
+        columns = ["movie_id", "source_site", "day"] + _SUMS
+        result = []
+        for values in rows:
+            group = dict(zip(columns, values))
+            rated = group["rated"]
+            group["mean"] = group["rating_sum"] / rated if rated else None
+            group["variance"] = max(group["rating_sq"] / rated - group["mean"] ** 2, 0.0) if rated else None
+            result.append(group)
+        return result
+
+    def movie_names(self):
+        with self._lock:
+            return dict(self._conn.execute("SELECT movie_id, movie_name FROM movie_names"))
+
+    def reset(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM rating_aggregates")
+            self._conn.execute("DELETE FROM movie_names")
+
+    def rebuild(self, batches):
+        """Replace the aggregates with those of `batches`, an iterable of row lists, in one transaction."""
+        totals = {}
+        names = {}
+        count = 0
+        for rows in batches:
+            for key, sums in summarize(rows).items():
+                current = totals.get(key)
+                totals[key] = sums if current is None else [a + b for a, b in zip(current, sums)]
+            names.update((row.get("movie_id"), row.get("movie_name")) for row in rows)
+            count += len(rows)
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM rating_aggregates")
+            self._conn.execute("DELETE FROM movie_names")
+            self._conn.executemany(self._upsert, (key + tuple(sums) for key, sums in totals.items()))
+            self._conn.executemany("INSERT INTO movie_names (movie_id, movie_name) VALUES (?, ?)", names.items())
+        return count, len(totals)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def spool_batches(directory):
+    """Rows of every sealed or committed spool segment, one list per segment.
+
+    A review spooled twice (say, re-scraped after a crash outran its
+    checkpoint) is counted once, as the uploader would store it once.
+    """
+    from dedup_index import review_key
+    from spool import COMMITTED, SEALED, read_segment, segments
+
+    seen = set()
+    for path in segments(directory, COMMITTED) + segments(directory, SEALED):
+        rows = []
+        for row in read_segment(path):
+            key = review_key(row)
+            if key not in seen:
+                seen.add(key)
+                rows.append(row)
+        yield rows
+
+
+def supabase_batches(page_size=1000, normalized=False):
+    """Rows of the `reviews` table, `page_size` at a time (joined to `movies` when normalized)."""
+    from supabase_utils import supabase
+
+    def pages(table, columns):
+        start = 0
+        while True:
+            rows = supabase.table(table).select(columns).range(start, start + page_size - 1).execute().data
+            yield rows
+            if len(rows) < page_size:
+                return
+            start += page_size
+
+    movies = {}
+    if normalized:
+        for rows in pages("movies", "movie_id,movie_name,source_site"):
+            movies.update((row["movie_id"], row) for row in rows)
+    columns = "movie_id,review_date,star_rating,likes_count"
+    if not normalized:
+        columns += ",movie_name,source_site"
+    for rows in pages("reviews", columns):
+        if normalized:
+            rows = [{**movies.get(row["movie_id"], {}), **row} for row in rows]
+        yield rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-movie, per-site, per-day rating aggregates.")
+    parser.add_argument("--path", default=DEFAULT_PATH, help="aggregates file")
+    commands = parser.add_subparsers(dest="command")
+    rebuild = commands.add_parser("rebuild", help="recompute every aggregate from scratch")
+    source = rebuild.add_mutually_exclusive_group(required=True)
+    source.add_argument("--spool", metavar="DIR", help="from spool segments")
+    source.add_argument("--supabase", action="store_true", help="from the reviews table")
+    rebuild.add_argument("--normalized", action="store_true", help="with --supabase: reviews reference a movies table")
+    show = commands.add_parser("show", help="print the aggregates of one movie or all of them")
+    show.add_argument("movie_id", nargs="?")
+    show.add_argument("--source-site")
+    args = parser.parse_args()
+
+    store = AggregateStore(args.path)
+    if args.command == "rebuild":
+        batches = spool_batches(args.spool) if args.spool else supabase_batches(normalized=args.normalized)
+        reviews, groups = store.rebuild(batches)
+        print(f"Rebuilt {groups} groups from {reviews} reviews")
+    else:
+        movie_id = getattr(args, "movie_id", None)
+        names = store.movie_names()
+        for group in store.groups(movie_id, getattr(args, "source_site", None)):
+            mean = f"{group['mean']:.2f}" if group["mean"] is not None else "  - "
+            histogram = " ".join(str(group[column]) for column in _HISTOGRAM)
+            print(f"{names.get(group['movie_id']) or group['movie_id']:30.30} {group['source_site']:15} "
+                  f"{group['day'] or '(no date)':10} {group['reviews']:5d} reviews  mean {mean}  "
+                  f"likes {group['likes']:6d}  [{histogram}]")
+    store.close()
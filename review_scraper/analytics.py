@@ -0,0 +1,259 @@
+import argparse
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.json as pa_json
+import pyarrow.parquet as pq
+
+# Columns kept for analysis; ids and names are dictionary-encoded, so a
+# million reviews of a few thousand movies cost a few bytes per row each
+_CATEGORY = pa.dictionary(pa.int32(), pa.string())
+SCHEMA = pa.schema([
+    ("movie_id", _CATEGORY),
+    ("movie_name", _CATEGORY),
+    ("movie_release_year", _CATEGORY),
+    ("source_site", _CATEGORY),
+    ("review_date", pa.string()),
+    ("star_rating", pa.float32()),
+    ("likes_count", pa.int64()),
+])
+_JSON_SCHEMA = pa.schema([
+    pa.field(field.name, pa.string() if field.type == _CATEGORY else field.type) for field in SCHEMA
+])
+# What dedup_index.review_key identifies a review by; only read to drop reviews spooled twice
+_KEY_FIELDS = ["movie_id", "reviewer_name", "review_text"]
+_SPOOL_SCHEMA = _JSON_SCHEMA.append(pa.field("reviewer_name", pa.string())).append(pa.field("review_text", pa.string()))
+
+
+def _finish(table):
+    """Cast a raw table to SCHEMA and return it as a DataFrame with parsed dates and NaN for unrated reviews."""
+    columns = []
+    for field in SCHEMA:
+        if field.name in table.column_names:
+            column = table[field.name]
+            if field.type == _CATEGORY and not pa.types.is_dictionary(column.type):
+                column = column.cast(pa.string()).dictionary_encode()
+            columns.append(column.cast(field.type))
+        else:
+            columns.append(pa.nulls(len(table), field.type))
+    reviews = pa.table(columns, schema=SCHEMA).to_pandas()
+    # Each site writes dates its own way, and they repeat a lot: parse every distinct string once
+    codes, uniques = pd.factorize(reviews["review_date"])
+    parsed = pd.to_datetime(pd.Series(uniques, dtype=object), format="mixed", errors="coerce").to_numpy()
+    reviews["review_date"] = np.where(codes >= 0, parsed[codes], np.datetime64("NaT"))
+    # The scrapers store 0.0 when a review has no rating
+    reviews["star_rating"] = reviews["star_rating"].where(reviews["star_rating"] > 0)
+    return reviews
+
+
+def from_spool(directory):
+    """Reviews from every spool segment in `directory` (sealed or committed), read straight into Arrow.
+
+    A review spooled twice (re-scraped after a crash outran its checkpoint)
+    is kept once, as `aggregates.py rebuild --spool` counts it.
+    """
+    paths = sorted(glob.glob(os.path.join(directory, "*.jsonl")) + glob.glob(os.path.join(directory, "*.committed")))
+    options = pa_json.ParseOptions(explicit_schema=_SPOOL_SCHEMA, unexpected_field_behavior="ignore")
+    tables = [pa_json.read_json(path, parse_options=options) for path in paths if os.path.getsize(path)]
+    table = pa.concat_tables(tables) if tables else _SPOOL_SCHEMA.empty_table()
+    repeated = pd.util.hash_pandas_object(table.select(_KEY_FIELDS).to_pandas(), index=False).duplicated()
+    return _finish(table.filter(pa.array(~repeated.to_numpy())))
+
+
+def from_supabase(page_size=1000, normalized=False):
+    """Reviews from Supabase, fetched `page_size` rows at a time and kept as column lists."""
+    from supabase_utils import supabase
+
+    def fetch(table, columns):
+        data = {column: [] for column in columns}
+        start = 0
+        while True:
+            rows = supabase.table(table).select(",".join(columns)).range(start, start + page_size - 1).execute().data
+            for column in columns:
+                data[column].extend(row.get(column) for row in rows)
+            if len(rows) < page_size:
+                return data
+            start += page_size
+
+    if not normalized:
+        return _finish(pa.table(fetch("reviews", _JSON_SCHEMA.names), schema=_JSON_SCHEMA))
+    movie_columns = ["movie_id", "movie_name", "movie_release_year", "source_site"]
+    reviews = pa.table(fetch("reviews", ["movie_id", "review_date", "star_rating", "likes_count"]))
+    movies = pa.table(fetch("movies", movie_columns))
+    return _finish(reviews.join(movies, "movie_id"))
+
+
+def load_parquet(path):
+    return _finish(pq.read_table(path))
+
+
+def export_parquet(reviews, path):
+    """Write a DataFrame from one of the loaders to Parquet (dates as timestamps)."""
+    pq.write_table(pa.Table.from_pandas(reviews, preserve_index=False), path, compression="zstd")
+
+
+def rating_series(reviews, freq="W"):
+    """Mean rating, its variance and the review count per movie, source and period.
+
+    `freq` is a pandas offset alias, e.g. "W" or "MS".
+    """
+    rated = reviews.dropna(subset=["review_date", "star_rating"])
+    rated = rated.assign(star_rating=rated["star_rating"].astype(np.float64))
+    series = (
+        rated.groupby(["movie_id", "source_site", pd.Grouper(key="review_date", freq=freq)], observed=True)
+        ["star_rating"].agg(["mean", "var", "count"])
+        .reset_index()
+        .rename(columns={"review_date": "period", "mean": "rating", "count": "reviews"})
+    )
+    # Population variance, so a single review contributes 0 rather than NaN
+    series["var"] = series["var"].fillna(0.0) * (series["reviews"] - 1) / series["reviews"]
+    return series.sort_values(["movie_id", "source_site", "period"], ignore_index=True)
+
+
+def aggregate_series(store, freq="W"):
+    """The rating_series frame, built from an AggregateStore's per-day groups instead of the reviews."""
+    groups = pd.DataFrame.from_records(
+        store.rated_sums(), columns=["movie_id", "source_site", "day", "rated", "rating_sum", "rating_sq"])
+    groups = groups.assign(
+        movie_id=groups["movie_id"].astype("category"),
+        source_site=groups["source_site"].astype("category"),
+        day=pd.to_datetime(groups["day"]),
+    )
+    sums = (
+        groups.groupby(["movie_id", "source_site", pd.Grouper(key="day", freq=freq)], observed=True)
+        [["rated", "rating_sum", "rating_sq"]].sum()
+        .reset_index()
+        .rename(columns={"day": "period", "rated": "reviews"})
+    )
+    sums["rating"] = sums["rating_sum"] / sums["reviews"]
+    sums["var"] = np.maximum(sums["rating_sq"] / sums["reviews"] - sums["rating"] ** 2, 0.0)
+    series = sums[["movie_id", "source_site", "period", "rating", "var", "reviews"]]
+    return series.sort_values(["movie_id", "source_site", "period"], ignore_index=True)
+
+
+def _group_bounds(series):
+    """Start index of each row's (movie, source) group and the group's length, for sorted `series`."""
+    keys = series["movie_id"].cat.codes.to_numpy().astype(np.int64) * (len(series["source_site"].cat.categories) + 1)
+    keys += series["source_site"].cat.codes.to_numpy()
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    lengths = np.diff(np.r_[starts, len(keys)])
+    return np.repeat(starts, lengths), np.repeat(lengths, lengths)
+
+
+def rolling_means(series, window=4):
+    """Add `rolling`, the review-weighted mean rating over each group's last `window` periods."""
+    starts, _ = _group_bounds(series)
+    index = np.arange(len(series))
+    weights = series["reviews"].to_numpy(dtype=np.float64)
+    totals = np.r_[0.0, np.cumsum(series["rating"].to_numpy() * weights)]
+    counts = np.r_[0.0, np.cumsum(weights)]
+    lower = np.maximum(starts, index + 1 - window)
+    series = series.copy()
+    series["rolling"] = (totals[index + 1] - totals[lower]) / (counts[index + 1] - counts[lower])
+    return series
+
+
+def change_scores(series, window=4, prior_var=0.25):
+    """Add `change`: how far the reviews of the next `window` periods sit from those of the previous `window`.
+
+    A Welch t statistic over the reviews in each pair of windows, computed
+    from prefix sums so every series is scored at once; NaN where either
+    window would cross the series' ends. `prior_var` is added to each
+    window's variance so a handful of identical ratings does not look
+    like a certainty.
+    """
+    starts, lengths = _group_bounds(series)
+    index = np.arange(len(series))
+    counts = series["reviews"].to_numpy(dtype=np.float64)
+    means = series["rating"].to_numpy(dtype=np.float64)
+    n = np.r_[0.0, np.cumsum(counts)]
+    sums = np.r_[0.0, np.cumsum(means * counts)]
+    squares = np.r_[0.0, np.cumsum((series["var"].to_numpy() + means ** 2) * counts)]
+    position = index - starts
+    valid = (position >= window) & (position + window <= lengths)
+    # Rows that cannot be scored still index safely; their result is masked below
+    t = np.where(valid, index, min(window, len(means)))
+    begin, end = np.maximum(t - window, 0), np.minimum(t + window, len(means))
+
+    def window_stats(lo, hi):
+        count = n[hi] - n[lo]
+        mean = (sums[hi] - sums[lo]) / count
+        return count, mean, (squares[hi] - squares[lo]) / count - mean ** 2 + prior_var
+
+    n_before, before, var_before = window_stats(begin, t)
+    n_after, after, var_after = window_stats(t, end)
+    score = np.abs(after - before) / np.sqrt(var_before / n_before + var_after / n_after)
+    series = series.copy()
+    series["change"] = np.where(valid, score, np.nan)
+    return series
+
+
+def source_divergence(series):
+    """Per movie and period: the spread of the sources' mean ratings (max - min) and how many sources rated it."""
+    wide = series.pivot_table(index=["movie_id", "period"], columns="source_site", values="rating", observed=True)
+    values = wide.to_numpy()
+    sources = np.sum(~np.isnan(values), axis=1)
+    with np.errstate(all="ignore"):
+        spread = np.nanmax(values, axis=1) - np.nanmin(values, axis=1)
+    divergence = pd.DataFrame({"spread": np.where(sources > 1, spread, np.nan), "sources": sources}, index=wide.index)
+    return divergence.reset_index()
+
+
+def drift_report(reviews, freq="W", window=4, top=20):
+    """One row per movie, most drifting first: biggest change score, where, and mean cross-source spread."""
+    names = reviews.drop_duplicates("movie_id").set_index("movie_id")["movie_name"]
+    return series_report(rating_series(reviews, freq), names, window, top)
+
+
+def series_report(series, names, window=4, top=20):
+    """drift_report over a prepared rating series; `names` maps movie_id to movie_name."""
+    series = change_scores(rolling_means(series, window), window)
+    divergence = source_divergence(series)
+    names = pd.Series(names, dtype=object)
+
+    ranked = series.dropna(subset=["change"]).sort_values("change", ascending=False)
+    peaks = ranked.drop_duplicates("movie_id").set_index("movie_id")[["source_site", "period", "change"]]
+    summary = series.groupby("movie_id", observed=True).agg(reviews=("reviews", "sum"), rating=("rating", "mean"))
+    summary["spread"] = divergence.groupby("movie_id", observed=True)["spread"].mean()
+    summary = summary.join(peaks.rename(columns={"source_site": "change_source", "period": "change_period"}))
+    summary.insert(0, "movie_name", names.reindex(summary.index).astype(str))
+    summary = summary.sort_values(["change", "spread"], ascending=False, na_position="last")
+    return summary.head(top) if top else summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rating drift across movies and review sites.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--spool", metavar="DIR", help="read spool segments")
+    source.add_argument("--parquet", metavar="FILE", help="read a Parquet export")
+    source.add_argument("--supabase", action="store_true", help="read the reviews table")
+    source.add_argument("--aggregates", metavar="FILE", help="read the per-day rating aggregates (no review scan)")
+    parser.add_argument("--normalized", action="store_true", help="with --supabase: reviews reference a movies table")
+    parser.add_argument("--export", metavar="FILE", help="also write the loaded reviews to Parquet")
+    parser.add_argument("--freq", default="W", help="period of the rating series (pandas offset alias)")
+    parser.add_argument("--window", type=int, default=4, help="periods per rolling / change-point window")
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.aggregates:
+        from aggregates import AggregateStore
+
+        store = AggregateStore(args.aggregates)
+        with pd.option_context("display.width", 200, "display.max_columns", 20):
+            print(series_report(aggregate_series(store, args.freq), store.movie_names(), args.window, args.top))
+        raise SystemExit
+    if args.spool:
+        reviews = from_spool(args.spool)
+    elif args.parquet:
+        reviews = load_parquet(args.parquet)
+    else:
+        reviews = from_supabase(normalized=args.normalized)
+    print(f"Loaded {len(reviews)} reviews of {reviews['movie_id'].nunique()} movies")
+    if args.export:
+        export_parquet(reviews, args.export)
+        print(f"Wrote {args.export}")
+    with pd.option_context("display.width", 200, "display.max_columns", 20):
+        print(drift_report(reviews, args.freq, args.window, args.top))
@@ -0,0 +1,585 @@
+"""Offline benchmark for the extractors and scrapers.
+
+Saved pages in fixtures/ are served from a local HTTP server, rows go to an
+in-memory sink instead of Supabase, and Chrome is replaced by a driver that
+counts every WebDriver command, so a run needs no network, database or
+browser:
+
+    python benchmark.py                      # print results
+    python benchmark.py --save-baseline      # record fixtures/baseline.json
+    python benchmark.py --compare            # exit 1 on a regression
+
+letterboxd.html is a recorded Letterboxd page (test.py output); the IMDb,
+Rotten Tomatoes and BookMyShow fixtures are synthetic pages laid out the way
+the extractors' XPaths expect, and rottentomatoes_api.json holds the same
+reviews for the Rotten Tomatoes reviews endpoint.
+"""
+import argparse
+import functools
+import importlib
+import inspect
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import lxml.html
+import requests
+
+from extractors import EXTRACTORS, get_extractor
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+DEFAULT_BASELINE = os.path.join(FIXTURE_DIR, "baseline.json")
+
+# Path of the n-th benchmark movie on each site's fixture server
+MOVIE_PATHS = {
+    "letterboxd": "/film/movie-{n}/reviews/by/activity/",
+    "imdb": "/title/tt{n:07d}/reviews/",
+    "rottentomatoes": "/m/movie_{n}/reviews",
+    "bookmyshow": "/movies/chennai/movie-{n}/ET{n:08d}/user-reviews",
+}
+
+# Sites whose scraper has more than one way in; each mode is benchmarked
+SCRAPER_MODES = {
+    "letterboxd": ["http", "browser", "pipeline"],
+    "imdb": ["browser", "pipeline"],
+    "rottentomatoes": ["api", "browser", "pipeline"],
+    "bookmyshow": ["network", "dom"],
+}
+
+# Metrics checked by --compare. Scraper runs take milliseconds against local
+# fixtures, too short for stable timings, so they are compared on the
+# deterministic counts: reviews written, round-trips and bytes pulled.
+_COMPARED = {
+    "extract": ("reviews_per_sec", "p50_ms", "p90_ms"),
+    "scrape": ("reviews", "http_requests", "webdriver_calls_per_page", "page_source_bytes"),
+}
+_HIGHER_IS_BETTER = ("reviews", "reviews_per_sec")
+
+
+def load_fixture(site):
+    with open(os.path.join(FIXTURE_DIR, f"{site}.html"), encoding="utf-8") as f:
+        return f.read()
+
+
+def percentiles(seconds):
+    if not seconds:
+        return {}
+    ordered = sorted(seconds)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * q))] * 1000, 3)
+
+    return {"p50_ms": pick(0.5), "p90_ms": pick(0.9), "p99_ms": pick(0.99)}
+
+
+class MemorySink:
+    """In-memory stand-in for supabase_utils.insert_many."""
+
+    def __init__(self):
+        self.rows = []
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def insert_many(self, rows: list):
+        with self._lock:
+            self.calls += 1
+            self.rows.extend(rows)
+
+
+class FixtureServer:
+    """Serves one site's fixture for every movie URL, like the live site would.
+
+    Paginated URLs (.../page/N/) up to `pages` get the same page with the
+    reviewer names tagged by page number, so every page holds new reviews;
+    later pages and anything else unknown answer 404. /s/full-text/
+    requests get a short two-paragraph review, like Letterboxd's. If the
+    site has a <site>_api.json fixture, /napi/ requests page through its
+    reviews with a cursor, `page_size` at a time.
+    """
+
+    def __init__(self, site, pages=5, page_size=10, host="127.0.0.1", port=0):
+        self.html = load_fixture(site)
+        self.api = None
+        api_path = os.path.join(FIXTURE_DIR, f"{site}_api.json")
+        if os.path.exists(api_path):
+            with open(api_path, encoding="utf-8") as f:
+                self.api = json.load(f)
+        self.pages = pages
+        self.page_size = page_size
+        self.requests = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with server._lock:
+                    server.requests += 1
+                status, body, content_type = server.page(self.path)
+                data = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.url = f"http://{host}:{self.server.server_address[1]}"
+
+    def page(self, path):
+        if path.startswith("/napi/") and self.api is not None:
+            return self.api_page(path)
+        if path.startswith("/s/full-text/"):
+            viewing = path.rstrip("/").rsplit(":", 1)[-1]
+            return 200, f"<p>Full text of review {viewing}.</p><p>Second paragraph.</p>", "text/html; charset=utf-8"
+        if path.startswith("/s/") or path.startswith("/napi/"):
+            return 404, "<html><body>Not found</body></html>", "text/html"
+        match = re.search(r"/page/(\d+)/?$", path)
+        number = int(match.group(1)) if match else 1
+        if number > self.pages:
+            return 404, "<html><body>Not found</body></html>", "text/html"
+        html = self.html
+        if number > 1:
+            html = re.sub(r'(class="displayname">)', rf"\1p{number} ", html)
+        # Point "Next" at the following page of this movie, and drop it on the last one
+        base = re.sub(r"page/\d+/?$", "", path)
+        next_link = f'<a class="next" href="{base}page/{number + 1}/">Next</a>' if number < self.pages else ""
+        return 200, re.sub(r'<a class="next"[^>]*>[^<]*</a>', next_link, html), "text/html; charset=utf-8"
+
+    def api_page(self, path):
+        query = parse_qs(urlparse(path).query)
+        start = int(query.get("after", ["0"])[0])
+        count = int(query.get("pageCount", [self.page_size])[0])
+        reviews = self.api["reviews"][start:start + count]
+        end = start + len(reviews)
+        body = {
+            "reviews": reviews,
+            "pageInfo": {"hasNextPage": end < len(self.api["reviews"]), "endCursor": str(end)},
+        }
+        return 200, json.dumps(body), "application/json"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+def _css_to_xpath(selector):
+    """The small CSS subset the scrapers use: tag, #id and .class, joined by spaces."""
+    steps = []
+    for part in selector.split():
+        match = re.fullmatch(r"([\w-]*)((?:[#.][\w-]+)*)", part)
+        if not match:
+            raise ValueError(f"Unsupported selector {selector!r}")
+        step = match.group(1) or "*"
+        for kind, name in re.findall(r"([#.])([\w-]+)", match.group(2)):
+            if kind == "#":
+                step += f"[@id='{name}']"
+            else:
+                step += f"[contains(concat(' ', normalize-space(@class), ' '), ' {name} ')]"
+        steps.append(step)
+    return "//" + "//".join(steps)
+
+
+class FakeElement:
+    def __init__(self, driver, node):
+        self.driver = driver
+        self.node = node
+
+    @property
+    def text(self):
+        self.driver.calls["get_text"] += 1
+        return " ".join(self.node.text_content().split())
+
+    def get_attribute(self, name):
+        self.driver.calls["get_attribute"] += 1
+        return self.node.get(name)
+
+    def is_displayed(self):
+        self.driver.calls["is_displayed"] += 1
+        return True
+
+    def is_enabled(self):
+        self.driver.calls["is_enabled"] += 1
+        return True
+
+    def click(self):
+        self.driver.calls["click"] += 1
+
+    def send_keys(self, *keys):
+        self.driver.calls["send_keys"] += 1
+
+
+class CountingDriver:
+    """WebDriver stand-in that loads pages over HTTP and counts every command.
+
+    No JavaScript runs: in-page waits return at once and clicks change
+    nothing, so what it measures is how many round-trips a scraper makes
+    per page and how much page source it pulls, not how the site reacts.
+    With `scroll_feed` set, each scroll fetches the next page of that JSON
+    endpoint the way an infinite list would, and logs the response in the
+    performance log for get_log / Network.getResponseBody. DevTools
+    commands are also counted by method in `cdp_calls`, per tab in
+    `tab_cdp_calls`.
+    """
+
+    def __init__(self, scroll_feed=None, feed_page_size=10):
+        self.scroll_feed = scroll_feed
+        self.feed_page_size = feed_page_size
+        self._feed_cursor = "0"
+        self._performance_log = []
+        self._bodies = {}
+        self.calls = Counter()
+        self.cdp_calls = Counter()
+        self.tab_cdp_calls = [Counter()]
+        self.switch_to = _SwitchTo(self)
+        self.current_window_handle = "tab-0"
+        self.bytes_read = 0
+        self.page_times = []
+        self.current_url = None
+        self._session = requests.Session()
+        self._tree = lxml.html.fromstring("<html></html>")
+        self._html = ""
+        self._loaded = None
+
+    def get(self, url):
+        self.calls["get"] += 1
+        now = time.perf_counter()
+        if self._loaded is not None:
+            self.page_times.append(now - self._loaded)
+        self._loaded = now
+        self.current_url = url
+        self._feed_cursor = "0"
+        self._html = self._session.get(url, timeout=10).text
+        self._tree = lxml.html.fromstring(self._html)
+
+    @property
+    def page_source(self):
+        self.calls["page_source"] += 1
+        self.bytes_read += len(self._html)
+        return self._html
+
+    def _find(self, by, value):
+        from selenium.webdriver.common.by import By
+        if by == By.XPATH:
+            xpath = value
+        elif by == By.TAG_NAME:
+            xpath = f"//{value}"
+        elif by == By.CSS_SELECTOR:
+            xpath = _css_to_xpath(value)
+        else:
+            raise ValueError(f"Unsupported locator {by}")
+        return [FakeElement(self, node) for node in self._tree.xpath(xpath)]
+
+    def find_element(self, by, value):
+        from selenium.common.exceptions import NoSuchElementException
+        self.calls["find_element"] += 1
+        found = self._find(by, value)
+        if not found:
+            raise NoSuchElementException(value)
+        return found[0]
+
+    def find_elements(self, by, value):
+        self.calls["find_elements"] += 1
+        return self._find(by, value)
+
+    def execute_script(self, script, *args):
+        self.calls["execute_script"] += 1
+        if self.scroll_feed and "scrollTo" in script and self._feed_cursor is not None:
+            self._load_feed_page()
+        return 0
+
+    def _load_feed_page(self):
+        url = f"{self.scroll_feed}?after={self._feed_cursor}&pageCount={self.feed_page_size}"
+        body = self._session.get(url, timeout=10).text
+        page_info = json.loads(body)["pageInfo"]
+        self._feed_cursor = page_info["endCursor"] if page_info["hasNextPage"] else None
+        request_id = str(len(self._bodies) + 1)
+        self._bodies[request_id] = body
+        for method, params in (
+            ("Network.responseReceived", {"requestId": request_id,
+                                          "response": {"url": url, "mimeType": "application/json"}}),
+            ("Network.loadingFinished", {"requestId": request_id}),
+        ):
+            self._performance_log.append({"message": json.dumps({"message": {"method": method, "params": params}})})
+
+    def get_log(self, log_type):
+        self.calls["get_log"] += 1
+        entries, self._performance_log = self._performance_log, []
+        return entries
+
+    def execute_cdp_cmd(self, command, params):
+        self.calls["execute_cdp_cmd"] += 1
+        self.cdp_calls[command] += 1
+        self.tab_cdp_calls[-1][command] += 1
+        if command == "Network.getResponseBody":
+            return {"body": self._bodies.pop(params["requestId"]), "base64Encoded": False}
+        if command == "Performance.getMetrics":
+            return {"metrics": [{"name": "Nodes", "value": sum(1 for _ in self._tree.iter())}]}
+        return {}
+
+    def execute_async_script(self, script, *args):
+        from waits import _COUNT_GROWTH_JS
+        self.calls["execute_async_script"] += 1
+        if script == _COUNT_GROWTH_JS:
+            return len(self._tree.xpath(args[0]))
+        return True
+
+    def get_cookies(self):
+        self.calls["get_cookies"] += 1
+        return []
+
+    def set_script_timeout(self, seconds):
+        self.calls["set_script_timeout"] += 1
+
+    def close(self):
+        self.calls["close"] += 1
+
+    def quit(self):
+        self.calls["quit"] += 1
+        if self._loaded is not None:
+            self.page_times.append(time.perf_counter() - self._loaded)
+            self._loaded = None
+        self._session.close()
+
+
+class _SwitchTo:
+    """driver.switch_to for CountingDriver: every new tab starts blank, with no DevTools state."""
+
+    def __init__(self, driver):
+        self._driver = driver
+
+    def new_window(self, kind="tab"):
+        driver = self._driver
+        driver.calls["new_window"] += 1
+        driver.tab_cdp_calls.append(Counter())
+        driver.current_window_handle = f"tab-{len(driver.tab_cdp_calls) - 1}"
+
+    def window(self, handle):
+        self._driver.calls["switch_to_window"] += 1
+        self._driver.current_window_handle = handle
+
+
+def _unthrottle(url):
+    """Lift the shared rate limiter's limits; the benchmark measures the scraper, not politeness."""
+    from rate_limiter import domain_of, limiter
+    for domain in list(limiter.rates) + [domain_of(url)]:
+        limiter.rates[domain] = 1e6
+    limiter.max_rate = 1e6
+    limiter._buckets.clear()
+
+
+def bench_extractors(rounds=50):
+    """Parse and extract each fixture `rounds` times."""
+    results = {}
+    for site in EXTRACTORS:
+        html = load_fixture(site)
+        extractor = get_extractor(site)
+        timings = []
+        reviews = 0
+        for _ in range(rounds):
+            start_time = time.perf_counter()
+            _, found = extractor.extract(html)
+            timings.append(time.perf_counter() - start_time)
+            reviews += len(found)
+        results[site] = {
+            "pages": rounds,
+            "reviews": reviews,
+            "reviews_per_sec": round(reviews / sum(timings), 1),
+            **percentiles(timings),
+        }
+    return results
+
+
+def bench_scraper(site, movies=3, pages=5, mode="browser"):
+    """Run the site's real scrape function against its fixture server."""
+    from checkpoints import CheckpointStore
+    from driver_pool import CookieJar, pool
+    from review_writer import ReviewWriter
+    from runner import SITES
+
+    _, module_name, function_name = SITES[site]
+    module = importlib.import_module(module_name)
+    scrape = getattr(module, function_name)
+    sink = MemorySink()
+    writer = ReviewWriter(insert_fn=sink.insert_many, dedup=False, aggregates=False)
+    workdir = tempfile.mkdtemp(prefix="cinedrift-bench-")
+    checkpoints = CheckpointStore(os.path.join(workdir, "checkpoints.sqlite3"))
+    pool.profile_root = os.path.join(workdir, "profiles")
+    pool.cookies = CookieJar(os.path.join(workdir, "cookies.json"))
+    kwargs = {"mode": mode} if "mode" in inspect.signature(scrape).parameters else {}
+    if mode == "pipeline":
+        from pipeline import scrape_pipeline
+        scrape, kwargs = functools.partial(scrape_pipeline, site), {}
+
+    with FixtureServer(site, pages=pages) as server:
+        _unthrottle(server.url)
+        # An infinite list whose scrolls fetch the API fixture, for scrapers that read those responses
+        scroll_feed = server.url + "/napi/reviews" if mode == "network" else None
+        driver = CountingDriver(scroll_feed=scroll_feed)
+        movie_urls = [server.url + MOVIE_PATHS[site].format(n=n) for n in range(1, movies + 1)]
+        original_create_driver = module.create_driver
+        module.create_driver = lambda **_: driver
+        try:
+            start_time = time.perf_counter()
+            scrape(movie_urls, writer=writer, checkpoints=checkpoints, **kwargs)
+            writer.flush()
+            elapsed = time.perf_counter() - start_time
+        finally:
+            # Quit the pooled driver so the next run starts from a fresh one
+            pool.close()
+            module.create_driver = original_create_driver
+            writer.close()
+            checkpoints.close()
+        requests_served = server.requests
+
+    page_loads = driver.calls["get"] or requests_served
+    commands = sum(driver.calls.values())
+    return {
+        "movies": movies,
+        "reviews": len(sink.rows),
+        "elapsed_sec": round(elapsed, 3),
+        "reviews_per_sec": round(len(sink.rows) / elapsed, 1) if elapsed else 0.0,
+        "http_requests": requests_served,
+        "insert_calls": sink.calls,
+        "webdriver_calls": commands,
+        "webdriver_calls_per_page": round(commands / page_loads, 1) if page_loads else 0.0,
+        "webdriver_commands": dict(sorted(driver.calls.items())),
+        "page_source_bytes": driver.bytes_read,
+        **percentiles(driver.page_times),
+    }
+
+
+def bench_recycle(recycles=3):
+    """Recycle a lean pooled driver's tab `recycles` times and count the DevTools setup each tab got."""
+    from browser import block_requests
+    from driver_pool import CookieJar, DriverPool
+
+    driver = CountingDriver()
+
+    def create_driver(user_data_dir=None, lean=False):
+        # What browser.create_driver does to a lean Chrome, minus starting it
+        if lean:
+            block_requests(driver)
+        return driver
+
+    workdir = tempfile.mkdtemp(prefix="cinedrift-bench-")
+    pool = DriverPool(profile_root=os.path.join(workdir, "profiles"),
+                      cookies=CookieJar(os.path.join(workdir, "cookies.json")), max_tabs=recycles + 1)
+    try:
+        current = pool.acquire(create_driver, lean=True)
+        for _ in range(recycles):
+            current = pool.recycle(current)
+    finally:
+        pool.close()
+    return {
+        "tabs": len(driver.tab_cdp_calls),
+        "blocking_tabs": sum(1 for calls in driver.tab_cdp_calls if calls["Network.setBlockedURLs"]),
+        "cdp_calls": dict(sorted(driver.cdp_calls.items())),
+    }
+
+
+def run_benchmarks(rounds=50, movies=3, pages=5, sites=None):
+    sites = sites or list(EXTRACTORS)
+    results = {"extract": {site: stats for site, stats in bench_extractors(rounds).items() if site in sites}}
+    scrapers = {}
+    for site in sites:
+        for mode in SCRAPER_MODES.get(site, ["browser"]):
+            name = f"{site}:{mode}" if site in SCRAPER_MODES else site
+            try:
+                scrapers[name] = bench_scraper(site, movies=movies, pages=pages, mode=mode)
+            except ImportError as e:
+                print(f"Skipping {name} scraper benchmark: {e}")
+    results["scrape"] = scrapers
+    results["recycle"] = bench_recycle()
+    return results
+
+
+def compare(results, baseline, tolerance=0.2):
+    """Regressions beyond `tolerance` (a fraction) against `baseline`, as printable lines."""
+    regressions = []
+    for group, entries in baseline.items():
+        for name, old in entries.items():
+            new = results.get(group, {}).get(name)
+            if new is None:
+                continue
+            for metric in _COMPARED.get(group, ()):
+                if metric not in old or metric not in new or not old[metric]:
+                    continue
+                change = (new[metric] - old[metric]) / old[metric]
+                worse = -change if metric in _HIGHER_IS_BETTER else change
+                if worse > tolerance:
+                    regressions.append(f"{group}/{name} {metric}: {old[metric]} -> {new[metric]} "
+                                       f"({change:+.0%})")
+    return regressions
+
+
+def print_results(results):
+    for site, stats in results["extract"].items():
+        print(f"extract {site:15} {stats['reviews_per_sec']:>10.0f} reviews/s  "
+              f"p50 {stats['p50_ms']:.2f}ms  p90 {stats['p90_ms']:.2f}ms  p99 {stats['p99_ms']:.2f}ms")
+    for name, stats in results["scrape"].items():
+        latency = f"  page p50 {stats['p50_ms']:.1f}ms p90 {stats['p90_ms']:.1f}ms" if "p50_ms" in stats else ""
+        print(f"scrape  {name:15} {stats['reviews']:>5} reviews in {stats['elapsed_sec']:.2f}s "
+              f"({stats['reviews_per_sec']:.0f}/s), {stats['webdriver_calls']} WebDriver calls "
+              f"({stats['webdriver_calls_per_page']}/page), {stats['http_requests']} requests{latency}")
+        if stats["webdriver_commands"]:
+            print("        " + ", ".join(f"{command} {count}" for command, count in stats["webdriver_commands"].items()))
+    recycle = results["recycle"]
+    print(f"recycle lean tabs {recycle['tabs']}, blocking requests {recycle['blocking_tabs']}: "
+          + ", ".join(f"{command} {count}" for command, count in recycle["cdp_calls"].items()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the scrapers against saved pages.")
+    parser.add_argument("--site", action="append", choices=sorted(EXTRACTORS), help="only these sites")
+    parser.add_argument("--rounds", type=int, default=50, help="extractor runs per fixture")
+    parser.add_argument("--movies", type=int, default=3, help="movies per scraper run")
+    parser.add_argument("--pages", type=int, default=5, help="Letterboxd pages per movie")
+    parser.add_argument("--save-baseline", nargs="?", const=DEFAULT_BASELINE, metavar="PATH")
+    parser.add_argument("--compare", nargs="?", const=DEFAULT_BASELINE, metavar="PATH")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression, as a fraction")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    results = run_benchmarks(rounds=args.rounds, movies=args.movies, pages=args.pages, sites=args.site)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_results(results)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+        print(f"Baseline written to {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if results["recycle"]["blocking_tabs"] < results["recycle"]["tabs"]:
+            regressions.append(f"recycle: only {results['recycle']['blocking_tabs']} of "
+                               f"{results['recycle']['tabs']} lean tabs block requests")
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.compare}")
@@ -0,0 +1,208 @@
+import base64
+import json
+import os
+import re
+import shutil
+import threading
+import time
+
+import undetected_chromedriver as uc
+from selenium.common.exceptions import SessionNotCreatedException
+
+from metrics import registry as metrics
+from waits import AdaptiveTimeout, stats as wait_stats
+
+# Requests a lean browser never makes: the scrapers only read the review
+# markup, so images, fonts, media and ad/tracking scripts are dead weight.
+BLOCKED_RESOURCES = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.avif", "*.svg", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    "*.mp4", "*.webm", "*.m3u8", "*.mp3",
+]
+BLOCKED_HOSTS = [
+    "*doubleclick.net*", "*googlesyndication.com*", "*google-analytics.com*", "*googletagmanager.com*",
+    "*adservice.google.*", "*eyeota.net*", "*pubmatic.com*", "*criteo.*", "*casalemedia.com*",
+    "*openx.net*", "*3lift.com*", "*crwdcntrl.net*", "*cootlogix.com*", "*everesttech.net*",
+    "*fastclick.net*", "*intergient.com*", "*playwire.com*", "*ad-delivery.net*", "*amazon-adsystem.com*",
+    "*adnxs.com*", "*rubiconproject.com*", "*scorecardresearch.com*", "*quantserve.com*", "*taboola.com*",
+    "*outbrain.com*", "*moatads.com*", "*hotjar.com*", "*facebook.net*", "*youtube.com/embed*",
+]
+
+# Patched chromedriver shared by every Chrome this machine starts
+DRIVER_CACHE = os.getenv("CINEDRIFT_CHROMEDRIVER",
+                         os.path.join(os.path.expanduser("~"), ".cache", "cinedrift", "undetected_chromedriver"))
+_binary_lock = threading.Lock()
+
+# Load time, transfer size and JS heap of the current page
+_PAGE_PROFILE_JS = """
+const nav = performance.getEntriesByType('navigation')[0];
+const resources = performance.getEntriesByType('resource');
+return {
+    load_ms: nav ? nav.loadEventEnd - nav.startTime : null,
+    dom_ready_ms: nav ? nav.domContentLoadedEventEnd - nav.startTime : null,
+    resources: resources.length,
+    transfer_bytes: resources.reduce((sum, r) => sum + (r.transferSize || 0), nav ? nav.transferSize : 0),
+};
+"""
+
+
+def prepare_driver_binary(refresh=False):
+    """Download and patch chromedriver once and keep it at DRIVER_CACHE; returns its path.
+
+    Every create_driver starts Chrome with the cached binary, so neither
+    a scrape nor a worker process downloads and patches its own. Call with
+    refresh=True when Chrome has updated past the cached driver.
+    """
+    with _binary_lock:
+        if refresh or not os.path.exists(DRIVER_CACHE):
+            patcher = uc.Patcher()
+            patcher.auto()
+            os.makedirs(os.path.dirname(DRIVER_CACHE), exist_ok=True)
+            temp_path = f"{DRIVER_CACHE}.{os.getpid()}.tmp"
+            shutil.copy2(patcher.executable_path, temp_path)
+            os.replace(temp_path, DRIVER_CACHE)
+    return DRIVER_CACHE
+
+
+def block_requests(driver, patterns=None):
+    """Make Chrome drop requests matching `patterns` (default: BLOCKED_RESOURCES + BLOCKED_HOSTS)."""
+    driver.execute_cdp_cmd("Network.enable", {})
+    driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": patterns or BLOCKED_RESOURCES + BLOCKED_HOSTS})
+
+
+def _chrome_options(lean=False, network_log=False):
+    options = uc.ChromeOptions()
+    options.add_argument("--disable-gpu")
+    if network_log:
+        options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+    if lean:
+        options.add_argument("--blink-settings=imagesEnabled=false")
+        options.add_argument("--mute-audio")
+    return options
+
+
+def create_driver(user_data_dir=None, lean=False, network_log=False):
+    """Start Chrome with the cached patched chromedriver.
+
+    lean=True runs it headless and blocks images, fonts, media and ad/tracker
+    hosts. network_log=True records DevTools network events, which
+    driver.get_log("performance") returns (see ResponseCapture). The cached
+    binary lets any number of processes start Chrome at once.
+    """
+    try:
+        driver = uc.Chrome(options=_chrome_options(lean, network_log), user_data_dir=user_data_dir,
+                           headless=lean, driver_executable_path=prepare_driver_binary())
+    except SessionNotCreatedException:
+        # Chrome updated since the driver was cached: patch a matching one and retry once
+        driver = uc.Chrome(options=_chrome_options(lean, network_log), user_data_dir=user_data_dir,
+                           headless=lean, driver_executable_path=prepare_driver_binary(refresh=True))
+    if lean:
+        block_requests(driver)
+    # The event-driven waits in waits.py enforce their own, shorter timeouts
+    driver.set_script_timeout(120)
+    return metrics.instrument_driver(driver)
+
+
+class ResponseCapture:
+    """Collects response bodies the page fetches, from Chrome's performance log.
+
+    Needs a driver started with network_log=True. Responses whose URL matches
+    `url_pattern` and whose type is JSON are remembered when their headers
+    arrive and read with Network.getResponseBody once they finish loading.
+    """
+
+    def __init__(self, driver, url_pattern):
+        self.driver = driver
+        self.url_pattern = re.compile(url_pattern)
+        self._pending = {}
+
+    def clear(self):
+        """Forget everything logged so far, e.g. before loading a new page."""
+        self.driver.get_log("performance")
+        self._pending.clear()
+
+    def poll(self):
+        """Parsed JSON bodies of matching responses finished since the last call."""
+        bodies = []
+        for entry in self.driver.get_log("performance"):
+            message = json.loads(entry["message"])["message"]
+            method = message.get("method")
+            params = message.get("params", {})
+            if method == "Network.responseReceived":
+                response = params.get("response", {})
+                if "json" in response.get("mimeType", "") and self.url_pattern.search(response.get("url", "")):
+                    self._pending[params["requestId"]] = response["url"]
+            elif method == "Network.loadingFinished" and params.get("requestId") in self._pending:
+                self._pending.pop(params["requestId"])
+                try:
+                    result = self.driver.execute_cdp_cmd("Network.getResponseBody", {"requestId": params["requestId"]})
+                    body = base64.b64decode(result["body"]) if result.get("base64Encoded") else result["body"]
+                    bodies.append(json.loads(body))
+                except Exception:
+                    # Evicted from Chrome's buffer, or not JSON after all
+                    continue
+        return bodies
+
+    def wait(self, timeout, interval=0.1):
+        """Poll until at least one matching response arrives or `timeout` passes."""
+        limit = timeout.value if isinstance(timeout, AdaptiveTimeout) else timeout
+        start_time = time.monotonic()
+        with wait_stats.timed("response"), metrics.stage("wait"):
+            while True:
+                bodies = self.poll()
+                elapsed = time.monotonic() - start_time
+                if bodies:
+                    if isinstance(timeout, AdaptiveTimeout):
+                        timeout.observe(elapsed)
+                    return bodies
+                if elapsed >= limit:
+                    wait_stats.timeouts["response"] += 1
+                    return []
+                time.sleep(interval)
+
+
+def page_profile(driver):
+    """Load time, bytes transferred and renderer JS heap of the page currently loaded."""
+    profile = driver.execute_script(_PAGE_PROFILE_JS)
+    driver.execute_cdp_cmd("Performance.enable", {})
+    page_metrics = {m["name"]: m["value"] for m in driver.execute_cdp_cmd("Performance.getMetrics", {})["metrics"]}
+    profile["js_heap_bytes"] = page_metrics.get("JSHeapUsedSize", 0)
+    profile["dom_nodes"] = page_metrics.get("Nodes", 0)
+    return profile
+
+
+def compare_profiles(movie_urls):
+    """Load each URL in a regular and a lean browser; returns {site: {"regular": [...], "lean": [...]}}."""
+    from runner import site_for_url
+    from waits import wait_for_network_idle
+
+    results = {}
+    for lean in (False, True):
+        driver = create_driver(lean=lean)
+        try:
+            for movie_url in movie_urls:
+                driver.get(movie_url)
+                wait_for_network_idle(driver, timeout=30, label="profile")
+                site = results.setdefault(site_for_url(movie_url), {"regular": [], "lean": []})
+                site["lean" if lean else "regular"].append(page_profile(driver))
+        finally:
+            driver.quit()
+    return results
+
+
+if __name__ == "__main__":
+    # python browser.py URL [URL ...]: what the lean profile saves on each site
+    import sys
+
+    def mean(profiles, key):
+        values = [p[key] for p in profiles if p.get(key) is not None]
+        return sum(values) / len(values) if values else 0.0
+
+    for site, runs in compare_profiles(sys.argv[1:]).items():
+        regular, lean = runs["regular"], runs["lean"]
+        print(f"{site} ({len(regular)} pages)")
+        for key, unit, scale in (("load_ms", "ms", 1), ("transfer_bytes", "MB", 1e6),
+                                 ("js_heap_bytes", "MB", 1e6), ("resources", "", 1)):
+            before, after = mean(regular, key) / scale, mean(lean, key) / scale
+            saved = (before - after) / before * 100 if before else 0.0
+            print(f"  {key:15} {before:10.1f}{unit} -> {after:10.1f}{unit}  ({saved:.0f}% saved)")
@@ -0,0 +1,123 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_PATH = os.getenv("CINEDRIFT_CHECKPOINTS", "checkpoints.sqlite3")
+
+
+def review_hash(reviewer_name, review_text):
+    return hashlib.md5((reviewer_name + review_text).encode('utf-8')).hexdigest()
+
+
+class CheckpointStore:
+    """Per-movie crawl progress in a local SQLite file, keyed by get_movie_id.
+
+    A checkpoint holds the last finished page (or scroll offset), the number of
+    reviews written so far, the hashes of those reviews and whether the movie
+    is finished. Save a checkpoint only after the writer has flushed the rows
+    it covers, so a crash never skips reviews that were not stored.
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                movie_id TEXT PRIMARY KEY,
+                movie_url TEXT,
+                page INTEGER NOT NULL DEFAULT 0,
+                scroll_offset INTEGER NOT NULL DEFAULT 0,
+                review_count INTEGER NOT NULL DEFAULT 0,
+                done INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS seen_reviews (
+                movie_id TEXT NOT NULL,
+                review_hash TEXT NOT NULL,
+                PRIMARY KEY (movie_id, review_hash)
+            ) WITHOUT ROWID;
+        """)
+        self._conn.commit()
+
+    def load(self, movie_id):
+        """Return the checkpoint for `movie_id`; a fresh one if the movie was never started."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT page, scroll_offset, review_count, done FROM checkpoints WHERE movie_id = ?",
+                (movie_id,),
+            ).fetchone()
+            seen = {h for (h,) in self._conn.execute(
+                "SELECT review_hash FROM seen_reviews WHERE movie_id = ?", (movie_id,)
+            )}
+        page, scroll_offset, review_count, done = row or (0, 0, 0, 0)
+        return {
+            "page": page,
+            "scroll_offset": scroll_offset,
+            "review_count": review_count,
+            "done": bool(done),
+            "seen": seen,
+        }
+
+    def is_done(self, movie_id):
+        with self._lock:
+            row = self._conn.execute("SELECT done FROM checkpoints WHERE movie_id = ?", (movie_id,)).fetchone()
+        return bool(row and row[0])
+
+    def save(self, movie_id, movie_url=None, page=None, scroll_offset=None, review_count=0,
+             new_hashes=(), done=False):
+        """Record progress for `movie_id`. Only the hashes added since the last save need passing."""
+        with self._lock, self._conn:
+            self._conn.execute("""
+                INSERT INTO checkpoints (movie_id, movie_url, page, scroll_offset, review_count, done, updated_at)
+                VALUES (?, ?, COALESCE(?, 0), COALESCE(?, 0), ?, ?, ?)
+                ON CONFLICT(movie_id) DO UPDATE SET
+                    movie_url = COALESCE(excluded.movie_url, movie_url),
+                    page = COALESCE(?, page),
+                    scroll_offset = COALESCE(?, scroll_offset),
+                    review_count = excluded.review_count,
+                    done = excluded.done,
+                    updated_at = excluded.updated_at
+            """, (movie_id, movie_url, page, scroll_offset, review_count, int(done), time.time(),
+                  page, scroll_offset))
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO seen_reviews (movie_id, review_hash) VALUES (?, ?)",
+                ((movie_id, h) for h in new_hashes),
+            )
+
+    def mark_done(self, movie_id, review_count):
+        self.save(movie_id, review_count=review_count, done=True)
+
+    def reset(self, movie_id=None):
+        """Forget one movie's progress, or everything when `movie_id` is None."""
+        with self._lock, self._conn:
+            if movie_id is None:
+                self._conn.execute("DELETE FROM checkpoints")
+                self._conn.execute("DELETE FROM seen_reviews")
+            else:
+                self._conn.execute("DELETE FROM checkpoints WHERE movie_id = ?", (movie_id,))
+                self._conn.execute("DELETE FROM seen_reviews WHERE movie_id = ?", (movie_id,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+if __name__ == "__main__":
+    import sys
+
+    store = CheckpointStore()
+    if sys.argv[1:2] == ["reset"]:
+        store.reset(sys.argv[2] if len(sys.argv) > 2 else None)
+        print("Checkpoints cleared")
+    else:
+        rows = store._conn.execute(
+            "SELECT movie_id, movie_url, page, scroll_offset, review_count, done FROM checkpoints ORDER BY updated_at"
+        ).fetchall()
+        for movie_id, movie_url, page, scroll_offset, review_count, done in rows:
+            status = "done" if done else f"page {page}, offset {scroll_offset}"
+            print(f"{movie_id} {review_count:4d} reviews  {status}  {movie_url or ''}")
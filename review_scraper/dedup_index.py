@@ -0,0 +1,110 @@
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+
+DEFAULT_PATH = os.getenv("CINEDRIFT_DEDUP_INDEX", "review_index.bloom")
+
+# magic, number of bits, number of hash functions, reserved, keys added
+_HEADER = struct.Struct("<8sQIIQ")
+_MAGIC = b"CDBLOOM1"
+
+
+def review_key(row):
+    """16-byte key identifying a review across runs: movie, reviewer and text."""
+    text = "\0".join((row.get("movie_id", ""), row.get("reviewer_name", ""), row.get("review_text", "")))
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+class ReviewDedupIndex:
+    """Bloom filter of review keys, stored in a memory-mapped file.
+
+    Sized on first use for `capacity` keys at `error_rate` false positives
+    (20M keys at 0.1% is about 36 MB); the file is sparse until filled. A
+    false positive means a new review is taken for a duplicate and skipped,
+    never the other way round. Membership checks and inserts work on whole
+    batches so each page or write batch costs one call.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, capacity=20_000_000, error_rate=0.001):
+        self.path = path
+        self._lock = threading.Lock()
+        if not os.path.exists(path):
+            self._create(path, capacity, error_rate)
+        self._file = open(path, "r+b")
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        magic, self.bits, self.hashes, _, self.count = _HEADER.unpack_from(self._map, 0)
+        if magic != _MAGIC:
+            raise ValueError(f"{path} is not a review dedup index")
+
+    @staticmethod
+    def _create(path, capacity, error_rate):
+        bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        bits += -bits % 8
+        hashes = max(1, round(bits / capacity * math.log(2)))
+        with open(path, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, bits, hashes, 0, 0))
+            f.truncate(_HEADER.size + bits // 8)
+
+    def _positions(self, key):
+        # Kirsch-Mitzenmacher double hashing over the two halves of the key
+        h1 = int.from_bytes(key[:8], "little")
+        h2 = int.from_bytes(key[8:16], "little") | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def _contains(self, key):
+        data = self._map
+        offset = _HEADER.size
+        for position in self._positions(key):
+            if not data[offset + (position >> 3)] & (1 << (position & 7)):
+                return False
+        return True
+
+    def contains_many(self, keys):
+        with self._lock:
+            return [self._contains(key) for key in keys]
+
+    def __contains__(self, key):
+        return self.contains_many([key])[0]
+
+    def add_many(self, keys):
+        """Add keys; returns how many were not already present."""
+        added = 0
+        offset = _HEADER.size
+        with self._lock:
+            data = self._map
+            for key in keys:
+                new = False
+                for position in self._positions(key):
+                    index = offset + (position >> 3)
+                    bit = 1 << (position & 7)
+                    if not data[index] & bit:
+                        data[index] |= bit
+                        new = True
+                added += new
+            self.count += added
+            _HEADER.pack_into(data, 0, _MAGIC, self.bits, self.hashes, 0, self.count)
+        return added
+
+    def __len__(self):
+        return self.count
+
+    def flush(self):
+        with self._lock:
+            self._map.flush()
+
+    def close(self):
+        with self._lock:
+            if not self._map.closed:
+                self._map.flush()
+                self._map.close()
+                self._file.close()
+
+
+if __name__ == "__main__":
+    index = ReviewDedupIndex()
+    fill = sum(bin(byte).count("1") for byte in index._map[_HEADER.size:]) / index.bits
+    print(f"{index.path}: {len(index)} reviews, {index.bits // 8 / 1e6:.1f} MB, "
+          f"{index.hashes} hashes, {fill:.2%} of bits set")
@@ -0,0 +1,327 @@
+import atexit
+import json
+import os
+import threading
+import time
+
+DEFAULT_PROFILES = os.getenv("CINEDRIFT_PROFILES", "chrome-profiles")
+DEFAULT_COOKIES = os.getenv("CINEDRIFT_COOKIES", "chrome-cookies.json")
+# Per-tab limits past which a driver is recycled
+DEFAULT_MAX_HEAP_MB = float(os.getenv("CINEDRIFT_MAX_HEAP_MB", "400"))
+DEFAULT_MAX_NODES = int(os.getenv("CINEDRIFT_MAX_NODES", "150000"))
+
+# Fields Network.setCookies accepts, out of those Network.getAllCookies returns
+_COOKIE_FIELDS = ("name", "value", "domain", "path", "secure", "httpOnly", "sameSite", "expires", "priority")
+
+
+class CookieJar:
+    """Browser cookies kept in a JSON file, so consent choices and bot-check clearances outlive the browser.
+
+    Saved from and restored into Chrome over DevTools, which reaches every
+    domain at once without loading a page first. Session cookies are kept
+    too: a scraping session is meant to pick up where the last one stopped.
+    """
+
+    def __init__(self, path=DEFAULT_COOKIES):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                cookies = json.load(f)
+        except (OSError, ValueError):
+            return []
+        now = time.time()
+        # expires is -1 for session cookies
+        return [cookie for cookie in cookies if cookie.get("expires", -1) < 0 or cookie["expires"] > now]
+
+    def save(self, driver):
+        """Merge the browser's cookies into the file; returns how many the browser had."""
+        cookies = driver.execute_cdp_cmd("Network.getAllCookies", {}).get("cookies") or []
+        if not cookies:
+            return 0
+        with self._lock:
+            merged = {(c["name"], c["domain"], c.get("path", "/")): c for c in self.load()}
+            for cookie in cookies:
+                merged[cookie["name"], cookie["domain"], cookie.get("path", "/")] = {
+                    field: cookie[field] for field in _COOKIE_FIELDS if field in cookie
+                }
+            temp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(list(merged.values()), f)
+            os.replace(temp_path, self.path)
+        return len(cookies)
+
+    def restore(self, driver):
+        """Set every saved, unexpired cookie in the browser; returns how many."""
+        cookies = self.load()
+        if cookies:
+            driver.execute_cdp_cmd("Network.setCookies", {"cookies": cookies})
+        return len(cookies)
+
+
+class MemoryPressure(Exception):
+    """The current tab has outgrown the pool's memory limits; recycle the driver and resume from the checkpoint."""
+
+
+def _profile_in_use(path):
+    """Whether a live Chrome holds the profile at `path` (its SingletonLock points at "host-pid")."""
+    try:
+        owner = os.readlink(os.path.join(path, "SingletonLock"))
+    except OSError:
+        return False
+    try:
+        os.kill(int(owner.rsplit("-", 1)[1]), 0)
+    except (IndexError, ValueError, ProcessLookupError):
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class DriverPool:
+    """Warm Chrome sessions that scrape calls borrow and hand back, instead of starting one each.
+
+    `acquire` returns an idle driver started with the same options if one
+    passes a health check, else starts a new one with `factory` (usually
+    browser.create_driver) on a free profile under `profile_root`, with the
+    saved cookies restored. `release` parks it for the next caller; drivers
+    that have served `max_uses` scrapes or are `max_age` seconds old, or
+    that would exceed `size` idle drivers, are retired instead: cookies saved,
+    then quit. `close` (also run at interpreter exit) retires the idle ones.
+    A caller-supplied user_data_dir (one per runner worker) is used as is.
+
+    The profiles persist between runs, so Chrome's cache and consent state
+    do too; the cookie jar covers throwaway profiles.
+
+    Memory is watched per tab, from the renderer's JS heap and DOM node
+    count over DevTools: infinite lists only ever grow, and a driver kept
+    for a whole batch of movies keeps growing with them. `checkup` (between
+    movies) and `watch` (between scroll rounds, raising MemoryPressure)
+    notice a tab past `max_heap_mb` or `max_nodes`, and `recycle` swaps it
+    for a fresh tab, or for a new browser once the driver has had
+    `max_tabs` tabs or is worn. Drivers over the limits are not parked.
+    """
+
+    def __init__(self, size=2, max_uses=25, max_age=1800.0, profile_root=DEFAULT_PROFILES, cookies=None,
+                 max_heap_mb=DEFAULT_MAX_HEAP_MB, max_nodes=DEFAULT_MAX_NODES, max_tabs=4, check_interval=10.0):
+        self.size = size
+        self.max_uses = max_uses
+        self.max_age = max_age
+        self.profile_root = profile_root
+        self.cookies = cookies or CookieJar()
+        self.max_heap_mb = max_heap_mb
+        self.max_nodes = max_nodes
+        self.max_tabs = max_tabs
+        self.check_interval = check_interval
+        self.started = 0
+        self.reused = 0
+        self.fresh_tabs = 0
+        self._lock = threading.Lock()
+        self._idle = []
+        # id(driver) -> {"driver", "key", "profile", "uses", "started", "visited", "tabs", "checked", "metrics",
+        #                "lean"}
+        self._sessions = {}
+        self._profiles_in_use = set()
+        atexit.register(self.close)
+
+    def acquire(self, factory, user_data_dir=None, **options):
+        """A healthy driver made by `factory(user_data_dir=..., **options)`, warm if possible."""
+        key = (factory, user_data_dir, tuple(sorted(options.items())))
+        while True:
+            with self._lock:
+                state = next((s for s in self._idle if s["key"] == key), None)
+                if state is None:
+                    break
+                self._idle.remove(state)
+            if self._healthy(state["driver"]):
+                state["uses"] += 1
+                self.reused += 1
+                return state["driver"]
+            print("Pooled Chrome session stopped responding; starting a new one")
+            self._retire(state, save_cookies=False)
+
+        profile = user_data_dir or self._claim_profile()
+        try:
+            driver = factory(user_data_dir=profile, **options)
+        except Exception:
+            self._release_profile(profile)
+            raise
+        try:
+            restored = self.cookies.restore(driver)
+            if restored:
+                print(f"Restored {restored} cookies into a new Chrome session")
+        except Exception as e:
+            print(f"Could not restore cookies: {e}")
+        with self._lock:
+            self._sessions[id(driver)] = {"driver": driver, "key": key, "profile": profile, "uses": 1,
+                                          "started": time.monotonic(), "visited": set(), "tabs": 1,
+                                          "checked": time.monotonic(), "metrics": False,
+                                          "lean": options.get("lean", False)}
+            self.started += 1
+        return driver
+
+    def release(self, driver):
+        """Hand a driver back: parked for reuse, or retired when it is due for recycling."""
+        state = self._sessions.get(id(driver))
+        if state is None:
+            _quit(driver)
+            return
+        if not self._worn(state) and not self._over_memory(state):
+            with self._lock:
+                keep = len(self._idle) < self.size
+                if keep:
+                    self._idle.append(state)
+            if keep:
+                return
+        self._retire(state)
+
+    def first_visit(self, driver, site):
+        """True the first time `driver` is used on `site`, e.g. to dismiss its consent dialog only once."""
+        state = self._sessions.get(id(driver))
+        if state is None:
+            return True
+        if site in state["visited"]:
+            return False
+        state["visited"].add(site)
+        return True
+
+    def memory(self, driver):
+        """The current tab's renderer memory: {"heap_mb", "nodes", "documents"}."""
+        state = self._sessions.get(id(driver))
+        if state is None or not state["metrics"]:
+            driver.execute_cdp_cmd("Performance.enable", {})
+            if state is not None:
+                state["metrics"] = True
+        values = {m["name"]: m["value"] for m in driver.execute_cdp_cmd("Performance.getMetrics", {})["metrics"]}
+        return {
+            "heap_mb": values.get("JSHeapTotalSize", 0) / 1e6,
+            "nodes": int(values.get("Nodes", 0)),
+            "documents": int(values.get("Documents", 0)),
+        }
+
+    def watch(self, driver):
+        """Raise MemoryPressure if the tab is over the limits; measures at most every `check_interval` seconds.
+
+        Meant for loops that grow one page, called right after a checkpoint
+        so the caller can recycle and carry on from it.
+        """
+        state = self._sessions.get(id(driver))
+        if state is None or time.monotonic() - state["checked"] < self.check_interval:
+            return
+        usage = self._over_memory(state)
+        if usage:
+            raise MemoryPressure(f"Chrome tab at {usage['heap_mb']:.0f} MB JS heap, {usage['nodes']} DOM nodes")
+
+    def checkup(self, driver):
+        """`driver`, or its recycled replacement if the tab is over the limits; call between movies."""
+        state = self._sessions.get(id(driver))
+        usage = state and self._over_memory(state)
+        if not usage:
+            return driver
+        print(f"Chrome tab at {usage['heap_mb']:.0f} MB JS heap, {usage['nodes']} DOM nodes; recycling it")
+        return self.recycle(driver)
+
+    def recycle(self, driver):
+        """Swap `driver`'s tab for a fresh one, or the browser for a new one; returns the driver to use.
+
+        The loaded page is gone either way, so the caller reloads it. A new
+        browser gets the same options and profile, and the cookies the old
+        one saved on the way out. A new tab of a lean driver blocks the same
+        requests as the first.
+        """
+        state = self._sessions.get(id(driver))
+        if state is None:
+            return driver
+        if state["tabs"] < self.max_tabs and not self._worn(state):
+            try:
+                old_tab = driver.current_window_handle
+                driver.switch_to.new_window("tab")
+                new_tab = driver.current_window_handle
+                driver.switch_to.window(old_tab)
+                driver.close()
+                driver.switch_to.window(new_tab)
+                if state["lean"]:
+                    # Blocked URLs, like performance metrics, are set per tab
+                    from browser import block_requests
+                    block_requests(driver)
+            except Exception as e:
+                print(f"Could not open a fresh tab ({e}); restarting Chrome")
+            else:
+                state["tabs"] += 1
+                state["checked"] = time.monotonic()
+                # Performance metrics are enabled per tab
+                state["metrics"] = False
+                self.fresh_tabs += 1
+                return driver
+        factory, user_data_dir, options = state["key"]
+        self._retire(state)
+        return self.acquire(factory, user_data_dir, **dict(options))
+
+    def close(self):
+        """Retire every idle driver; drivers still borrowed are retired when released."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for state in idle:
+            self._retire(state)
+
+    def _worn(self, state):
+        return state["uses"] >= self.max_uses or time.monotonic() - state["started"] >= self.max_age
+
+    def _over_memory(self, state):
+        """The tab's memory usage if it is over the limits, else None."""
+        state["checked"] = time.monotonic()
+        try:
+            usage = self.memory(state["driver"])
+        except Exception:
+            return None
+        if usage["heap_mb"] > self.max_heap_mb or usage["nodes"] > self.max_nodes:
+            return usage
+        return None
+
+    def _healthy(self, driver):
+        try:
+            driver.execute_script("return 1")
+            return True
+        except Exception:
+            return False
+
+    def _retire(self, state, save_cookies=True):
+        driver = state["driver"]
+        if save_cookies:
+            try:
+                self.cookies.save(driver)
+            except Exception as e:
+                print(f"Could not save cookies: {e}")
+        _quit(driver)
+        with self._lock:
+            self._sessions.pop(id(driver), None)
+        self._release_profile(state["profile"])
+
+    def _claim_profile(self):
+        with self._lock:
+            slot = 0
+            while True:
+                path = os.path.abspath(os.path.join(self.profile_root, f"profile-{slot}"))
+                if path not in self._profiles_in_use and not _profile_in_use(path):
+                    self._profiles_in_use.add(path)
+                    break
+                slot += 1
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def _release_profile(self, path):
+        with self._lock:
+            self._profiles_in_use.discard(path)
+
+
+def _quit(driver):
+    try:
+        driver.quit()
+    except Exception:
+        pass
+
+
+# Shared by every scraper in the process
+pool = DriverPool()
@@ -0,0 +1,411 @@
+import re
+from datetime import datetime
+import lxml.html
+from lxml import etree
+
+from failures import recorder
+
+# Text nodes of a review body, minus the "more" / "reveal" links Letterboxd
+# appends to truncated reviews.
+_BODY_TEXT = etree.XPath(
+    './/text()[not(ancestor::a[contains(@class,"more-link") or contains(@class,"reveal")])]'
+)
+
+
+def _first(nodes):
+    return nodes[0] if nodes else None
+
+
+def _text(node):
+    """Whitespace-normalized text of an element (roughly what Selenium's .text gives)."""
+    if node is None:
+        return ""
+    if isinstance(node, str):
+        return " ".join(node.split())
+    return " ".join(node.text_content().split())
+
+
+def _digits(text):
+    digits = ''.join(filter(str.isdigit, text or ""))
+    return int(digits) if digits else 0
+
+
+def _paragraphs(body):
+    """Join the <p> children of a review body with newlines, dropping "more" links."""
+    if body is None:
+        return ""
+    for br in body.iter("br"):
+        br.tail = "\n" + (br.tail or "")
+    parts = []
+    for p in body.xpath('.//p') or [body]:
+        for line in "".join(_BODY_TEXT(p)).split("\n"):
+            line = " ".join(line.split()).rstrip("…").rstrip()
+            if line:
+                parts.append(line)
+    return "\n".join(parts)
+
+
+class ReviewExtractor:
+    """Extracts every review on a page from one HTML snapshot.
+
+    Subclasses set `site` and the compiled XPath expressions, and implement
+    `extract_movie` and `extract_review`. Review dicts hold the raw per-site
+    fields; turning them into rows (rating conversion, date parsing) is left
+    to the scraper module that owns the site.
+
+    `required` maps review fields that are never legitimately empty to the
+    XPath attribute that fills them; an empty one counts as a failure of
+    that selector, like an exception in `extract_review` does.
+    """
+    site = None
+    review_boxes = None
+    required = {}
+
+    def parse(self, html):
+        return lxml.html.fromstring(html)
+
+    def extract_movie(self, tree):
+        raise NotImplementedError
+
+    def extract_review(self, box):
+        raise NotImplementedError
+
+    def next_page_url(self, tree):
+        return None
+
+    def extract_reviews(self, tree, url=None):
+        """Review dicts for every box on the page.
+
+        Failures go to failures.recorder; once one selector has failed on
+        too many of the page's boxes this raises SelectorBroken without
+        reading the rest.
+        """
+        reviews = []
+        boxes = self.review_boxes(tree)
+        failed = {}
+        for selector in self.required.values():
+            recorder.count_checked(self.site, selector, len(boxes))
+        for box in boxes:
+            try:
+                review = self.extract_review(box)
+            except Exception as e:
+                self._failure(failed, "extract_review", box, e, url)
+            else:
+                reviews.append(review)
+                for field, selector in self.required.items():
+                    if not review[field]:
+                        self._failure(failed, selector, box, f"empty {field}", url)
+            if failed:
+                recorder.check(self.site, failed, len(boxes))
+        return reviews
+
+    def _failure(self, failed, selector, box, error, url):
+        failed[selector] = failed.get(selector, 0) + 1
+        sample = lambda: etree.tostring(box, encoding="unicode", with_tail=False)
+        recorder.record(self.site, selector, sample, error, url)
+
+    def extract(self, html, url=None):
+        """Parse `html` once and return (movie, reviews)."""
+        tree = self.parse(html)
+        return self.extract_movie(tree), self.extract_reviews(tree, url)
+
+
+class LetterboxdExtractor(ReviewExtractor):
+    site = "letterboxd"
+    required = {"reviewer_name": "reviewer", "review_text": "body"}
+    # Older layout used plain divs under the section; current one uses articles.
+    review_boxes = etree.XPath(
+        '//div[contains(@class,"viewing-list")]//article'
+        ' | //*[@id="content"]/div/div/section/div[3]/div[.//div[contains(@class,"js-review-body")] and not(.//article)]'
+    )
+    movie_name = etree.XPath('//section/header//h1/a | //h1[contains(@class,"headline-2")]/a')
+    movie_year = etree.XPath('//section/header//h1/small/a | //h1[contains(@class,"headline-2")]/small/a')
+    next_link = etree.XPath('//div[contains(@class,"pagination")]//a[contains(@class,"next")]/@href')
+
+    reviewer = etree.XPath('.//strong[contains(@class,"displayname")]')
+    date = etree.XPath('.//time')
+    body = etree.XPath('.//div[contains(@class,"js-review-body")]')
+    rating = etree.XPath('.//span[contains(@class,"rating")]/@class')
+    likes = etree.XPath('.//p[@data-count]/@data-count | .//span[contains(@class,"_count_")]')
+    truncated = etree.XPath('boolean(.//a[contains(@class,"more-link") or contains(@class,"reveal")])')
+
+    def extract_movie(self, tree):
+        return {
+            "movie_name": _text(_first(self.movie_name(tree))),
+            "movie_release_year": _text(_first(self.movie_year(tree))),
+        }
+
+    def next_page_url(self, tree):
+        return _first(self.next_link(tree))
+
+    def extract_full_text(self, html):
+        """Text of a /s/full-text/ fragment, as fetched for truncated reviews."""
+        return _paragraphs(lxml.html.fragment_fromstring(html, create_parent="div"))
+
+    def extract_review(self, box):
+        body = _first(self.body(box))
+        rating_class = _first(self.rating(box)) or ""
+        match = re.search(r'rated-(\d+)', rating_class)
+        likes = _first(self.likes(box))
+        return {
+            "reviewer_name": _text(_first(self.reviewer(box))),
+            "review_date": _text(_first(self.date(box))),
+            "review_text": _paragraphs(body),
+            "star_rating": float(match.group(1)) / 2 if match else 0.0,
+            "likes_count": _digits(likes if isinstance(likes, str) else _text(likes)),
+            "truncated": bool(self.truncated(box)),
+            "full_text_url": body.get("data-full-text-url") if body is not None else None,
+        }
+
+
+class IMDbExtractor(ReviewExtractor):
+    site = "imdb"
+    required = {"reviewer_name": "reviewer", "review_text": "text"}
+    review_boxes = etree.XPath(
+        '//*[@id="__next"]/main/div/section/div/section/div/div[1]/section[1]/article'
+        ' | //article[contains(@class,"user-review-item")]'
+    )
+    movie_name = etree.XPath('//h1[contains(@data-testid,"hero-title-block__title")]')
+    title = etree.XPath('//title')
+
+    score = etree.XPath('./div[1]/div[1]/div[1]/span/span[1] | .//span[contains(@class,"ipc-rating-star--rating")]')
+    reviewer = etree.XPath('./div[2]/ul/li[1]/a | .//a[@data-testid="author-link"]')
+    date = etree.XPath('./div[2]/ul/li[2] | .//li[contains(@class,"review-date")]')
+    text = etree.XPath('./div[1]/div[1]/div[3]/div/div/div | .//div[contains(@class,"ipc-html-content-inner-div")]')
+    helpfulness = etree.XPath('.//div[contains(@class,"actions")]/span')
+    expandable = etree.XPath('boolean(./div[1]/div[1]/div[3]/button | .//button[contains(@class,"review-spoiler-button")])')
+
+    def extract_movie(self, tree):
+        title = _text(_first(self.title(tree)))
+        match = re.search(r"\((\d{4})\)", title)
+        movie_name = _text(_first(self.movie_name(tree))) or title.split("-")[0].strip()
+        return {
+            "movie_name": movie_name,
+            "movie_release_year": match.group(1) if match else "",
+        }
+
+    def extract_review(self, box):
+        try:
+            star_rating = float(_text(_first(self.score(box)))) / 2
+        except ValueError:
+            star_rating = 0.0
+        helpfulness = _text(_first(self.helpfulness(box)))
+        try:
+            likes_count = int(helpfulness.split(" out of ")[0].replace(",", "").strip())
+        except ValueError:
+            likes_count = 0
+        return {
+            "reviewer_name": _text(_first(self.reviewer(box))),
+            "review_date": _text(_first(self.date(box))),
+            "review_text": _paragraphs(_first(self.text(box))),
+            "star_rating": star_rating,
+            "likes_count": likes_count,
+            "truncated": bool(self.expandable(box)),
+        }
+
+
+class RottenTomatoesExtractor(ReviewExtractor):
+    site = "rottentomatoes"
+    required = {"reviewer_name": "reviewer", "review_text": "quote"}
+    review_boxes = etree.XPath('//*[@id="reviews"]/div[1]/div')
+    release_date = etree.XPath('//*[@id="main-page-content"]/div/aside/section/div[1]/ul/li[4]')
+    canonical = etree.XPath('//link[@rel="canonical"]/@href')
+
+    quote = etree.XPath('./div[2]/p[1]')
+    reviewer = etree.XPath('./div[1]/div/a[1]')
+    date = etree.XPath('./div[2]/p[2]/span')
+    score = etree.XPath('./div[2]/p[2]')
+    icon = etree.XPath('.//span[contains(@class,"review-icon")]/@class')
+    full_review = etree.XPath('./div[2]/p[2]/a/@href')
+
+    def extract_movie(self, tree):
+        match = re.search(r'(\d{4})', _text(_first(self.release_date(tree))))
+        movie_name = ""
+        url = _first(self.canonical(tree)) or ""
+        if "/m/" in url:
+            movie_name = url.split("/m/")[1].split("/")[0].replace("_", " ").title()
+        return {
+            "movie_name": movie_name,
+            "movie_release_year": match.group(1) if match else "",
+        }
+
+    def extract_review(self, box):
+        icon_class = _first(self.icon(box)) or ""
+        if "fresh" in icon_class:
+            fresh_rotten = "fresh"
+        elif "rotten" in icon_class:
+            fresh_rotten = "rotten"
+        else:
+            fresh_rotten = None
+        return {
+            "reviewer_name": _text(_first(self.reviewer(box))),
+            "review_date": _text(_first(self.date(box))),
+            "review_text": _text(_first(self.quote(box))),
+            "score_text": _text(_first(self.score(box))),
+            "fresh_rotten": fresh_rotten,
+            "likes_count": 0,
+            "full_review_url": _first(self.full_review(box)),
+        }
+
+
+    def review_from_json(self, item):
+        """Review dict, same shape as extract_review, from one entry of the reviews JSON endpoint."""
+        state = (item.get("reviewState") or "").lower()
+        if state not in ("fresh", "rotten"):
+            state = "fresh" if item.get("isFresh") else "rotten" if item.get("isRotten") else None
+        return {
+            "reviewer_name": _text(item.get("criticName") or item.get("displayName") or ""),
+            "review_date": _text(item.get("creationDate") or item.get("createDate") or ""),
+            "review_text": _text(item.get("quote") or item.get("review") or ""),
+            "score_text": _text(item.get("originalScore") or item.get("score") or ""),
+            "fresh_rotten": state,
+            "likes_count": 0,
+            "full_review_url": item.get("reviewUrl"),
+        }
+
+
+class BookMyShowExtractor(ReviewExtractor):
+    site = "bookmyshow"
+    required = {"review_text": "text"}
+    review_boxes = etree.XPath('//*[@id="super-container"]/div[1]/div/div/section[3]/div[1]/div[3]/div')
+    movie_name = etree.XPath('//*[@id="super-container"]/div[1]/div/div/div[1]')
+    release_date = etree.XPath('//*[@id="super-container"]/div[1]/div/div/section[1]/div[1]/div[1]/div[2]/span')
+
+    text = etree.XPath('./div[1]/div/p')
+    date = etree.XPath('./div[2]/div[2]/span')
+    rating = etree.XPath('./div[1]/section/div[2]/div')
+    likes = etree.XPath('./div[2]/div[1]/button[1]/span')
+
+    def extract_movie(self, tree):
+        match = re.search(r'(\d{4})', _text(_first(self.release_date(tree))))
+        return {
+            "movie_name": _text(_first(self.movie_name(tree))),
+            "movie_release_year": match.group(1) if match else "",
+        }
+
+    def extract_review(self, box):
+        rating_match = re.search(r'(\d+(\.\d+)?)/10', _text(_first(self.rating(box))))
+        return {
+            "reviewer_name": "user",
+            "review_date": _text(_first(self.date(box))),
+            "review_text": _text(_first(self.text(box))),
+            "star_rating": float(rating_match.group(1)) / 2 if rating_match else 0.0,
+            "likes_count": _digits(_text(_first(self.likes(box)))),
+        }
+
+    # Field names used by the review payloads the page fetches while scrolling
+    json_text = ("reviewText", "review", "description", "text", "comment")
+    json_date = ("createdAt", "reviewDate", "publishedAt", "date", "timestamp")
+    json_rating = ("userRating", "rating", "score")
+    json_likes = ("likes", "likeCount", "upvotes", "helpfulCount")
+    json_more = ("hasNextPage", "hasMore", "has_more")
+    json_last = ("isLastPage", "lastPage")
+
+    def reviews_from_json(self, payload):
+        """Review dicts, same shape as extract_review, from one captured reviews response.
+
+        The payload shape differs between endpoints, so this takes the first
+        list of objects in it that carry review text.
+        """
+        items = _find_items(payload, self.json_text)
+        return [self.review_from_json(item) for item in items]
+
+    def has_more(self, payload):
+        """The response's own has-more flag (True/False), or None if it carries none."""
+        more = _find_flag(payload, self.json_more)
+        if more is not None:
+            return more
+        last = _find_flag(payload, self.json_last)
+        return None if last is None else not last
+
+    def review_from_json(self, item):
+        rating = _pick(item, self.json_rating)
+        if isinstance(rating, dict):
+            rating = rating.get("value") or rating.get("rating")
+        rating_match = re.search(r'(\d+(\.\d+)?)', str(rating or ""))
+        date = _pick(item, self.json_date)
+        if isinstance(date, (int, float)):
+            # Epoch seconds or milliseconds
+            date = datetime.fromtimestamp(date / 1000 if date > 1e11 else date).strftime('%Y-%m-%d')
+        elif isinstance(date, str) and re.match(r'\d{4}-\d{2}-\d{2}', date):
+            date = date[:10]
+        likes = _pick(item, self.json_likes)
+        return {
+            "reviewer_name": "user",
+            "review_date": _text(str(date or "")),
+            "review_text": _text(str(_pick(item, self.json_text) or "")),
+            # Ratings are out of 10, like the "8/10" shown on the page
+            "star_rating": float(rating_match.group(1)) / 2 if rating_match else 0.0,
+            "likes_count": likes if isinstance(likes, int) else _digits(str(likes or "")),
+        }
+
+
+def _pick(item, keys):
+    for key in keys:
+        if item.get(key) not in (None, ""):
+            return item[key]
+    return None
+
+
+def _find_flag(payload, keys):
+    """First boolean under one of `keys` in `payload`, searched depth-first."""
+    if isinstance(payload, dict):
+        for key in keys:
+            if isinstance(payload.get(key), bool):
+                return payload[key]
+        children = payload.values()
+    elif isinstance(payload, list):
+        children = payload
+    else:
+        return None
+    for child in children:
+        if isinstance(child, (dict, list)):
+            flag = _find_flag(child, keys)
+            if flag is not None:
+                return flag
+    return None
+
+
+def _find_items(payload, text_keys):
+    """First list in `payload` (searched depth-first) whose objects have one of `text_keys`."""
+    if isinstance(payload, list):
+        if any(isinstance(item, dict) and _pick(item, text_keys) for item in payload):
+            return [item for item in payload if isinstance(item, dict)]
+        children = payload
+    elif isinstance(payload, dict):
+        children = payload.values()
+    else:
+        return []
+    for child in children:
+        items = _find_items(child, text_keys)
+        if items:
+            return items
+    return []
+
+
+EXTRACTORS = {
+    extractor.site: extractor
+    for extractor in (LetterboxdExtractor, IMDbExtractor, RottenTomatoesExtractor, BookMyShowExtractor)
+}
+
+
+def get_extractor(site):
+    return EXTRACTORS[site]()
+
+
+if __name__ == "__main__":
+    # Offline check against a saved page: python extractors.py letterboxd debug_page.html
+    import sys
+    import time
+
+    site = sys.argv[1] if len(sys.argv) > 1 else "letterboxd"
+    path = sys.argv[2] if len(sys.argv) > 2 else "debug_page.html"
+    with open(path, encoding="utf-8") as f:
+        html = f.read()
+    start_time = time.perf_counter()
+    movie, reviews = get_extractor(site).extract(html)
+    elapsed = time.perf_counter() - start_time
+    print(movie)
+    for review in reviews:
+        print(review)
+    print(f"Extracted {len(reviews)} reviews in {elapsed * 1000:.1f}ms")
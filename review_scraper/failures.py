@@ -0,0 +1,124 @@
+import argparse
+import gzip
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter
+
+DEFAULT_DIR = os.getenv("CINEDRIFT_FAILURES", "failures")
+
+
+class SelectorBroken(Exception):
+    """A selector fails on so many review boxes that the rest of the movie is not worth extracting."""
+
+    def __init__(self, site, selector, failures, boxes):
+        super().__init__(f"{site} selector {selector!r} failed on {failures} of {boxes} reviews")
+        self.site = site
+        self.selector = selector
+
+
+class FailureRecorder:
+    """Counts extraction failures per site and selector, keeping a few compressed samples of each.
+
+    A sample is the failing review box's HTML, serialized from the parsed
+    snapshot (no WebDriver call) and gzipped to disk with the error, URL
+    and selector. At most `samples` are kept per selector, and at most one
+    is written every `sample_interval` seconds, so a broken selector costs
+    a few small files rather than a dump per review.
+
+    `check` raises SelectorBroken once a selector has failed on at least
+    `max_error_rate` of a page's boxes (and on `min_failures` of them), so
+    the scraper can move on to the next movie.
+    """
+
+    def __init__(self, directory=DEFAULT_DIR, samples=3, sample_interval=30.0, max_sample_bytes=64_000,
+                 max_error_rate=0.5, min_failures=5):
+        self.directory = directory
+        self.samples = samples
+        self.sample_interval = sample_interval
+        self.max_sample_bytes = max_sample_bytes
+        self.max_error_rate = max_error_rate
+        self.min_failures = min_failures
+        self.failures = Counter()
+        self.checked = Counter()
+        self._last_sample = {}
+        self._saved = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, site, selector, sample=None, error=None, url=None):
+        """Count one failure of `selector`; `sample()` returns the HTML to keep, called only if one is due."""
+        key = (site, selector)
+        now = time.monotonic()
+        with self._lock:
+            self.failures[key] += 1
+            due = (sample is not None and self._saved[key] < self.samples
+                   and now - self._last_sample.get(key, -self.sample_interval) >= self.sample_interval)
+            if due:
+                self._saved[key] += 1
+                self._last_sample[key] = now
+        if due:
+            self._save(site, selector, sample(), error, url)
+
+    def count_checked(self, site, selector, boxes):
+        with self._lock:
+            self.checked[site, selector] += boxes
+
+    def check(self, site, page_failures, boxes):
+        """Raise SelectorBroken if a selector in `page_failures` ({selector: count}) failed on too many of `boxes`."""
+        for selector, failures in page_failures.items():
+            if failures >= self.min_failures and failures >= self.max_error_rate * boxes:
+                raise SelectorBroken(site, selector, failures, boxes)
+
+    def _save(self, site, selector, html, error, url):
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"{site}-{re.sub(r'[^A-Za-z0-9_]+', '_', selector)}-{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}"
+        header = {"site": site, "selector": selector, "error": str(error) if error else None, "url": url,
+                  "time": time.time()}
+        data = html.encode("utf-8")[:self.max_sample_bytes]
+        path = os.path.join(self.directory, name + ".html.gz")
+        with gzip.open(path, "wb") as f:
+            f.write(b"<!-- " + json.dumps(header).encode("utf-8") + b" -->\n" + data)
+        print(f"Saved a sample of the failing {site} selector {selector!r} to {path}")
+
+    def report(self):
+        """One line per failing selector: failures out of reviews checked."""
+        with self._lock:
+            return "\n".join(
+                f"{site} {selector}: failed {count}/{self.checked[site, selector] or '?'}"
+                for (site, selector), count in self.failures.most_common()
+            )
+
+    def reset(self):
+        with self._lock:
+            self.failures.clear()
+            self.checked.clear()
+
+
+def read_sample(path):
+    """(header dict, html) of a saved sample."""
+    with gzip.open(path, "rb") as f:
+        first, _, html = f.read().partition(b"\n")
+    return json.loads(first[len(b"<!-- "):-len(b" -->")]), html.decode("utf-8", "replace")
+
+
+# Shared by every extractor in the process
+recorder = FailureRecorder()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List or show saved extraction failure samples.")
+    parser.add_argument("sample", nargs="?", help="a sample file to print")
+    parser.add_argument("--dir", default=DEFAULT_DIR)
+    args = parser.parse_args()
+
+    if args.sample:
+        header, html = read_sample(args.sample)
+        print(json.dumps(header, indent=2))
+        print(html)
+    else:
+        paths = sorted(os.path.join(args.dir, name) for name in os.listdir(args.dir)) if os.path.isdir(args.dir) else []
+        for path in paths:
+            header, html = read_sample(path)
+            print(f"{os.path.basename(path)}  {header['selector']}  {len(html)} chars  {header['error'] or ''}")
@@ -0,0 +1,82 @@
+from urllib.parse import urljoin
+
+from http_fetch import fetch_many
+from metrics import registry as metrics
+from waits import wait_for_network_idle
+
+# Clicks every element matching a CSS selector in one round-trip
+_CLICK_ALL_JS = """
+const elements = document.querySelectorAll(arguments[0]);
+elements.forEach(element => element.click());
+return elements.length;
+"""
+
+
+def truncated(reviews):
+    """The reviews on a page whose text is cut short."""
+    return [review for review in reviews if review.get("truncated")]
+
+
+@metrics.timed("expand")
+def fetch_full_texts(session, reviews, base_url, parse_text, url_key="full_text_url", workers=8):
+    """Fetch the full text of every truncated review that links to it, concurrently.
+
+    `parse_text(html)` turns a fetched page into review text. Patches the
+    reviews in place and returns those still truncated (no link, or the
+    fetch failed), for the caller to expand some other way.
+    """
+    pending = truncated(reviews)
+    urls = {id(review): urljoin(base_url, review[url_key]) for review in pending if review.get(url_key)}
+    if not urls:
+        return pending
+    pages = fetch_many(session, sorted(set(urls.values())), workers=workers)
+    remaining = []
+    for review in pending:
+        html = pages.get(urls.get(id(review)))
+        text = parse_text(html) if html else ""
+        if text:
+            review["review_text"] = text
+            review["truncated"] = False
+        else:
+            remaining.append(review)
+    return remaining
+
+
+def patch_expanded(leftovers, reviews, expanded):
+    """Copy in-page expanded text into `leftovers`, the still-truncated subset of `reviews`.
+
+    `expanded` is `reviews` extracted again from the page after expand_all;
+    the other reviews keep the text they already have. Returns the
+    leftovers that are still truncated.
+    """
+    if len(expanded) != len(reviews):
+        # The page changed under the clicks, so the boxes no longer line up
+        return leftovers
+    position = {id(review): index for index, review in enumerate(reviews)}
+    remaining = []
+    for review in leftovers:
+        fresh = expanded[position[id(review)]]
+        if fresh["reviewer_name"] == review["reviewer_name"] and not fresh.get("truncated"):
+            review["review_text"] = fresh["review_text"]
+            review["truncated"] = False
+        else:
+            remaining.append(review)
+    return remaining
+
+
+@metrics.timed("expand")
+def expand_all(driver, selector, wait=None):
+    """Click every expander matching the CSS `selector` in one script call, then wait once.
+
+    `wait(driver)` defaults to waiting for the network to go quiet, for
+    expanders that fetch their text. Returns how many were clicked; the page
+    source needs re-reading if any were.
+    """
+    clicked = driver.execute_script(_CLICK_ALL_JS, selector)
+    if clicked:
+        (wait or _network_idle)(driver)
+    return clicked or 0
+
+
+def _network_idle(driver):
+    wait_for_network_idle(driver, timeout=5, idle_ms=200, label="expand")
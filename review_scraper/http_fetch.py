@@ -0,0 +1,155 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from metrics import registry as metrics
+from rate_limiter import domain_of, limiter, looks_like_challenge, OK, EMPTY, THROTTLED, CHALLENGE
+
+USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/137.0.0.0 Safari/537.36"
+)
+
+
+class ChallengeError(Exception):
+    """The site answered with a bot check instead of the page."""
+
+
+def create_session(pool_size=8):
+    """A requests session with a connection pool sized for `pool_size` concurrent fetches."""
+    session = requests.Session()
+    retry = Retry(total=3, backoff_factor=0.5, status_forcelist=(500, 502, 504),
+                  allowed_methods=("GET",))
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({
+        "User-Agent": USER_AGENT,
+        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+        "Accept-Language": "en-US,en;q=0.9",
+    })
+    return session
+
+
+def is_challenge(response):
+    if response.status_code in (403, 429, 503):
+        return True
+    return looks_like_challenge(response.text)
+
+
+def fetch_html(session, url, timeout=20):
+    """GET `url` and return its HTML; None for a 404, ChallengeError for a bot check.
+
+    Every request waits for the site's rate limiter and reports back how it went.
+    """
+    limiter.acquire(url)
+    with metrics.stage("navigation"):
+        response = session.get(url, timeout=timeout)
+    metrics.count_command(metrics.current_site() or domain_of(url), "http_get", len(response.content),
+                          source="http")
+    if response.status_code == 404:
+        limiter.report(url, OK)
+        return None
+    if is_challenge(response):
+        limiter.report(url, THROTTLED if response.status_code == 429 else CHALLENGE)
+        raise ChallengeError(f"{url} returned a challenge page (HTTP {response.status_code})")
+    response.raise_for_status()
+    limiter.report(url, OK if response.text.strip() else EMPTY)
+    return response.text
+
+
+def fetch_json(session, url, params=None, timeout=20, referer=None):
+    """GET a JSON endpoint; None for a 404, ChallengeError for a bot check or an HTML answer."""
+    limiter.acquire(url)
+    headers = {"Accept": "application/json, text/plain, */*"}
+    if referer:
+        headers["Referer"] = referer
+    with metrics.stage("navigation"):
+        response = session.get(url, params=params, headers=headers, timeout=timeout)
+    metrics.count_command(metrics.current_site() or domain_of(url), "http_get", len(response.content),
+                          source="http")
+    if response.status_code == 404:
+        limiter.report(url, OK)
+        return None
+    if is_challenge(response):
+        limiter.report(url, THROTTLED if response.status_code == 429 else CHALLENGE)
+        raise ChallengeError(f"{url} returned a challenge page (HTTP {response.status_code})")
+    response.raise_for_status()
+    try:
+        data = response.json()
+    except ValueError:
+        limiter.report(url, CHALLENGE)
+        raise ChallengeError(f"{url} did not return JSON")
+    limiter.report(url, OK)
+    return data
+
+
+def session_from_driver(driver, pool_size=4):
+    """A requests session carrying the browser's cookies and user agent.
+
+    Lets a scraper call a site's JSON endpoints directly once Chrome has
+    passed its bot check.
+    """
+    session = create_session(pool_size)
+    user_agent = driver.execute_script("return navigator.userAgent")
+    if user_agent:
+        session.headers["User-Agent"] = user_agent
+    for cookie in driver.get_cookies():
+        session.cookies.set(cookie["name"], cookie["value"], domain=cookie.get("domain"), path=cookie.get("path", "/"))
+    return session
+
+
+def iter_pages(session, page_url, first_page=1, prefetch=4, max_pages=None):
+    """Yield (page_number, html) in order while the next `prefetch` pages download.
+
+    `page_url(n)` builds the URL of page n. Iteration stops at the first
+    missing page or `max_pages`; pages still in flight are dropped when the
+    caller stops early.
+    """
+    last_page = None if max_pages is None else first_page + max_pages - 1
+    next_page = first_page
+    pool = ThreadPoolExecutor(max_workers=max(1, prefetch))
+    in_flight = deque()
+    fetch = metrics.carry_context(fetch_html)
+
+    def fill():
+        nonlocal next_page
+        while len(in_flight) < max(1, prefetch) and (last_page is None or next_page <= last_page):
+            in_flight.append((next_page, pool.submit(fetch, session, page_url(next_page))))
+            next_page += 1
+
+    try:
+        fill()
+        while in_flight:
+            page_number, future = in_flight.popleft()
+            try:
+                html = future.result()
+            except (ChallengeError, requests.RequestException) as e:
+                # Where the caller should pick up, e.g. in the browser
+                e.page = page_number
+                raise
+            if html is None:
+                return
+            fill()
+            yield page_number, html
+    finally:
+        for _, future in in_flight:
+            future.cancel()
+        pool.shutdown(wait=False)
+
+
+def fetch_many(session, urls, workers=8):
+    """Fetch several URLs concurrently; returns {url: html or None}."""
+    @metrics.carry_context
+    def fetch(url):
+        try:
+            return fetch_html(session, url)
+        except Exception as e:
+            print(f"Failed to fetch {url}: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return dict(zip(urls, pool.map(fetch, urls)))
@@ -1,15 +1,32 @@
-import time
 import hashlib
 import re
+from urllib.parse import urljoin
+import requests
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-import undetected_chromedriver as uc
-from supabase_utils import insert_review
+from review_writer import RowsDropped, create_writer, flush_for_checkpoint
+from browser import create_driver
+from driver_pool import pool
+from extractors import LetterboxdExtractor
+from failures import SelectorBroken
+from full_text import expand_all, fetch_full_texts, patch_expanded, truncated
+from http_fetch import ChallengeError, create_session, iter_pages, session_from_driver
+from rate_limiter import limiter, page_outcome
+from checkpoints import CheckpointStore, review_hash
+from metrics import registry as metrics
+from records import Movie, Review
+from waits import AdaptiveTimeout, wait_for_dom_quiet, stats as wait_stats
+
+# How long a freshly loaded review page takes to stop changing
+PAGE_SETTLE = AdaptiveTimeout(initial=10, floor=2, ceiling=30)
+# "more" and spoiler "reveal" links of truncated reviews
+EXPAND_LINKS = 'a.more-link, .collapsed-text a.reveal'
 
 def get_movie_id(movie_url):
     return hashlib.md5(movie_url.encode('utf-8')).hexdigest()
 
+@metrics.timed("consent")
 def close_consent_popup(driver):
     try:
         consent_btn = WebDriverWait(driver, 5).until(
@@ -18,120 +35,216 @@ def close_consent_popup(driver):
             ))
         )
         consent_btn.click()
-        time.sleep(1)
+        wait_for_dom_quiet(driver, timeout=3, label="consent")
     except Exception:
         pass
 
-def scrape_letterboxd_reviews(movie_urls: list, source_site: str = "letterboxd"):
-    options = uc.ChromeOptions()
-    # Uncomment for debugging
-    # options.add_argument("--headless=new")
-    options.add_argument("--disable-gpu")
-    driver = uc.Chrome(options=options)
+def letterboxd_page_url(movie_url, page_number):
+    base = re.sub(r'page/\d+/?$', '', movie_url.rstrip('/') + '/')
+    return base if page_number == 1 else f"{base}page/{page_number}/"
 
-    for movie_url in movie_urls:
-        driver.get(movie_url)
-        time.sleep(3)
-        close_consent_popup(driver)
+def review_row(review, movie_id, movie, source_site):
+    return Review(Movie.of(movie_id, movie["movie_name"], movie["movie_release_year"], source_site),
+                  review["reviewer_name"], review["review_date"], review["review_text"],
+                  review["star_rating"], review["likes_count"])
 
-        try:
-            movie_name = WebDriverWait(driver, 20).until(
-                EC.presence_of_element_located((By.XPATH, '//*[@id="content"]/div/div/section/header/div/h1/a'))
-            ).text
-            movie_release_year = driver.find_element(By.XPATH, '//*[@id="content"]/div/div/section/header/div/h1/small/a').text
-        except Exception as e:
-            print(f"Failed to extract movie name or release year for {movie_url}: {e}")
+def write_page(reviews, movie_id, movie, source_site, writer, progress):
+    """Hand the page's unseen reviews to the writer, up to the 200-review cap.
+
+    Updates `progress` (a checkpoint from CheckpointStore.load) in place and
+    returns the hashes of the reviews written.
+    """
+    new_hashes = []
+    for review in reviews:
+        if progress["review_count"] >= 200:
+            break
+        h = review_hash(review["reviewer_name"], review["review_text"])
+        if h in progress["seen"] or not review["review_text"]:
             continue
+        progress["seen"].add(h)
+        new_hashes.append(h)
+        writer.add(review_row(review, movie_id, movie, source_site))
+        progress["review_count"] += 1
+    return new_hashes
 
-        movie_id = get_movie_id(movie_url)
-        reviews_scraped = 0
+def save_checkpoint(checkpoints, writer, movie_id, movie_url, page_number, progress, new_hashes, done=False):
+    # Only record the page once its reviews are actually stored
+    flush_for_checkpoint(writer, progress)
+    checkpoints.save(movie_id, movie_url=movie_url, page=page_number, review_count=progress["review_count"],
+                     new_hashes=new_hashes, done=done)
+    progress["page"] = page_number
 
-        review_boxes_xpath = '//*[@id="content"]/div/div/section/div[3]/div'
-        next_button_xpath = '//*[@id="content"]/div/div/section/div[4]/div[2]/a'
+def scrape_movie_http(session, extractor, movie_url, source_site, writer, checkpoints, progress, prefetch=4):
+    """Scrape one movie over plain HTTP, downloading the next pages while parsing the current one.
 
-        while reviews_scraped < 200:
-            try:
-                WebDriverWait(driver, 20).until(
-                    EC.presence_of_all_elements_located((By.XPATH, review_boxes_xpath))
-                )
-                review_boxes = driver.find_elements(By.XPATH, review_boxes_xpath)
-                print(f"Scraping {movie_name}: Page reviews found: {len(review_boxes)}")
-            except Exception as e:
-                print(f"Error finding review boxes: {e}")
-                break
+    Starts after the last checkpointed page. Returns the page that hit a bot
+    check or a network error and should be retried in the browser, or None
+    when done.
+    """
+    movie_id = get_movie_id(movie_url)
+    movie = None
+    page_number = progress["page"] + 1
+    try:
+        pages = iter_pages(session, lambda n: letterboxd_page_url(movie_url, n),
+                           first_page=page_number, prefetch=prefetch)
+        for page_number, html in pages:
+            with metrics.stage("extract"):
+                tree = extractor.parse(html)
+                if movie is None:
+                    movie = extractor.extract_movie(tree)
+                reviews = extractor.extract_reviews(tree, movie_url)
+            if not movie["movie_name"]:
+                raise ChallengeError(f"No movie header on {movie_url}")
+            print(f"Scraping {movie['movie_name']}: Page {page_number} reviews found: {len(reviews)}")
+            fetch_full_texts(session, reviews, movie_url, extractor.extract_full_text)
+            new_hashes = write_page(reviews, movie_id, movie, source_site, writer, progress)
 
-            for box in review_boxes:
-                if reviews_scraped >= 200:
-                    break
-                try:
-                    reviewer_name = box.find_element(By.XPATH, './/strong[contains(@class,"displayname")]').text
-                    review_date = box.find_element(By.XPATH, './/time').text
-
-                    try:
-                        more_btn = box.find_element(By.XPATH, './/a[contains(@class,"more-link")]')
-                        driver.execute_script("arguments[0].click();", more_btn)
-                        time.sleep(0.3)
-                    except Exception:
-                        pass
-
-                    review_text = box.find_element(By.XPATH, './/div[contains(@class,"js-review-body")]//p').text
-
-                    try:
-                        rating_span = box.find_element(By.XPATH, './/span[contains(@class,"rating")]')
-                        class_str = rating_span.get_attribute("class")
-                        match = re.search(r'rated-(\d+)', class_str)
-                        star_rating = float(match.group(1)) / 2 if match else 0.0
-                    except Exception:
-                        star_rating = 0.0
-
-                    try:
-                        likes_span = box.find_element(By.XPATH, './/span[contains(@class,"_count_")]')
-                        likes_text = likes_span.text.strip()
-                        likes_count = int(''.join(filter(str.isdigit, likes_text))) if ''.join(filter(str.isdigit, likes_text)) else 0
-                    except Exception:
-                        likes_count = 0
-
-                    data = {
-                        "movie_id": movie_id,
-                        "reviewer_name": reviewer_name,
-                        "movie_name": movie_name,
-                        "movie_release_year": movie_release_year,
-                        "review_date": review_date,
-                        "review_text": review_text,
-                        "star_rating": star_rating,
-                        "likes_count": likes_count,
-                        "source_site": source_site,
-                        "language": "english"
-                    }
-                    insert_review(data)
-                    reviews_scraped += 1
-
-                except Exception as e:
-                    print(f"Error extracting review: {e}")
-                    print("Review HTML:", box.get_attribute('outerHTML'))
-                    continue
-
-            if reviews_scraped >= 200:
-                print(f"Collected 200 reviews for {movie_name}. Moving to next movie.")
+            if progress["review_count"] >= 200:
+                print(f"Collected 200 reviews for {movie['movie_name']}. Moving to next movie.")
+                save_checkpoint(checkpoints, writer, movie_id, movie_url, page_number, progress, new_hashes, done=True)
                 break
-
-            try:
-                next_button = driver.find_element(By.XPATH, next_button_xpath)
-                driver.execute_script("arguments[0].scrollIntoView();", next_button)
-                time.sleep(0.5)
-                if "disabled" in next_button.get_attribute("class"):
-                    print("Next button is disabled. No more pages.")
-                    break
-                next_button.click()
-                time.sleep(2)
-            except Exception:
-                print("No more pages or next button not found.")
+            if not extractor.next_page_url(tree):
+                print("No more pages.")
+                save_checkpoint(checkpoints, writer, movie_id, movie_url, page_number, progress, new_hashes, done=True)
                 break
+            save_checkpoint(checkpoints, writer, movie_id, movie_url, page_number, progress, new_hashes)
+        else:
+            # Ran past the last page (404): nothing left to fetch
+            checkpoints.mark_done(movie_id, progress["review_count"])
+    except (ChallengeError, requests.RequestException) as e:
+        print(f"{e}; switching to the browser")
+        return getattr(e, "page", page_number)
+    return None
+
+def scrape_movie_browser(driver, extractor, movie_url, source_site, writer, checkpoints, progress, start_page=1):
+    limiter.acquire(movie_url)
+    with metrics.stage("navigation"):
+        driver.get(letterboxd_page_url(movie_url, start_page))
+    wait_for_dom_quiet(driver, timeout=PAGE_SETTLE, label="page_load")
+    if pool.first_visit(driver, "letterboxd"):
+        close_consent_popup(driver)
 
     try:
-        driver.quit()
-    except Exception:
-        pass
+        WebDriverWait(driver, 20).until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, '.js-review-body'))
+        )
+    except Exception as e:
+        # Usually a bot check rather than a movie without reviews
+        limiter.report(movie_url, page_outcome(driver.page_source, 0))
+        print(f"Error finding review boxes for {movie_url}: {e}")
+        return
+
+    with metrics.stage("extract"):
+        html = driver.page_source
+        tree = extractor.parse(html)
+        movie = extractor.extract_movie(tree)
+    if not movie["movie_name"]:
+        print(f"Failed to extract movie name or release year for {movie_url}")
+        return
+
+    movie_id = get_movie_id(movie_url)
+    page_number = start_page
+    session = None
+
+    while True:
+        with metrics.stage("extract"):
+            reviews = extractor.extract_reviews(tree, movie_url)
+        limiter.report(movie_url, page_outcome(html, len(reviews)))
+        if truncated(reviews):
+            # Fetch every full text at once with the browser's cookies; take
+            # the in-page "more" text only for reviews that could not be fetched
+            if session is None:
+                session = session_from_driver(driver)
+            leftovers = fetch_full_texts(session, reviews, movie_url, extractor.extract_full_text)
+            if leftovers:
+                limiter.acquire(movie_url)
+                if expand_all(driver, EXPAND_LINKS):
+                    with metrics.stage("extract"):
+                        tree = extractor.parse(driver.page_source)
+                        patch_expanded(leftovers, reviews, extractor.extract_reviews(tree, movie_url))
+        print(f"Scraping {movie['movie_name']}: Page reviews found: {len(reviews)}")
+        new_hashes = write_page(reviews, movie_id, movie, source_site, writer, progress)
+
+        if progress["review_count"] >= 200:
+            print(f"Collected 200 reviews for {movie['movie_name']}. Moving to next movie.")
+            save_checkpoint(checkpoints, writer, movie_id, movie_url, page_number, progress, new_hashes, done=True)
+            break
+
+        next_url = extractor.next_page_url(tree)
+        if not next_url:
+            print("No more pages or next button not found.")
+            save_checkpoint(checkpoints, writer, movie_id, movie_url, page_number, progress, new_hashes, done=True)
+            break
+        save_checkpoint(checkpoints, writer, movie_id, movie_url, page_number, progress, new_hashes)
+
+        limiter.acquire(movie_url)
+        with metrics.stage("navigation"):
+            driver.get(urljoin(driver.current_url, next_url))
+        wait_for_dom_quiet(driver, timeout=PAGE_SETTLE, label="pagination")
+        with metrics.stage("extract"):
+            html = driver.page_source
+            tree = extractor.parse(html)
+        page_number += 1
+
+def scrape_letterboxd_reviews(movie_urls: list, source_site: str = "letterboxd", writer=None,
+        user_data_dir=None, mode="http", prefetch=4, checkpoints=None, lean=False):
+    """Scrape Letterboxd reviews.
+
+    mode="http" fetches the server-rendered review pages directly and only
+    starts Chrome for movies that hit a bot check; mode="browser" always
+    drives Chrome. lean=True runs that Chrome headless with images, fonts
+    and ad/tracker hosts blocked. Progress is checkpointed per page, so a
+    rerun picks up where the last one stopped and skips finished movies.
+    """
+    owns_writer = writer is None
+    if owns_writer:
+        writer = create_writer()
+    if checkpoints is None:
+        checkpoints = CheckpointStore()
+    session = create_session(pool_size=prefetch * 2) if mode == "http" else None
+    driver = None
+
+    extractor = LetterboxdExtractor()
+    total_scraped = 0
+
+    try:
+        for movie_url in movie_urls:
+            metrics.set_movie("letterboxd", movie_url)
+            progress = checkpoints.load(get_movie_id(movie_url))
+            if progress["done"]:
+                print(f"Skipping {movie_url}: already finished with {progress['review_count']} reviews")
+                continue
+            progress["failed"] = getattr(writer, "failed", 0)
+            already_scraped = progress["review_count"]
+            start_page = progress["page"] + 1
+
+            try:
+                if session is not None:
+                    start_page = scrape_movie_http(session, extractor, movie_url, source_site, writer,
+                                                   checkpoints, progress, prefetch=prefetch)
+                if start_page is not None:
+                    if driver is None:
+                        driver = pool.acquire(create_driver, user_data_dir=user_data_dir, lean=lean)
+                    else:
+                        driver = pool.checkup(driver)
+                    scrape_movie_browser(driver, extractor, movie_url, source_site, writer, checkpoints, progress,
+                                         start_page=start_page)
+            except (SelectorBroken, RowsDropped) as e:
+                # Left unfinished, so a rerun picks it up
+                print(f"Skipping the rest of {movie_url}: {e}")
+            total_scraped += progress["review_count"] - already_scraped
+    finally:
+        if driver is not None:
+            pool.release(driver)
+        if session is not None:
+            session.close()
+        if owns_writer:
+            writer.close()
+
+    print(wait_stats.report())
+    print(metrics.summary())
+    metrics.export()
+    return total_scraped
 
 if __name__ == "__main__":
     movie_urls = [
@@ -1,5 +1,11 @@
-from letterboxd import scrape_letterboxd_reviews
+from review_writer import create_writer
+from streaming import iter_reviews
 
 if __name__ == "__main__":
     movie_url = "https://letterboxd.com/film/the-dark-knight/reviews/by/activity/"
-    scrape_letterboxd_reviews(movie_url, max_pages=3)
+    with create_writer() as writer:
+        count = 0
+        for review in iter_reviews("letterboxd", movie_url, max_pages=3):
+            writer.add(review)
+            count += 1
+    print(f"Stored {count} reviews from the first 3 pages")
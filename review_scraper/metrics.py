@@ -0,0 +1,272 @@
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Histogram upper bounds in seconds, from a DOM read to a slow "load all"
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# Stages the scrapers time; wait covers every in-page wait from waits.py
+STAGES = ("navigation", "consent", "wait", "expand", "extract", "dedup", "insert", "aggregate")
+
+
+class Histogram:
+    """Prometheus-style histogram: per-bucket counts plus sum and count."""
+
+    def __init__(self, counts=None, total=0.0, count=0):
+        self.counts = list(counts) if counts else [0] * (len(BUCKETS) + 1)
+        self.sum = total
+        self.count = count
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.sum += other.sum
+        self.count += other.count
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile (None past the last bucket)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return None
+
+    def to_dict(self):
+        return {"buckets": self.counts, "sum": self.sum, "count": self.count}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["buckets"], data["sum"], data["count"])
+
+
+class MetricsRegistry:
+    """Per-stage timings and WebDriver/HTTP traffic for one scraping run.
+
+    Scrapers call `set_movie(site, url)` for each movie and wrap each stage
+    in `stage(name)`; code running on the same thread (waits, WebDriver
+    commands) is attributed to that site and movie without passing them
+    around. Histograms are kept per site and per movie, but only the
+    per-site ones are exported to Prometheus, to keep label cardinality
+    bounded; the JSON report has both.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.stages = defaultdict(Histogram)        # (site, stage)
+            self.movie_stages = defaultdict(Histogram)  # (site, movie, stage)
+            self.commands = defaultdict(int)            # (site, command)
+            self.bytes = defaultdict(int)               # (site, source)
+
+    def set_movie(self, site, movie_url=None):
+        """Attribute stages timed on this thread to `site` and `movie_url` until changed."""
+        self._local.context = (site, movie_url)
+
+    def current_site(self):
+        return getattr(self._local, "context", (None, None))[0]
+
+    def carry_context(self, fn):
+        """Wrap `fn` to run under this thread's site and movie, e.g. on a thread pool."""
+        context = getattr(self._local, "context", (None, None))
+
+        def run(*args, **kwargs):
+            self._local.context = context
+            return fn(*args, **kwargs)
+
+        return run
+
+    @contextmanager
+    def stage(self, name, site=None, movie=None):
+        """Time a stage. Stages may nest; each records only its own time."""
+        stack = self._local.__dict__.setdefault("stack", [])
+        stack.append(0.0)
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start_time
+            nested = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            self.observe(name, elapsed - nested, site, movie)
+
+    def timed(self, name):
+        """Decorator form of `stage`."""
+        def decorate(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.stage(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def observe(self, stage, seconds, site=None, movie=None):
+        current_site, current_movie = getattr(self._local, "context", (None, None))
+        if site is None:
+            site, movie = current_site or "unknown", movie or current_movie
+        with self._lock:
+            self.stages[(site, stage)].observe(seconds)
+            if movie:
+                self.movie_stages[(site, movie, stage)].observe(seconds)
+
+    def count_command(self, site, command, size=0, source="webdriver"):
+        with self._lock:
+            self.commands[(site, command)] += 1
+            if size:
+                self.bytes[(site, source)] += size
+
+    def instrument_driver(self, driver):
+        """Count every WebDriver command `driver` sends, and the text it gets back.
+
+        Commands are attributed to the site set on the calling thread.
+        """
+        execute = driver.execute
+
+        def counted_execute(driver_command, params=None):
+            response = execute(driver_command, params)
+            value = response.get("value") if isinstance(response, dict) else None
+            size = len(value.encode("utf-8")) if isinstance(value, str) else 0
+            self.count_command(self.current_site() or "unknown", driver_command, size)
+            return response
+
+        driver.execute = counted_execute
+        return driver
+
+    def snapshot(self):
+        """Plain-data copy, for sending from a worker process to the parent."""
+        with self._lock:
+            return {
+                "started": self.started,
+                "stages": [[site, stage, h.to_dict()] for (site, stage), h in self.stages.items()],
+                "movie_stages": [[site, movie, stage, h.to_dict()]
+                                 for (site, movie, stage), h in self.movie_stages.items()],
+                "commands": [[site, command, n] for (site, command), n in self.commands.items()],
+                "bytes": [[site, source, n] for (site, source), n in self.bytes.items()],
+            }
+
+    def merge(self, snapshot):
+        with self._lock:
+            self.started = min(self.started, snapshot["started"])
+            for site, stage, data in snapshot["stages"]:
+                self.stages[(site, stage)].merge(Histogram.from_dict(data))
+            for site, movie, stage, data in snapshot["movie_stages"]:
+                self.movie_stages[(site, movie, stage)].merge(Histogram.from_dict(data))
+            for site, command, n in snapshot["commands"]:
+                self.commands[(site, command)] += n
+            for site, source, n in snapshot["bytes"]:
+                self.bytes[(site, source)] += n
+
+    def _stage_summary(self, histogram):
+        return {
+            "count": histogram.count,
+            "seconds": round(histogram.sum, 3),
+            "p50": histogram.quantile(0.5),
+            "p90": histogram.quantile(0.9),
+            "p99": histogram.quantile(0.99),
+            "histogram": histogram.to_dict(),
+        }
+
+    def report(self):
+        """JSON-ready run report: per site and per movie stage timings, commands and bytes."""
+        with self._lock:
+            sites = defaultdict(lambda: {"stages": {}, "commands": {}, "bytes": {}, "movies": defaultdict(dict)})
+            for (site, stage), histogram in self.stages.items():
+                sites[site]["stages"][stage] = self._stage_summary(histogram)
+            for (site, movie, stage), histogram in self.movie_stages.items():
+                sites[site]["movies"][movie][stage] = self._stage_summary(histogram)
+            for (site, command), n in self.commands.items():
+                sites[site]["commands"][command] = n
+            for (site, source), n in self.bytes.items():
+                sites[site]["bytes"][source] = n
+            return {
+                "started": self.started,
+                "finished": time.time(),
+                "buckets": list(BUCKETS),
+                "sites": {site: dict(data, movies=dict(data["movies"])) for site, data in sites.items()},
+            }
+
+    def prometheus(self):
+        """Per-site metrics in the Prometheus text exposition format."""
+        lines = [
+            "# HELP cinedrift_stage_seconds Time spent in each scraper stage.",
+            "# TYPE cinedrift_stage_seconds histogram",
+        ]
+        with self._lock:
+            for (site, stage), histogram in sorted(self.stages.items()):
+                labels = f'site="{site}",stage="{stage}"'
+                cumulative = 0
+                for bound, count in zip(BUCKETS + (float("inf"),), histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'cinedrift_stage_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+                lines.append(f"cinedrift_stage_seconds_sum{{{labels}}} {histogram.sum:.6f}")
+                lines.append(f"cinedrift_stage_seconds_count{{{labels}}} {histogram.count}")
+            lines += [
+                "# HELP cinedrift_commands_total WebDriver commands and HTTP requests sent.",
+                "# TYPE cinedrift_commands_total counter",
+            ]
+            for (site, command), n in sorted(self.commands.items()):
+                lines.append(f'cinedrift_commands_total{{site="{site}",command="{command}"}} {n}')
+            lines += [
+                "# HELP cinedrift_bytes_total Page source and response bytes received.",
+                "# TYPE cinedrift_bytes_total counter",
+            ]
+            for (site, source), n in sorted(self.bytes.items()):
+                lines.append(f'cinedrift_bytes_total{{site="{site}",source="{source}"}} {n}')
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """One line per site: seconds and count per stage, slowest first."""
+        with self._lock:
+            by_site = defaultdict(list)
+            for (site, stage), histogram in self.stages.items():
+                by_site[site].append((histogram.sum, stage, histogram.count))
+            commands = defaultdict(int)
+            for (site, _), n in self.commands.items():
+                commands[site] += n
+            traffic = defaultdict(int)
+            for (site, _), n in self.bytes.items():
+                traffic[site] += n
+        lines = []
+        for site, stages in sorted(by_site.items()):
+            parts = ", ".join(f"{stage} {seconds:.1f}s/{count}" for seconds, stage, count in sorted(stages, reverse=True))
+            lines.append(f"{site}: {parts}; {commands[site]} commands, {traffic[site] / 1e6:.1f} MB")
+        return "\n".join(lines)
+
+    def export(self, directory=None):
+        """Write run-<time>.json and run-<time>.prom to `directory` (default $CINEDRIFT_METRICS_DIR).
+
+        Does nothing when neither is set. Returns the paths written.
+        """
+        directory = directory or os.getenv("CINEDRIFT_METRICS_DIR")
+        if not directory:
+            return []
+        os.makedirs(directory, exist_ok=True)
+        stem = os.path.join(directory, time.strftime("run-%Y%m%dT%H%M%S", time.localtime(self.started)))
+        with open(stem + ".json", "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=2)
+        with open(stem + ".prom", "w", encoding="utf-8") as f:
+            f.write(self.prometheus())
+        return [stem + ".json", stem + ".prom"]
+
+
+# Shared by every scraper in the process
+registry = MetricsRegistry()
@@ -0,0 +1,186 @@
+import argparse
+import re
+import unicodedata
+from collections import Counter, defaultdict, namedtuple
+
+import numpy as np
+
+# Shingles are hashed as base-_BASE numbers of their bytes, then permuted by
+# multiply-shift hashing, h(x) = (a * x + b) >> 32 with uint64 wraparound
+_BASE = np.uint64(1099511628211)
+_SHIFT = np.uint64(32)
+
+# "... more" / "…Read more" left at the end of a truncated review
+_MORE = re.compile(r"(?:\.\.\.|…)\s*(?:read\s+)?(?:more|full review)?\s*$")
+_NON_WORD = re.compile(r"[\W_]+")
+
+# A review that matches one already indexed: its key, estimated Jaccard
+# similarity, and where the earlier one came from
+Match = namedtuple("Match", "key similarity movie_id source_site")
+
+
+def normalize(text):
+    """Lowercase `text` and drop the "...more" tail, punctuation, emoji and repeated whitespace."""
+    text = unicodedata.normalize("NFKC", text or "").lower().strip()
+    text = _MORE.sub("", text)
+    return " ".join(_NON_WORD.sub(" ", text).split())
+
+
+def _false_rates(threshold, bands, rows, steps=50):
+    """Probability mass of pairs below `threshold` that collide, and above it that do not."""
+    def collide(s):
+        return 1 - (1 - s ** rows) ** bands
+    width = 1 / steps
+    false_positive = sum(collide((i + 0.5) * width * threshold) for i in range(steps)) * width * threshold
+    false_negative = sum(1 - collide(threshold + (i + 0.5) * width * (1 - threshold))
+                         for i in range(steps)) * width * (1 - threshold)
+    return false_positive, false_negative
+
+
+def lsh_params(threshold, num_perm):
+    """(bands, rows per band) whose S-curve best separates pairs at `threshold`."""
+    candidates = [(bands, num_perm // bands) for bands in range(1, num_perm + 1)]
+    return min(candidates, key=lambda params: sum(_false_rates(threshold, *params)))
+
+
+class NearDuplicateIndex:
+    """MinHash signatures of review texts, banded into an LSH table for sub-quadratic lookups.
+
+    Texts are normalized, cut into `shingle`-byte shingles and reduced
+    to `num_perm` minimum hashes. Two reviews collide in some band with
+    high probability once their shingle sets' Jaccard similarity passes
+    `threshold`; collisions are then checked against the signatures, so
+    only candidates sharing a band are ever compared. A review longer than
+    `head_chars` is also indexed by its opening `head_chars`, so a truncated
+    copy still matches the full text. Texts shorter than `min_chars` (after
+    normalizing) are not indexed: "great movie" from two people is not a
+    copy.
+
+    The index lives in memory and grows with every `add`; matches come
+    back with their movie and site, so callers can tell a repeat on the same
+    movie from the same text syndicated to another site.
+    """
+
+    def __init__(self, threshold=0.8, num_perm=128, shingle=5, min_chars=40, head_chars=200, seed=1):
+        self.threshold = threshold
+        self.shingle = shingle
+        self.min_chars = min_chars
+        self.head_chars = head_chars
+        rng = np.random.default_rng(seed)
+        self._a = (rng.integers(0, 2 ** 63, num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1))[:, None]
+        self._b = rng.integers(0, 2 ** 63, num_perm, dtype=np.uint64)[:, None]
+        self._weights = _BASE ** np.arange(shingle, dtype=np.uint64)
+        self.bands, self.rows = lsh_params(threshold, num_perm)
+        self._tables = [defaultdict(list) for _ in range(self.bands)]
+        # Per indexed review: (key, movie_id, source_site) and its signatures (full text, head or None)
+        self._docs = []
+        self._signatures = []
+
+    def __len__(self):
+        return len(self._docs)
+
+    def signatures(self, text):
+        """MinHash signatures of normalized `text` and of its opening `head_chars`.
+
+        (None, None) when the text is too short to index; the head is None
+        when the text is no longer than it.
+        """
+        if len(text) < self.min_chars:
+            return None, None
+        data = np.frombuffer(text.encode("utf-8"), dtype=np.uint8).astype(np.uint64)
+        shingles = np.lib.stride_tricks.sliding_window_view(data, self.shingle) @ self._weights
+        hashed = (self._a * shingles + self._b) >> _SHIFT
+        full = hashed.min(axis=1).astype(np.uint32)
+        if len(text) <= self.head_chars:
+            return full, None
+        # Shingles that start within the head; near enough for non-ASCII text too
+        head_shingles = max(1, len(text[:self.head_chars].encode("utf-8")) - self.shingle + 1)
+        return full, hashed[:, :head_shingles].min(axis=1).astype(np.uint32)
+
+    def _bands(self, signature):
+        rows = self.rows
+        return [signature[i * rows:(i + 1) * rows].tobytes() for i in range(self.bands)]
+
+    def _matches(self, full, head):
+        candidates = set()
+        for signature in (full, head):
+            if signature is not None:
+                for table, band in zip(self._tables, self._bands(signature)):
+                    candidates.update(table.get(band, ()))
+        matches = []
+        for doc in candidates:
+            similarity = self.similarity((full, head), self._signatures[doc])
+            if similarity >= self.threshold:
+                matches.append(Match(self._docs[doc][0], similarity, *self._docs[doc][1:]))
+        return sorted(matches, key=lambda match: -match.similarity)
+
+    def similarity(self, signatures, other):
+        """Estimated similarity of two reviews from their `signatures` pairs."""
+        (full, head), (other_full, other_head) = signatures, other
+        # Full against full, and the opening of each against the other's
+        # (a truncated copy may be no longer than the other's head)
+        head_pair = (full if head is None else head, other_full if other_head is None else other_head)
+        return max(float(np.mean(x == y)) for x, y in [(full, other_full), head_pair])
+
+    def query(self, text):
+        """Indexed reviews whose text is a near-duplicate of `text`, most similar first."""
+        return self.check(text)[1]
+
+    def check(self, text):
+        """(signatures, near-duplicates among indexed reviews) of `text`, without indexing it.
+
+        Pass the signatures to `index` once the review is kept.
+        """
+        full, head = self.signatures(normalize(text))
+        return (full, head), (self._matches(full, head) if full is not None else [])
+
+    def add(self, key, text, movie_id=None, source_site=None):
+        """Index a review and return its near-duplicates among those indexed before it."""
+        signatures, matches = self.check(text)
+        self.index(key, signatures, movie_id, source_site)
+        return matches
+
+    def index(self, key, signatures, movie_id=None, source_site=None):
+        """Index a review by the signatures `check` returned for it."""
+        full, head = signatures
+        if full is None:
+            return
+        doc = len(self._docs)
+        self._docs.append((key, movie_id, source_site))
+        self._signatures.append((full, head))
+        for signature in (full, head):
+            if signature is not None:
+                for table, band in zip(self._tables, self._bands(signature)):
+                    table[band].append(doc)
+
+
+if __name__ == "__main__":
+    from spool import COMMITTED, SEALED, read_segment, segments
+
+    parser = argparse.ArgumentParser(description="Near-duplicate reviews in spooled segments.")
+    parser.add_argument("--spool", default="spool", help="spool directory")
+    parser.add_argument("--threshold", type=float, default=0.8, help="Jaccard similarity that counts as a duplicate")
+    parser.add_argument("--examples", type=int, default=5)
+    args = parser.parse_args()
+
+    index = NearDuplicateIndex(threshold=args.threshold)
+    print(f"{index.bands} bands of {index.rows} rows")
+    kinds = Counter()
+    examples = []
+    reviews = 0
+    for path in segments(args.spool, COMMITTED) + segments(args.spool, SEALED):
+        for row in read_segment(path):
+            key = (row.get("source_site"), row.get("reviewer_name"), row.get("review_text", "")[:60])
+            matches = index.add(key, row.get("review_text"), row.get("movie_id"), row.get("source_site"))
+            reviews += 1
+            if not matches:
+                continue
+            match = matches[0]
+            kind = "same movie" if match.movie_id == row.get("movie_id") else "cross-site"
+            kinds[kind] += 1
+            if len(examples) < args.examples:
+                examples.append((kind, match.similarity, key, match.key))
+    print(f"{reviews} reviews, {len(index)} indexed: {kinds['same movie']} near-duplicates on the same movie, "
+          f"{kinds['cross-site']} matching another movie or site")
+    for kind, similarity, key, other in examples:
+        print(f"  {kind} {similarity:.2f}: {key} ~ {other}")
@@ -0,0 +1,375 @@
+import argparse
+import asyncio
+import importlib
+import threading
+import time
+from collections import defaultdict
+
+import requests
+
+from checkpoints import CheckpointStore, review_hash
+from driver_pool import pool
+from extractors import get_extractor
+from failures import SelectorBroken
+from full_text import fetch_full_texts, truncated
+from http_fetch import ChallengeError, create_session, fetch_html, iter_pages
+from metrics import registry as metrics
+from rate_limiter import limiter, page_outcome
+from review_writer import RowsDropped, create_writer, flush_for_checkpoint
+from runner import SITES, site_for_url
+
+_DONE = object()
+
+
+class Stage:
+    """One step of a Pipeline: `fn` applied to every item by `workers` concurrent tasks.
+
+    `fn` is a blocking function and runs on a worker thread, so stages (and
+    workers of one stage) overlap. It returns the item for the next stage,
+    or None to drop it; with fan_out=True it returns an iterable, whose
+    elements are pulled one at a time and each passed on. At most
+    `queue_size` items wait in front of a stage, so a slow stage holds back
+    the ones before it instead of letting work pile up in memory.
+    """
+
+    def __init__(self, name, fn, workers=1, queue_size=8, fan_out=False):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.queue_size = queue_size
+        self.fan_out = fan_out
+        self.items = 0
+        self.busy = 0.0
+        self._lock = threading.Lock()
+
+    def call(self, context, item, fn, *args):
+        """Run `fn(*args)` on the calling thread, attributed to `item`."""
+        if context is not None:
+            context(item)
+        start_time = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self.busy += time.perf_counter() - start_time
+
+
+class Pipeline:
+    """Stages joined by bounded asyncio queues.
+
+    `context(item)`, if given, runs on the worker thread before each call,
+    e.g. to set the metrics site and movie for that item.
+    """
+
+    def __init__(self, stages, context=None):
+        self.stages = stages
+        self.context = context
+
+    async def run(self, items):
+        queues = [asyncio.Queue(stage.queue_size) for stage in self.stages] + [None]
+        groups = [
+            [asyncio.create_task(self._work(stage, queues[i], queues[i + 1])) for _ in range(stage.workers)]
+            for i, stage in enumerate(self.stages)
+        ]
+
+        async def feed():
+            for item in items:
+                await queues[0].put(item)
+            # Shut the stages down in order, each once the one before has drained into it
+            for i, workers in enumerate(groups):
+                for _ in workers:
+                    await queues[i].put(_DONE)
+                await asyncio.gather(*workers)
+
+        tasks = [asyncio.create_task(feed())] + [task for workers in groups for task in workers]
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for task in pending:
+            task.cancel()
+        for task in done:
+            if task.exception():
+                raise task.exception()
+
+    async def _work(self, stage, inbox, outbox):
+        while True:
+            item = await inbox.get()
+            if item is _DONE:
+                return
+            stage.items += 1
+            if not stage.fan_out:
+                result = await asyncio.to_thread(stage.call, self.context, item, stage.fn, item)
+                await self._emit(outbox, result)
+                continue
+            results = await asyncio.to_thread(stage.call, self.context, item, lambda: iter(stage.fn(item)))
+            while True:
+                result = await asyncio.to_thread(stage.call, self.context, item, next, results, _DONE)
+                if result is _DONE:
+                    break
+                await self._emit(outbox, result)
+
+    @staticmethod
+    async def _emit(outbox, result):
+        if result is not None and outbox is not None:
+            await outbox.put(result)
+
+    def report(self):
+        return ", ".join(f"{stage.name} {stage.items} in {stage.busy:.1f}s/{stage.workers}" for stage in self.stages)
+
+
+class Page:
+    """One page (or API batch) of a movie's reviews on its way through a ReviewPipeline.
+
+    A page with number None marks the end of a movie; `count` then says how
+    many pages came before it.
+    """
+    __slots__ = ("movie_url", "number", "html", "movie", "reviews", "rows", "new_hashes", "count")
+
+    def __init__(self, movie_url, number, html=None, movie=None, reviews=None, count=0):
+        self.movie_url = movie_url
+        self.number = number
+        self.html = html
+        self.movie = movie
+        self.reviews = reviews
+        self.rows = None
+        self.new_hashes = []
+        self.count = count
+
+
+class ReviewPipeline:
+    """Scrapes one site's movies with the fetching, parsing and writing overlapped.
+
+    acquire -> extract -> normalize -> dedup -> sink, where acquire pulls
+    pages of `fetchers` movies at once (over HTTP; a browser site gets one
+    Chrome and so one fetcher), extract and normalize run on `parsers`
+    workers, and dedup and sink run one page at a time so the 200-review
+    cap and checkpoints stay exact. Checkpoints only advance over pages
+    stored without gaps. Movies that hit a bot check are handed to the
+    site's own scrape function afterwards.
+    """
+
+    def __init__(self, site, writer, checkpoints, fetchers=4, parsers=2, queue_size=8, lean=False):
+        if not hasattr(self, f"_{site}_pages"):
+            raise ValueError(f"No pipeline for {site}")
+        self.site = site
+        self.module = importlib.import_module(SITES[site][1])
+        self.extractor = get_extractor(site)
+        self.writer = writer
+        self.checkpoints = checkpoints
+        self.browser = site == "imdb"
+        self.fetchers = 1 if self.browser else fetchers
+        self.parsers = parsers
+        self.queue_size = queue_size
+        self.lean = lean
+        self.session = None if self.browser else create_session(pool_size=max(4, fetchers * 2))
+        self.driver = None
+        self.progress = {}
+        self.stored = {}
+        self.challenged = []
+        # Movies given up on: a selector stopped matching or their rows could not be stored
+        self.broken = set()
+        self._last_page = {}
+        self._sunk = defaultdict(set)
+        self._ended = {}
+
+    def run(self, movie_urls):
+        """Scrape `movie_urls`; returns the number of new reviews stored."""
+        jobs = []
+        for movie_url in movie_urls:
+            progress = self.checkpoints.load(self.module.get_movie_id(movie_url))
+            if progress["done"]:
+                print(f"Skipping {movie_url}: already finished with {progress['review_count']} reviews")
+                continue
+            self.progress[movie_url] = progress
+            self.stored[movie_url] = progress["review_count"]
+            jobs.append(movie_url)
+        already_stored = sum(self.stored.values())
+
+        pipeline = Pipeline([
+            Stage("acquire", self.acquire, self.fetchers, self.queue_size, fan_out=True),
+            Stage("extract", self.extract, self.parsers, self.queue_size),
+            Stage("normalize", self.normalize, self.parsers, self.queue_size),
+            Stage("dedup", self.dedup, 1, self.queue_size),
+            Stage("sink", self.sink, 1, self.queue_size),
+        ], context=lambda item: metrics.set_movie(self.site, getattr(item, "movie_url", item)))
+        try:
+            asyncio.run(pipeline.run(jobs))
+        finally:
+            if self.driver is not None:
+                pool.release(self.driver)
+            if self.session is not None:
+                self.session.close()
+        print(f"Pipeline stages: {pipeline.report()}")
+        total = sum(self.stored.values()) - already_stored
+
+        if self.challenged:
+            scrape = getattr(self.module, SITES[self.site][2])
+            total += scrape(self.challenged, writer=self.writer, checkpoints=self.checkpoints, lean=self.lean) or 0
+        return total
+
+    # Stages
+
+    def acquire(self, movie_url):
+        """Pages of one movie, then its end marker."""
+        count = 0
+        try:
+            for page in getattr(self, f"_{self.site}_pages")(movie_url):
+                yield page
+                count += 1
+                progress = self.progress[movie_url]
+                if (progress["review_count"] >= 200 or movie_url in self.broken
+                        or page.number >= self._last_page.get(movie_url, page.number + 1)):
+                    break
+        except (ChallengeError, requests.RequestException) as e:
+            print(f"{e}; leaving {movie_url} to the browser")
+            self.challenged.append(movie_url)
+            return
+        yield Page(movie_url, None, count=count)
+
+    def extract(self, page):
+        if page.html is None:
+            return page
+        if page.movie_url in self.broken:
+            return None
+        try:
+            with metrics.stage("extract"):
+                tree = self.extractor.parse(page.html)
+                page.movie = self.extractor.extract_movie(tree)
+                page.reviews = self.extractor.extract_reviews(tree, page.movie_url)
+        except SelectorBroken as e:
+            # Its missing page keeps it from being marked done
+            print(f"Skipping the rest of {page.movie_url}: {e}")
+            self.broken.add(page.movie_url)
+            return None
+        limiter.report(page.movie_url, page_outcome(page.html, len(page.reviews)))
+        page.html = None
+        if not page.movie["movie_name"]:
+            if page.movie_url not in self.challenged:
+                print(f"No movie header on {page.movie_url} page {page.number}; leaving it to the browser")
+                self.challenged.append(page.movie_url)
+            return None
+        if not self.extractor.next_page_url(tree):
+            self._last_page[page.movie_url] = min(page.number, self._last_page.get(page.movie_url, page.number))
+        if truncated(page.reviews) and self.session is not None and hasattr(self.extractor, "extract_full_text"):
+            fetch_full_texts(self.session, page.reviews, page.movie_url, self.extractor.extract_full_text)
+        return page
+
+    def normalize(self, page):
+        if page.number is None:
+            return page
+        movie_id = self.module.get_movie_id(page.movie_url)
+        page.rows = [
+            (review_hash(review["reviewer_name"], review["review_text"]),
+             self.module.review_row(review, movie_id, page.movie, self.site))
+            for review in page.reviews if review["review_text"].strip()
+        ]
+        page.reviews = None
+        return page
+
+    def dedup(self, page):
+        if page.number is None:
+            return page
+        progress = self.progress[page.movie_url]
+        rows = []
+        for digest, row in page.rows:
+            if progress["review_count"] >= 200:
+                break
+            if digest in progress["seen"]:
+                continue
+            progress["seen"].add(digest)
+            page.new_hashes.append(digest)
+            rows.append(row)
+            progress["review_count"] += 1
+        page.rows = rows
+        return page
+
+    def sink(self, page):
+        movie_url = page.movie_url
+        movie_id = self.module.get_movie_id(movie_url)
+        progress = self.progress[movie_url]
+        if page.number is None:
+            self._ended[movie_url] = page.count
+        else:
+            # Every earlier page is flushed already, so only this page's rows can be dropped
+            progress["failed"] = getattr(self.writer, "failed", 0)
+            self.writer.insert_many(page.rows)
+            # Only record the page once its reviews are actually stored
+            try:
+                flush_for_checkpoint(self.writer, progress)
+            except RowsDropped as e:
+                # The page stays missing from _sunk, so the movie is never marked done
+                print(f"Skipping the rest of {movie_url}: {e}")
+                self.broken.add(movie_url)
+                return None
+            self.stored[movie_url] += len(page.rows)
+            sunk = self._sunk[movie_url]
+            sunk.add(page.number)
+            while progress["page"] + 1 in sunk:
+                progress["page"] += 1
+            self.checkpoints.save(movie_id, movie_url=movie_url, page=progress["page"],
+                                  review_count=self.stored[movie_url], new_hashes=page.new_hashes)
+        if self._ended.get(movie_url) == len(self._sunk[movie_url]) and movie_url not in self.challenged:
+            self.checkpoints.mark_done(movie_id, self.stored[movie_url])
+            print(f"Scraped {self.stored[movie_url]} reviews for {movie_url}")
+        return None
+
+    # Page sources, one per site
+
+    def _letterboxd_pages(self, movie_url):
+        page_url = self.module.letterboxd_page_url
+        first_page = self.progress[movie_url]["page"] + 1
+        for number, html in iter_pages(self.session, lambda n: page_url(movie_url, n), first_page=first_page,
+                                       prefetch=2):
+            yield Page(movie_url, number, html)
+
+    def _rottentomatoes_pages(self, movie_url):
+        html = fetch_html(self.session, movie_url)
+        ems_id = self.module.find_ems_id(html)
+        if not ems_id:
+            raise ChallengeError(f"No EMS id on {movie_url}")
+        movie = {
+            "movie_name": self.module.rt_movie_name(movie_url),
+            "movie_release_year": self.extractor.extract_movie(self.extractor.parse(html))["movie_release_year"],
+        }
+        batches = self.module.iter_api_reviews(self.session, ems_id, movie_url)
+        for number, reviews in enumerate(batches, start=1):
+            yield Page(movie_url, number, movie=movie, reviews=reviews)
+
+    def _imdb_pages(self, movie_url):
+        if self.driver is None:
+            self.driver = pool.acquire(self.module.create_driver, lean=self.lean)
+        else:
+            self.driver = pool.checkup(self.driver)
+        html = self.module.load_movie_page(self.driver, movie_url)
+        if html is not None:
+            yield Page(movie_url, 1, html)
+
+
+def scrape_pipeline(site, movie_urls, writer=None, checkpoints=None, **options):
+    """Scrape one site's `movie_urls` through a ReviewPipeline; returns the number of new reviews."""
+    owns_writer = writer is None
+    if owns_writer:
+        writer = create_writer()
+    if checkpoints is None:
+        checkpoints = CheckpointStore()
+    try:
+        return ReviewPipeline(site, writer, checkpoints, **options).run(movie_urls)
+    finally:
+        if owns_writer:
+            writer.close()
+        print(metrics.summary())
+        metrics.export()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape movie reviews through the staged pipeline.")
+    parser.add_argument("urls", nargs="+", help="movie review URLs (Letterboxd, IMDb or Rotten Tomatoes)")
+    parser.add_argument("--fetchers", type=int, default=4, help="movies fetched at once (HTTP sites)")
+    parser.add_argument("--parsers", type=int, default=2, help="workers for extraction and normalization")
+    parser.add_argument("--lean", action="store_true", help="headless Chrome without heavy requests")
+    args = parser.parse_args()
+
+    by_site = defaultdict(list)
+    for url in args.urls:
+        by_site[site_for_url(url)].append(url)
+    for site, urls in by_site.items():
+        count = scrape_pipeline(site, urls, fetchers=args.fetchers, parsers=args.parsers, lean=args.lean)
+        print(f"{site}: {count} new reviews")
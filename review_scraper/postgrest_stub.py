@@ -0,0 +1,78 @@
+"""Local stand-in for the Supabase PostgREST endpoint.
+
+Accepts inserts on /rest/v1/<table> and keeps the rows in memory, so the
+writer path can be exercised without a real project:
+
+    python postgrest_stub.py 54321
+    SUPABASE_URL=http://127.0.0.1:54321 SUPABASE_KEY=local python letterboxd.py
+
+`fail_next` makes the next N requests answer 503, to exercise retries.
+"""
+import json
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class PostgrestStub:
+    def __init__(self, host="127.0.0.1", port=0):
+        self.tables = {}
+        self.requests = 0
+        self.fail_next = 0
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                with stub._lock:
+                    stub.requests += 1
+                    if stub.fail_next > 0:
+                        stub.fail_next -= 1
+                        self._reply(503, {"message": "stub: service unavailable"})
+                        return
+                    rows = json.loads(body or b"[]")
+                    if isinstance(rows, dict):
+                        rows = [rows]
+                    table = self.path.split("?")[0].rstrip("/").rsplit("/", 1)[-1]
+                    stub.tables.setdefault(table, []).extend(rows)
+                self._reply(201, rows)
+
+            def _reply(self, status, payload):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.url = f"http://{host}:{self.server.server_address[1]}"
+
+    def rows(self, table="reviews"):
+        with self._lock:
+            return list(self.tables.get(table, []))
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 54321
+    stub = PostgrestStub(port=port)
+    print(f"PostgREST stand-in listening on {stub.url}")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for table, rows in stub.tables.items():
+            print(f"{table}: {len(rows)} rows")
@@ -0,0 +1,139 @@
+import re
+import threading
+import time
+from urllib.parse import urlparse
+
+# Starting requests/second per site; the limiter adapts from here.
+DEFAULT_RATES = {
+    "letterboxd.com": 2.0,
+    "imdb.com": 1.0,
+    "rottentomatoes.com": 1.0,
+    "in.bookmyshow.com": 0.5,
+}
+
+OK = "ok"
+EMPTY = "empty"
+THROTTLED = "throttled"   # HTTP 429
+CHALLENGE = "challenge"   # bot check / captcha page
+
+
+# Markers of Cloudflare-style interstitials and other bot checks
+_CHALLENGE_MARKERS = re.compile(
+    r"cf-challenge|challenge-platform|cf_chl_|Just a moment\.\.\.|captcha-delivery|"
+    r"Attention Required!|verify you are human",
+    re.IGNORECASE,
+)
+
+
+def looks_like_challenge(html):
+    return bool(_CHALLENGE_MARKERS.search(html[:20000]))
+
+
+def page_outcome(html, review_count):
+    """Classify a loaded review page for DomainRateLimiter.report."""
+    if looks_like_challenge(html):
+        return CHALLENGE
+    return OK if review_count else EMPTY
+
+
+def domain_of(url):
+    host = urlparse(url).netloc.lower() if "//" in url else url.lower()
+    host = host.split(":")[0]
+    for domain in DEFAULT_RATES:
+        if host == domain or host.endswith("." + domain):
+            return domain
+    return host[4:] if host.startswith("www.") else host
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, holding at most `burst`."""
+
+    def __init__(self, rate, burst=2.0):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def take(self):
+        """Take a token if one is available; otherwise return how long to wait."""
+        now = time.monotonic()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class DomainRateLimiter:
+    """One token bucket per site, tuned by how the site responds (AIMD).
+
+    Every `increase_after` healthy responses in a row raise the rate by
+    `step`, up to `max_rate`. A challenge, 429 or empty page halves it (not
+    below `min_rate`) and pauses the domain for a cooldown that doubles with
+    each consecutive bad response.
+    """
+
+    def __init__(self, rates=None, min_rate=0.05, max_rate=10.0, step=0.25,
+                 increase_after=5, cooldown=5.0, max_cooldown=300.0):
+        self.rates = dict(DEFAULT_RATES, **(rates or {}))
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.step = step
+        self.increase_after = increase_after
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self._buckets = {}
+        self._healthy_streak = {}
+        self._bad_streak = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, domain):
+        if domain not in self._buckets:
+            self._buckets[domain] = TokenBucket(self.rates.get(domain, 1.0))
+            self._healthy_streak[domain] = 0
+            self._bad_streak[domain] = 0
+        return self._buckets[domain]
+
+    def acquire(self, url):
+        """Block until a request to `url`'s site is allowed. Returns seconds waited."""
+        domain = domain_of(url)
+        waited = 0.0
+        while True:
+            with self._lock:
+                delay = self._bucket(domain).take()
+            if delay <= 0:
+                return waited
+            time.sleep(delay)
+            waited += delay
+
+    def report(self, url, outcome):
+        """Feed back how a request went: OK, EMPTY, THROTTLED or CHALLENGE."""
+        domain = domain_of(url)
+        with self._lock:
+            bucket = self._bucket(domain)
+            if outcome == OK:
+                self._bad_streak[domain] = 0
+                self._healthy_streak[domain] += 1
+                if self._healthy_streak[domain] >= self.increase_after:
+                    self._healthy_streak[domain] = 0
+                    bucket.rate = min(self.max_rate, bucket.rate + self.step)
+                return
+            self._healthy_streak[domain] = 0
+            self._bad_streak[domain] += 1
+            bucket.rate = max(self.min_rate, bucket.rate / 2)
+            bucket.tokens = 0
+            pause = min(self.max_cooldown, self.cooldown * 2 ** (self._bad_streak[domain] - 1))
+            bucket.blocked_until = time.monotonic() + pause
+        print(f"{domain}: {outcome} response, backing off {pause:.1f}s at {bucket.rate:.2f} req/s")
+
+    def rate(self, url):
+        with self._lock:
+            return self._bucket(domain_of(url)).rate
+
+
+# Shared by every scraper in the process
+limiter = DomainRateLimiter()
@@ -0,0 +1,100 @@
+import sys
+import threading
+import weakref
+
+# Columns of the `movies` table and of a review row that references it
+MOVIE_FIELDS = ("movie_id", "movie_name", "movie_release_year", "source_site", "language")
+REVIEW_FIELDS = ("reviewer_name", "review_date", "review_text", "star_rating", "likes_count")
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class Movie:
+    """The movie-level fields every review of one movie on one site shares.
+
+    Get instances through `Movie.of`, which hands out one shared object per
+    distinct movie for as long as any review still refers to it.
+    """
+    __slots__ = MOVIE_FIELDS + ("__weakref__",)
+
+    _interned = weakref.WeakValueDictionary()
+    _lock = threading.Lock()
+
+    def __init__(self, movie_id, movie_name, movie_release_year, source_site, language="english"):
+        self.movie_id = _intern(movie_id)
+        self.movie_name = _intern(movie_name)
+        self.movie_release_year = _intern(movie_release_year)
+        self.source_site = _intern(source_site)
+        self.language = _intern(language)
+
+    @classmethod
+    def of(cls, movie_id, movie_name, movie_release_year, source_site, language="english"):
+        key = (movie_id, movie_name, movie_release_year, source_site, language)
+        with cls._lock:
+            movie = cls._interned.get(key)
+            if movie is None:
+                movie = cls._interned[key] = cls(*key)
+            return movie
+
+    def as_row(self):
+        return {field: getattr(self, field) for field in MOVIE_FIELDS}
+
+    def __reduce__(self):
+        # Unpickled copies (e.g. rows sent from runner workers) are interned again
+        return Movie.of, tuple(getattr(self, field) for field in MOVIE_FIELDS)
+
+    def __repr__(self):
+        return f"Movie({self.movie_id!r}, {self.movie_name!r}, {self.source_site!r})"
+
+
+class Review:
+    """One scraped review: a shared Movie plus the per-review fields.
+
+    `get` reads like the row dict it replaces, so code that looks up row
+    keys (dedup keys, site labels) takes either. `as_row` is the full
+    denormalized row, `slim_row` the one for a normalized `reviews` table.
+    """
+    __slots__ = ("movie",) + REVIEW_FIELDS
+
+    def __init__(self, movie, reviewer_name, review_date, review_text, star_rating=0.0, likes_count=0):
+        self.movie = movie
+        self.reviewer_name = reviewer_name
+        self.review_date = review_date
+        self.review_text = review_text
+        self.star_rating = star_rating
+        self.likes_count = likes_count
+
+    @classmethod
+    def from_row(cls, row):
+        """Review from a denormalized row dict (spool segments, old callers)."""
+        movie = Movie.of(*(row.get(field, "") for field in MOVIE_FIELDS[:4]), row.get("language") or "english")
+        return cls(movie, *(row.get(field) for field in REVIEW_FIELDS))
+
+    def get(self, key, default=None):
+        if key in REVIEW_FIELDS:
+            return getattr(self, key)
+        if key in MOVIE_FIELDS:
+            return getattr(self.movie, key)
+        return default
+
+    def slim_row(self):
+        row = {"movie_id": self.movie.movie_id}
+        for field in REVIEW_FIELDS:
+            row[field] = getattr(self, field)
+        return row
+
+    def as_row(self):
+        row = self.movie.as_row()
+        for field in REVIEW_FIELDS:
+            row[field] = getattr(self, field)
+        return row
+
+    def __repr__(self):
+        return f"Review({self.movie.movie_name!r}, {self.reviewer_name!r}, {self.review_text[:40]!r})"
+
+
+def as_row(row):
+    """Plain dict for a Review or a row dict, e.g. to serialize it."""
+    return row.as_row() if isinstance(row, Review) else row
@@ -0,0 +1,310 @@
+import atexit
+import os
+import queue
+import random
+import threading
+import time
+from collections import defaultdict
+
+from dedup_index import ReviewDedupIndex, review_key
+from metrics import registry as metrics
+from records import Review
+
+_STOP = object()
+_FLUSH = object()
+
+# Postgres error classes that will fail the same way on every retry:
+# 22 data exception, 23 constraint violation, 42 bad column / syntax.
+_PERMANENT_ERROR_CLASSES = ("22", "23", "42")
+
+
+def is_transient(error):
+    """Guess whether a failed insert is worth retrying.
+
+    postgrest puts a SQLSTATE in `code` when the database rejected the
+    rows, but the HTTP status when the response was not JSON (a proxy's
+    429 or 502 page, say). Errors without a code are network errors.
+    """
+    code = str(getattr(error, "code", "") or "")
+    if len(code) == 5:
+        return not code.startswith(_PERMANENT_ERROR_CLASSES)
+    if code.isdigit() and len(code) == 3:
+        return code in ("408", "429") or code.startswith("5")
+    return True
+
+
+class RowsDropped(Exception):
+    """The writer gave up on rows that a checkpoint was about to cover."""
+
+
+def flush_for_checkpoint(writer, progress):
+    """Flush `writer` ahead of a checkpoint, raising RowsDropped if it gave up on any rows.
+
+    progress["failed"] is the writer's `failed` count when the movie
+    started or was last checkpointed. Rows dropped since then, possibly
+    in a background write before this flush, leave the checkpoint unsaved
+    and the movie unfinished, so a rerun fetches them again.
+    """
+    writer.flush()
+    failed = getattr(writer, "failed", 0)
+    lost = failed - progress.get("failed", failed)
+    progress["failed"] = failed
+    if lost > 0:
+        raise RowsDropped(f"{lost} reviews could not be stored")
+
+
+class ReviewWriter:
+    """Buffers review rows and writes them to Supabase in bulk from a background thread.
+
+    A batch is flushed when it reaches `batch_size` rows or when its oldest row
+    has waited `flush_interval` seconds. `add` blocks once `max_queue` rows are
+    waiting, so a slow database slows the scraper down instead of eating memory.
+    Failed batches are retried with exponential backoff; `close` (also run at
+    interpreter exit) flushes whatever is left.
+
+    Before each insert the batch is checked against `dedup`, a persistent
+    ReviewDedupIndex shared by every scraper, so reviews stored by an earlier
+    run are not sent again. Pass dedup=False to turn this off.
+
+    Every batch that is stored is also folded into `aggregates`, an
+    AggregateStore of per-movie, per-site, per-day rating sums (one is
+    opened by default; aggregates=False turns this off).
+
+    With `near_duplicates`, a near_dup.NearDuplicateIndex, reviews whose
+    text nearly repeats one already written for the same movie (whitespace,
+    a "...more" cut, emoji, copy-paste under another name) are dropped too.
+    Matches on another movie or site, e.g. a critic syndicated to RT and
+    IMDb, are kept and counted in `cross_site`.
+
+    Rows are held as Review records (dicts are converted on `add`). By
+    default each is sent as a full row; with normalized=True each movie is
+    upserted once through `movie_fn` and reviews go out as slim rows that
+    reference it by movie_id.
+    """
+
+    def __init__(self, insert_fn=None, batch_size=100, flush_interval=2.0,
+                 max_queue=1000, max_retries=5, backoff=0.5, dedup=None, normalized=False, movie_fn=None,
+                 aggregates=None, near_duplicates=None):
+        if insert_fn is None:
+            from supabase_utils import insert_many
+            insert_fn = insert_many
+        if normalized and movie_fn is None:
+            from supabase_utils import upsert_movies
+            movie_fn = upsert_movies
+        self._owns_dedup = dedup is None
+        if dedup is None:
+            dedup = ReviewDedupIndex()
+        self.dedup = dedup if dedup is not False else None
+        self._owns_aggregates = aggregates is None
+        if aggregates is None:
+            from aggregates import AggregateStore
+            aggregates = AggregateStore()
+        self.aggregates = aggregates if aggregates is not False else None
+        self.insert_fn = insert_fn
+        self.normalized = normalized
+        self.movie_fn = movie_fn
+        self.near_duplicates = near_duplicates
+        self._movies_sent = set()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.written = 0
+        self.failed = 0
+        self.duplicates = 0
+        self.cross_site = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="review-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def add(self, row):
+        if self._closed:
+            raise RuntimeError("ReviewWriter is closed")
+        self._queue.put(row if isinstance(row, Review) else Review.from_row(row))
+
+    def insert_many(self, rows: list):
+        for row in rows:
+            self.add(row)
+
+    def flush(self):
+        """Write the pending batch now and block until every row added so far is written (or given up on)."""
+        self._queue.put(_FLUSH)
+        self._queue.join()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+        if self.dedup is not None:
+            if self._owns_dedup:
+                self.dedup.close()
+            else:
+                self.dedup.flush()
+        if self.aggregates is not None and self._owns_aggregates:
+            self.aggregates.close()
+        atexit.unregister(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _run(self):
+        batch = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                self._write(batch)
+                self._queue.task_done()
+                return
+            if item is _FLUSH:
+                self._write(batch)
+                batch = []
+                deadline = None
+                self._queue.task_done()
+                continue
+            if item is not None:
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+
+            if batch and (len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                self._write(batch)
+                batch = []
+                deadline = None
+
+    def _unseen(self, batch):
+        """Drop rows already in the dedup index (or repeated within the batch)."""
+        keys = [review_key(row) for row in batch]
+        rows, new_keys, batch_keys = [], [], set()
+        for row, key, seen in zip(batch, keys, self.dedup.contains_many(keys)):
+            if seen or key in batch_keys:
+                self.duplicates += 1
+                continue
+            batch_keys.add(key)
+            rows.append(row)
+            new_keys.append(key)
+        return rows, new_keys
+
+    def _distinct(self, rows, keys):
+        """Drop rows whose text nearly repeats a review already written for the same movie (or in the batch).
+
+        Returns the kept rows and keys, and the kept rows' signatures to
+        index once they are stored.
+        """
+        index = self.near_duplicates
+        kept, kept_keys, signatures, batch = [], [], [], defaultdict(list)
+        for i, row in enumerate(rows):
+            movie_id = row.movie.movie_id
+            row_signatures, matches = index.check(row.review_text)
+            if any(match.movie_id == movie_id for match in matches) or (
+                    row_signatures[0] is not None
+                    and any(index.similarity(row_signatures, other) >= index.threshold for other in batch[movie_id])):
+                self.duplicates += 1
+                continue
+            if matches:
+                self.cross_site += 1
+            if row_signatures[0] is not None:
+                batch[movie_id].append(row_signatures)
+            kept.append(row)
+            signatures.append(row_signatures)
+            if keys is not None:
+                kept_keys.append(keys[i])
+        return kept, kept_keys if keys is not None else None, signatures
+
+    def _payload(self, rows):
+        """(movie rows not sent yet, review rows) for one insert."""
+        if not self.normalized:
+            return [], [row.as_row() for row in rows]
+        movies = {row.movie.movie_id: row.movie for row in rows if row.movie.movie_id not in self._movies_sent}
+        return [movie.as_row() for movie in movies.values()], [row.slim_row() for row in rows]
+
+    def _write(self, batch):
+        if not batch:
+            return
+        # Whatever goes wrong, the batch is accounted for and flush() returns
+        try:
+            self._store(batch)
+        except Exception as e:
+            print(f"Dropping {len(batch)} reviews: {e}")
+            self.failed += len(batch)
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+
+    def _store(self, batch):
+        site = batch[0].movie.source_site
+        if self.dedup is not None:
+            with metrics.stage("dedup", site=site):
+                rows, keys = self._unseen(batch)
+        else:
+            rows, keys = batch, None
+        signatures = None
+        if self.near_duplicates is not None:
+            with metrics.stage("dedup", site=site):
+                rows, keys, signatures = self._distinct(rows, keys)
+        stored = False
+        for attempt in range(1, self.max_retries + 1):
+            if not rows:
+                break
+            try:
+                movies, payload = self._payload(rows)
+                with metrics.stage("insert", site=site):
+                    if movies:
+                        self.movie_fn(movies)
+                        self._movies_sent.update(movie["movie_id"] for movie in movies)
+                    self.insert_fn(payload)
+                self.written += len(rows)
+                if keys:
+                    self.dedup.add_many(keys)
+                stored = True
+                break
+            except Exception as e:
+                if attempt == self.max_retries or not is_transient(e):
+                    print(f"Dropping {len(rows)} reviews after {attempt} attempt(s): {e}")
+                    self.failed += len(rows)
+                    break
+                delay = self.backoff * 2 ** (attempt - 1)
+                delay += random.uniform(0, delay / 2)
+                print(f"Insert of {len(rows)} reviews failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+        if stored and signatures is not None:
+            # Like the dedup index, only rows that made it to the database
+            for row, row_signatures in zip(rows, signatures):
+                self.near_duplicates.index(row.reviewer_name, row_signatures, row.movie.movie_id,
+                                           row.movie.source_site)
+        if stored and self.aggregates is not None:
+            try:
+                with metrics.stage("aggregate", site=site):
+                    self.aggregates.add_many(rows)
+            except Exception as e:
+                print(f"Could not update rating aggregates ({e}); run aggregates.py rebuild")
+
+
+def create_writer():
+    """The sink scrapers use when none is passed in.
+
+    With CINEDRIFT_SPOOL set, rows go to a local Spool in that directory and
+    uploader.py ships them to Supabase; otherwise straight to a ReviewWriter.
+    CINEDRIFT_NORMALIZED=1 makes the ReviewWriter use the movies table;
+    CINEDRIFT_NEAR_DUP=<similarity, e.g. 0.8> makes it drop near-duplicates.
+    """
+    if os.getenv("CINEDRIFT_SPOOL"):
+        from spool import Spool
+        return Spool(os.environ["CINEDRIFT_SPOOL"])
+    near_duplicates = None
+    if os.getenv("CINEDRIFT_NEAR_DUP"):
+        from near_dup import NearDuplicateIndex
+        near_duplicates = NearDuplicateIndex(threshold=float(os.environ["CINEDRIFT_NEAR_DUP"]))
+    return ReviewWriter(normalized=os.getenv("CINEDRIFT_NORMALIZED") == "1", near_duplicates=near_duplicates)
@@ -1,22 +1,43 @@
 import time
 import hashlib
 import re
+from urllib.parse import urljoin
+import requests
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-import undetected_chromedriver as uc
-from supabase_utils import insert_review
+from review_writer import RowsDropped, create_writer, flush_for_checkpoint
+from browser import create_driver
+from driver_pool import pool
+from extractors import RottenTomatoesExtractor
+from failures import SelectorBroken
+from http_fetch import ChallengeError, create_session, fetch_html, fetch_json, session_from_driver
+from rate_limiter import limiter, page_outcome
+from checkpoints import CheckpointStore, review_hash
+from metrics import registry as metrics
+from records import Movie, Review
+from waits import AdaptiveTimeout, wait_for_count_growth, wait_for_dom_quiet, stats as wait_stats
+
+PAGE_SETTLE = AdaptiveTimeout(initial=8, floor=2, ceiling=30)
+# One "Load More" round-trip
+LOAD_MORE = AdaptiveTimeout(initial=4, floor=1, ceiling=15)
+
+# JSON endpoint the review page's "Load More" button calls (same origin), paged by cursor
+RT_REVIEWS_API = "/napi/movie/{ems_id}/reviews/all"
+# The movie's EMS id, embedded in the review page's JSON blobs and data attributes
+_EMS_ID = re.compile(r'"emsId"\s*:\s*"([0-9a-fA-F-]{36})"|data-ems-id="([0-9a-fA-F-]{36})"')
 
 def get_movie_id(movie_url):
     return hashlib.md5(movie_url.encode('utf-8')).hexdigest()
 
+@metrics.timed("consent")
 def close_consent_popup(driver):
     try:
         consent_btn = WebDriverWait(driver, 3).until(
             EC.element_to_be_clickable((By.XPATH, "//button[contains(text(),'Accept')]"))
         )
         consent_btn.click()
-        time.sleep(0.5)
+        wait_for_dom_quiet(driver, timeout=2, label="consent")
     except Exception:
         pass
 
@@ -35,36 +56,24 @@ def click_load_more_shadow(driver):
     except Exception:
         return False
 
+@metrics.timed("expand")
 def load_reviews_until(driver, min_reviews=200, max_attempts=30):
     review_containers_xpath = '//*[@id="reviews"]/div[1]/div'
+    current_count = len(driver.find_elements(By.XPATH, review_containers_xpath))
     attempts = 0
-    while attempts < max_attempts:
-        review_containers = driver.find_elements(By.XPATH, review_containers_xpath)
-        current_count = len(review_containers)
-        if current_count >= min_reviews:
-            break
+    while attempts < max_attempts and current_count < min_reviews:
+        limiter.acquire("rottentomatoes.com")
         loaded = click_load_more_shadow(driver)
         if not loaded:
             break
-        # Wait for new reviews to load, but don't sleep longer than needed
-        for _ in range(15):
-            time.sleep(0.25)
-            new_count = len(driver.find_elements(By.XPATH, review_containers_xpath))
-            if new_count > current_count:
-                break
+        # Returns as soon as the new reviews are in the DOM
+        new_count = wait_for_count_growth(driver, review_containers_xpath, current_count,
+                                          timeout=LOAD_MORE, label="load_more")
+        if new_count <= current_count:
+            break
+        current_count = new_count
         attempts += 1
 
-def extract_release_year(driver):
-    try:
-        release_date_elem = driver.find_element(By.XPATH, '//*[@id="main-page-content"]/div/aside/section/div[1]/ul/li[4]')
-        release_date_text = release_date_elem.text.strip()
-        match = re.search(r'(\d{4})', release_date_text)
-        if match:
-            return match.group(1)
-    except Exception:
-        pass
-    return ""
-
 def extract_review_rating_from_score_text(score_text, fresh_rotten=None):
     match = re.search(r'(\d+(\.\d+)?)/10', score_text)
     if match:
@@ -88,118 +97,204 @@ def extract_review_rating_from_score_text(score_text, fresh_rotten=None):
     else:
         return 0.0
 
-def process_reviews(driver, movie_url, source_site):
-    movie_name = movie_url.split("/m/")[1].split("/")[0].replace("_", " ").title()
-    movie_release_year = extract_release_year(driver)
+def rt_movie_name(movie_url):
+    return movie_url.split("/m/")[1].split("/")[0].replace("_", " ").title()
+
+def find_ems_id(html):
+    match = _EMS_ID.search(html or "")
+    return (match.group(1) or match.group(2)) if match else None
+
+def review_row(review, movie_id, movie, source_site):
+    star_rating = extract_review_rating_from_score_text(review["score_text"], review["fresh_rotten"])
+    return Review(Movie.of(movie_id, movie["movie_name"], movie["movie_release_year"], source_site),
+                  review["reviewer_name"], review["review_date"], review["review_text"],
+                  star_rating, review["likes_count"])
+
+def write_reviews(reviews, movie_url, movie_name, movie_release_year, source_site, writer, progress):
+    """Hand unseen reviews to the writer, up to 200 per movie.
+
+    Updates `progress` (a checkpoint from CheckpointStore.load) in place and
+    returns the hashes of the reviews written.
+    """
+    movie_id = get_movie_id(movie_url)
+    movie = {"movie_name": movie_name, "movie_release_year": movie_release_year}
+    # Reviews written by an interrupted run are in progress["seen"]
+    seen_reviews = progress["seen"]
+    new_hashes = []
+    for review in reviews:
+        if progress["review_count"] >= 200:
+            break
+        reviewer_name = review["reviewer_name"]
+        review_text = review["review_text"]
+
+        # Uniqueness
+        digest = review_hash(reviewer_name, review_text)
+        if digest in seen_reviews or not review_text:
+            continue
+        seen_reviews.add(digest)
+        new_hashes.append(digest)
+
+        writer.add(review_row(review, movie_id, movie, source_site))
+        progress["review_count"] += 1
+    return new_hashes
+
+def iter_api_reviews(session, ems_id, movie_url, page_size=20):
+    """Yield pages of review dicts from the reviews JSON endpoint, following its cursor."""
+    extractor = RottenTomatoesExtractor()
+    url = urljoin(movie_url, RT_REVIEWS_API.format(ems_id=ems_id))
+    cursor = None
+    while True:
+        params = {"pageCount": page_size}
+        if cursor:
+            params["after"] = cursor
+        data = fetch_json(session, url, params=params, referer=movie_url)
+        if not data:
+            return
+        with metrics.stage("extract"):
+            reviews = [extractor.review_from_json(item) for item in data.get("reviews") or []]
+        if not reviews:
+            return
+        yield reviews
+        page_info = data.get("pageInfo") or {}
+        cursor = page_info.get("endCursor")
+        if not page_info.get("hasNextPage") or not cursor:
+            return
+
+def scrape_movie_api(session, movie_url, html, source_site, writer, checkpoints, progress):
+    """Read a movie's reviews from the JSON endpoint instead of clicking "Load More".
+
+    `html` is the movie's review page, fetched over HTTP or taken from the
+    browser. Returns the number of new reviews, or None when the page has
+    no EMS id to call the endpoint with. Raises ChallengeError on a bot check.
+    """
+    ems_id = find_ems_id(html)
+    if not ems_id:
+        return None
+    extractor = RottenTomatoesExtractor()
+    movie_name = rt_movie_name(movie_url)
+    movie_release_year = extractor.extract_movie(extractor.parse(html))["movie_release_year"]
     movie_id = get_movie_id(movie_url)
-    reviews_scraped = 0
-    seen_reviews = set()
+    already_scraped = progress["review_count"]
+
+    for reviews in iter_api_reviews(session, ems_id, movie_url):
+        new_hashes = write_reviews(reviews, movie_url, movie_name, movie_release_year, source_site, writer, progress)
+        flush_for_checkpoint(writer, progress)
+        checkpoints.save(movie_id, movie_url=movie_url, review_count=progress["review_count"],
+                         new_hashes=new_hashes)
+        if progress["review_count"] >= 200:
+            break
+    checkpoints.mark_done(movie_id, progress["review_count"])
+
+    print(f"Completed {progress['review_count']} reviews for {movie_name} from the reviews API")
+    return progress["review_count"] - already_scraped
+
+def process_reviews(driver, movie_url, source_site, writer, checkpoints, progress):
+    movie_name = rt_movie_name(movie_url)
+    movie_id = get_movie_id(movie_url)
+    already_scraped = progress["review_count"]
 
     # Load reviews until at least 200 are visible or no more can be loaded
     load_reviews_until(driver, min_reviews=200, max_attempts=30)
 
-    review_containers_xpath = '//*[@id="reviews"]/div[1]/div'
-    review_containers = driver.find_elements(By.XPATH, review_containers_xpath)
-    total_reviews = len(review_containers)
+    # One snapshot of the fully loaded list instead of a find_element per field
+    extractor = RottenTomatoesExtractor()
+    with metrics.stage("extract"):
+        html = driver.page_source
+        tree = extractor.parse(html)
+        movie_release_year = extractor.extract_movie(tree)["movie_release_year"]
+        reviews = extractor.extract_reviews(tree, movie_url)
+    limiter.report(movie_url, page_outcome(html, len(reviews)))
+    new_hashes = write_reviews(reviews, movie_url, movie_name, movie_release_year, source_site, writer, progress)
 
-    for idx, review_box in enumerate(review_containers, start=1):
-        if reviews_scraped >= 200:
-            break
-        try:
-            # Expand "Full Review" if available
-            try:
-                full_review_btn = review_box.find_element(By.XPATH, './div[2]/p[2]/a')
-                driver.execute_script("arguments[0].click();", full_review_btn)
-                time.sleep(0.05)
-            except Exception:
-                pass
+    flush_for_checkpoint(writer, progress)
+    checkpoints.save(movie_id, movie_url=movie_url, scroll_offset=len(reviews), review_count=progress["review_count"],
+                     new_hashes=new_hashes, done=True)
 
-            # Review text
-            try:
-                review_text = review_box.find_element(By.XPATH, './div[2]/p[1]').text.strip()
-            except Exception:
-                review_text = ""
+    print(f"Completed {progress['review_count']} reviews for {movie_name}")
+    return progress["review_count"] - already_scraped
 
-            # Reviewer name
-            try:
-                reviewer_name = review_box.find_element(By.XPATH, './div[1]/div/a[1]').text.strip()
-            except Exception:
-                reviewer_name = ""
+def scrape_rotten_tomatoes_reviews(movie_urls: list, source_site: str = "rottentomatoes", writer=None,
+        user_data_dir=None, checkpoints=None, lean=False, mode="api"):
+    """Scrape Rotten Tomatoes critic reviews.
 
-            # Review date
-            try:
-                review_date = review_box.find_element(By.XPATH, './div[2]/p[2]/span').text.strip()
-            except Exception:
-                review_date = ""
+    mode="api" reads the reviews JSON endpoint page by page: over plain HTTP
+    first, then with the browser's cookies if the site wants a real browser,
+    and only clicks through "Load More" if neither works. mode="browser"
+    always uses the "Load More" button.
+    """
+    owns_writer = writer is None
+    if owns_writer:
+        writer = create_writer()
+    if checkpoints is None:
+        checkpoints = CheckpointStore()
+    session = create_session() if mode == "api" else None
+    driver = None
+    total_scraped = 0
 
-            # Score text (may contain numeric or letter grade)
-            try:
-                score_text = review_box.find_element(By.XPATH, './div[2]/p[2]').text.strip()
-            except Exception:
-                score_text = ""
+    try:
+        for movie_url in movie_urls:
+            metrics.set_movie("rottentomatoes", movie_url)
+            progress = checkpoints.load(get_movie_id(movie_url))
+            if progress["done"]:
+                print(f"Skipping {movie_url}: already finished with {progress['review_count']} reviews")
+                continue
+            progress["failed"] = getattr(writer, "failed", 0)
 
-            # Fresh/rotten icon
+            print(f"\nStarting scraping for: {movie_url}")
+            start_time = time.time()
+            already_scraped = progress["review_count"]
             try:
-                icon = review_box.find_element(By.XPATH, './/span[contains(@class, "review-icon")]')
-                icon_class = icon.get_attribute("class")
-                if "fresh" in icon_class:
-                    fresh_rotten = "fresh"
-                elif "rotten" in icon_class:
-                    fresh_rotten = "rotten"
-                else:
-                    fresh_rotten = None
-            except Exception:
-                fresh_rotten = None
-
-            # Convert to star_rating
-            star_rating = extract_review_rating_from_score_text(score_text, fresh_rotten)
-
-            # Uniqueness
-            review_hash = hashlib.md5((reviewer_name + review_text).encode('utf-8')).hexdigest()
-            if review_hash in seen_reviews or not review_text:
-                continue
-            seen_reviews.add(review_hash)
-
-            likes_count = 0
-
-            data = {
-                "movie_id": movie_id,
-                "reviewer_name": reviewer_name,
-                "movie_name": movie_name,
-                "movie_release_year": movie_release_year,
-                "review_date": review_date,
-                "review_text": review_text,
-                "star_rating": star_rating,
-                "likes_count": likes_count,
-                "source_site": source_site,
-                "language": "english"
-            }
-            insert_review(data)
-            reviews_scraped += 1
-
-        except Exception as e:
-            print(f"Error processing review {idx}: {e}")
-
-    print(f"Completed {reviews_scraped} reviews for {movie_name}")
-    return reviews_scraped
-
-def scrape_rotten_tomatoes_reviews(movie_urls: list, source_site: str = "rottentomatoes"):
-    options = uc.ChromeOptions()
-    # Uncomment for speed in headless environments:
-    # options.add_argument("--headless=new")
-    options.add_argument("--disable-gpu")
-    driver = uc.Chrome(options=options)
-
-    for movie_url in movie_urls:
-        driver.get(movie_url)
-        time.sleep(2)
-        close_consent_popup(driver)
-        print(f"\nStarting scraping for: {movie_url}")
-        start_time = time.time()
-        processed_count = process_reviews(driver, movie_url, source_site)
-        print(f"Finished {processed_count} reviews in {time.time()-start_time:.1f}s")
-
-    driver.quit()
+                processed_count = None
+                if session is not None:
+                    try:
+                        html = fetch_html(session, movie_url)
+                        processed_count = scrape_movie_api(session, movie_url, html, source_site, writer, checkpoints,
+                                                           progress)
+                    except (ChallengeError, requests.RequestException) as e:
+                        print(f"{e}; switching to the browser")
+
+                if processed_count is None:
+                    if driver is None:
+                        driver = pool.acquire(create_driver, user_data_dir=user_data_dir, lean=lean)
+                    else:
+                        # The last movie's "Load More" rounds may have left the tab bloated
+                        driver = pool.checkup(driver)
+                    limiter.acquire(movie_url)
+                    with metrics.stage("navigation"):
+                        driver.get(movie_url)
+                    wait_for_dom_quiet(driver, timeout=PAGE_SETTLE, label="page_load")
+                    if pool.first_visit(driver, "rottentomatoes"):
+                        close_consent_popup(driver)
+                    if mode == "api":
+                        browser_session = session_from_driver(driver)
+                        try:
+                            processed_count = scrape_movie_api(browser_session, movie_url, driver.page_source,
+                                                               source_site, writer, checkpoints, progress)
+                        except (ChallengeError, requests.RequestException) as e:
+                            print(f"{e}; loading reviews in the page instead")
+                        finally:
+                            browser_session.close()
+                    if processed_count is None:
+                        process_reviews(driver, movie_url, source_site, writer, checkpoints, progress)
+            except (SelectorBroken, RowsDropped) as e:
+                # Left unfinished, so a rerun picks it up
+                print(f"Skipping the rest of {movie_url}: {e}")
+            # An endpoint attempt cut short by a bot check may already have written some reviews
+            processed_count = progress["review_count"] - already_scraped
+            print(f"Finished {processed_count} reviews in {time.time()-start_time:.1f}s")
+            total_scraped += processed_count
+    finally:
+        if driver is not None:
+            pool.release(driver)
+        if session is not None:
+            session.close()
+        if owns_writer:
+            writer.close()
+
+    print(wait_stats.report())
+    print(metrics.summary())
+    metrics.export()
+    return total_scraped
 
 if __name__ == "__main__":
     movie_urls = [
@@ -0,0 +1,240 @@
+import argparse
+import importlib
+import itertools
+import multiprocessing
+import multiprocessing.util
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from urllib.parse import urlparse
+
+from metrics import registry as metrics
+from review_writer import create_writer
+
+# site -> (domain, module, scrape function)
+SITES = {
+    "letterboxd": ("letterboxd.com", "letterboxd", "scrape_letterboxd_reviews"),
+    "imdb": ("imdb.com", "IMDb", "scrape_imdb_reviews"),
+    "rottentomatoes": ("rottentomatoes.com", "rotten_tomatoes", "scrape_rotten_tomatoes_reviews"),
+    "bookmyshow": ("bookmyshow.com", "BookMyShow", "scrape_bookmyshow_reviews"),
+}
+
+_STOP = None
+# Sent as (_FLUSH, pid, seq) by QueueSink.flush
+_FLUSH = "flush"
+
+# Set in each worker process by _init_worker
+_sink_queue = None
+_flush_acks = None
+# Per process, not per QueueSink: a pool worker keeps its pid across jobs
+_flush_seq = itertools.count(1)
+_profile_dir = None
+_lean = False
+
+
+def site_for_url(url):
+    host = urlparse(url).netloc.lower()
+    for site, (domain, _, _) in SITES.items():
+        if host == domain or host.endswith("." + domain):
+            return site
+    raise ValueError(f"No scraper for {url}")
+
+
+class QueueSink:
+    """Writer stand-in for worker processes: forwards rows to the parent's writer.
+
+    `flush` puts a token behind the rows and blocks until the parent has
+    flushed its writer past it, so a checkpoint saved afterwards never
+    covers rows that are still in the queue. `failed` is the parent
+    writer's count of rows given up on, as of the last flush.
+    """
+
+    def __init__(self, sink_queue, acks=None):
+        self.sink_queue = sink_queue
+        # (acks dict proxy, condition proxy) shared with the parent
+        self.acks = acks
+        self.failed = acks[0].get("failed", 0) if acks else 0
+
+    def add(self, row):
+        self.sink_queue.put(row)
+
+    def insert_many(self, rows: list):
+        for row in rows:
+            self.add(row)
+
+    def flush(self):
+        if self.acks is None:
+            return
+        acks, condition = self.acks
+        pid = os.getpid()
+        seq = next(_flush_seq)
+        self.sink_queue.put((_FLUSH, pid, seq))
+        with condition:
+            condition.wait_for(lambda: acks.get(pid, (0, 0))[0] >= seq)
+        self.failed = acks[pid][1]
+
+    def close(self):
+        pass
+
+
+def _init_worker(sink_queue, profile_root, lean=False, flush_acks=None):
+    global _sink_queue, _flush_acks, _profile_dir, _lean
+    _sink_queue = sink_queue
+    _flush_acks = flush_acks
+    _lean = lean
+    # One Chrome profile per worker process, reused for every movie it handles
+    _profile_dir = os.path.join(profile_root, f"worker-{os.getpid()}")
+    os.makedirs(_profile_dir, exist_ok=True)
+    # Metrics go back to the parent with each result; only the parent exports them
+    os.environ.pop("CINEDRIFT_METRICS_DIR", None)
+    # The worker's Chrome stays warm between movies; pool workers skip atexit, so quit it on the way out
+    from driver_pool import pool
+    multiprocessing.util.Finalize(None, pool.close, exitpriority=10)
+
+
+def _scrape_one(site, movie_url):
+    _, module_name, function_name = SITES[site]
+    scrape = getattr(importlib.import_module(module_name), function_name)
+    start_time = time.time()
+    try:
+        count = scrape([movie_url], writer=QueueSink(_sink_queue, _flush_acks),
+                       user_data_dir=_profile_dir, lean=_lean)
+        error = None
+    except Exception as e:
+        count, error = 0, str(e)
+    snapshot = metrics.snapshot()
+    metrics.reset()
+    return (site, movie_url, count or 0, time.time() - start_time, error), snapshot
+
+
+def _drain(sink_queue, writer, flush_acks):
+    acks, condition = flush_acks
+    while True:
+        row = sink_queue.get()
+        if row is _STOP:
+            return
+        if isinstance(row, tuple) and row[0] == _FLUSH:
+            # Everything the worker sent before the token is in the writer now
+            writer.flush()
+            _, pid, seq = row
+            with condition:
+                acks[pid] = (seq, getattr(writer, "failed", 0))
+                acks["failed"] = acks[pid][1]
+                condition.notify_all()
+            continue
+        writer.add(row)
+
+
+def run(movie_urls, workers=4, site_limits=None, writer=None, profile_root=None, metrics_dir=None,
+        lean=False):
+    """Scrape `movie_urls` (any mix of sites) on `workers` Chrome processes.
+
+    `site_limits` caps how many workers may hit one site at once, e.g.
+    {"imdb": 1}. Sites without a limit may use every worker. Rows from all
+    workers go through one writer in this process. Stage metrics from every
+    worker are merged here and written to `metrics_dir` (default
+    $CINEDRIFT_METRICS_DIR) at the end. lean=True starts every worker's
+    Chrome headless with images, fonts and ad/tracker hosts blocked.
+    """
+    site_limits = site_limits or {}
+    owns_writer = writer is None
+    if owns_writer:
+        writer = create_writer()
+    profile_root = profile_root or tempfile.mkdtemp(prefix="cinedrift-profiles-")
+
+    from browser import prepare_driver_binary
+    prepare_driver_binary()
+
+    pending = [(site_for_url(url), url) for url in movie_urls]
+    in_flight = {}
+    active = {site: 0 for site in SITES}
+    results = []
+
+    sink_queue = multiprocessing.Queue(maxsize=1000)
+    # Workers' flush tokens are acknowledged through these once the writer has stored the rows
+    manager = multiprocessing.Manager()
+    flush_acks = (manager.dict(), manager.Condition())
+    drain_thread = threading.Thread(target=_drain, args=(sink_queue, writer, flush_acks), daemon=True)
+    drain_thread.start()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(sink_queue, profile_root, lean, flush_acks)) as pool:
+        while pending or in_flight:
+            # Submit every job whose site still has a free slot
+            for job in list(pending):
+                if len(in_flight) >= workers:
+                    break
+                site = job[0]
+                if active[site] >= site_limits.get(site, workers):
+                    continue
+                pending.remove(job)
+                active[site] += 1
+                in_flight[pool.submit(_scrape_one, *job)] = site
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                active[in_flight.pop(future)] -= 1
+                result, snapshot = future.result()
+                metrics.merge(snapshot)
+                results.append(result)
+                site, movie_url, count, elapsed, error = result
+                if error:
+                    print(f"[{site}] {movie_url} failed after {elapsed:.1f}s: {error}")
+                else:
+                    print(f"[{site}] {movie_url}: {count} reviews in {elapsed:.1f}s")
+
+    sink_queue.put(_STOP)
+    drain_thread.join()
+    manager.shutdown()
+    if owns_writer:
+        writer.close()
+    print(metrics.summary())
+    for path in metrics.export(metrics_dir):
+        print(f"Metrics written to {path}")
+    return results
+
+
+def _parse_limits(values):
+    limits = {}
+    for value in values or []:
+        site, _, count = value.partition("=")
+        if site not in SITES:
+            raise argparse.ArgumentTypeError(f"Unknown site {site!r}")
+        limits[site] = max(1, int(count))
+    return limits
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape movie reviews from several sites in parallel.")
+    parser.add_argument("urls", nargs="*", help="movie review URLs (any supported site)")
+    parser.add_argument("--file", help="file with one movie URL per line")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--site-limit", action="append", metavar="SITE=N",
+                        help="max concurrent workers for one site, e.g. imdb=1")
+    parser.add_argument("--lean", action="store_true",
+                        help="headless Chrome without images, fonts or ad/tracker requests")
+    parser.add_argument("--metrics-dir", metavar="DIR",
+                        help="write a JSON run report and Prometheus metrics here")
+    parser.add_argument("--spool", metavar="DIR",
+                        help="write reviews to a local spool for uploader.py instead of Supabase")
+    args = parser.parse_args()
+
+    movie_urls = list(args.urls)
+    if args.file:
+        with open(args.file, encoding="utf-8") as f:
+            movie_urls += [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+    writer = None
+    if args.spool:
+        from spool import Spool
+        writer = Spool(args.spool)
+
+    start_time = time.time()
+    results = run(movie_urls, workers=args.workers, site_limits=_parse_limits(args.site_limit), writer=writer,
+                  metrics_dir=args.metrics_dir, lean=args.lean)
+    if writer is not None:
+        writer.close()
+    total = sum(result[2] for result in results)
+    print(f"Scraped {total} reviews from {len(results)} movies in {time.time()-start_time:.1f}s")
@@ -0,0 +1,159 @@
+import json
+import os
+import threading
+import time
+
+from records import as_row
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+DEFAULT_DIR = os.getenv("CINEDRIFT_SPOOL", "spool")
+
+# A segment is "<name>.open" while being written, "<name>.jsonl" once sealed
+# (fsync'd, ready to upload) and "<name>.committed" once the uploader has
+# stored every row in it.
+OPEN, SEALED, COMMITTED = ".open", ".jsonl", ".committed"
+
+
+class Spool:
+    """Append-only local log of review rows, split into JSONL segments.
+
+    Scrapers write here instead of to Supabase; uploader.py drains sealed
+    segments in bulk. Has the same add/insert_many/flush/close interface as
+    ReviewWriter, so it can be passed anywhere a writer is expected. A
+    segment is sealed once it holds `segment_rows` rows or is
+    `segment_seconds` old; `flush` fsyncs the open segment so checkpoints
+    never run ahead of what is on disk. The open segment stays flock'd
+    until it is sealed, which is how recover_stale tells it from one left
+    by a crashed scraper.
+    """
+
+    def __init__(self, directory=DEFAULT_DIR, segment_rows=1000, segment_seconds=30.0):
+        self.directory = directory
+        self.segment_rows = segment_rows
+        self.segment_seconds = segment_seconds
+        self.written = 0
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._sequence = 0
+        self._file = None
+        self._path = None
+        self._rows = 0
+        self._opened = 0.0
+
+    def _open_segment(self):
+        self._sequence += 1
+        name = f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{self._sequence:06d}"
+        self._path = os.path.join(self.directory, name + OPEN)
+        self._file = open(self._path, "ab")
+        if fcntl is not None:
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        self._rows = 0
+        self._opened = time.monotonic()
+
+    def _seal(self):
+        if self._file is None:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        if fcntl is None:
+            # Windows cannot rename an open file
+            self._file.close()
+        # Renamed while still locked, so recover_stale cannot seal it too
+        if self._rows:
+            os.replace(self._path, self._path[:-len(OPEN)] + SEALED)
+        else:
+            os.remove(self._path)
+        self._file.close()
+        self._file = None
+
+    def add(self, row):
+        self.insert_many([row])
+
+    def insert_many(self, rows: list):
+        data = b"".join(json.dumps(as_row(row), ensure_ascii=False).encode("utf-8") + b"\n" for row in rows)
+        with self._lock:
+            if self._file is None:
+                self._open_segment()
+            self._file.write(data)
+            self._rows += len(rows)
+            self.written += len(rows)
+            if self._rows >= self.segment_rows or time.monotonic() - self._opened >= self.segment_seconds:
+                self._seal()
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+
+    def close(self):
+        with self._lock:
+            self._seal()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def segments(directory=DEFAULT_DIR, suffix=SEALED):
+    """Segment paths with `suffix`, oldest first."""
+    if not os.path.isdir(directory):
+        return []
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(suffix))
+
+
+def read_segment(path):
+    """Rows in a segment. A torn last line from a crash mid-write is skipped."""
+    rows = []
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                print(f"Skipping unreadable line in {path}")
+    return rows
+
+
+def recover_stale(directory=DEFAULT_DIR, stale_after=600.0):
+    """Seal `.open` segments left behind by a crashed scraper. Returns how many were sealed.
+
+    A segment is abandoned when its lock can be taken, however recently it
+    was written, and never while its Spool is alive, however slow the
+    scrape. Without fcntl (Windows) a segment untouched for `stale_after`
+    seconds counts as abandoned.
+    """
+    recovered = 0
+    for path in segments(directory, OPEN):
+        if fcntl is None:
+            if time.time() - os.path.getmtime(path) >= stale_after:
+                os.replace(path, path[:-len(OPEN)] + SEALED)
+                recovered += 1
+            continue
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            continue  # sealed in the meantime
+        with f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                continue  # its scraper is still writing
+            # An empty one may belong to a Spool that has not locked it yet
+            if os.fstat(f.fileno()).st_size == 0:
+                continue
+            try:
+                os.replace(path, path[:-len(OPEN)] + SEALED)
+            except FileNotFoundError:
+                continue
+            recovered += 1
+    return recovered
+
+
+def mark_committed(path):
+    os.replace(path, path[:-len(SEALED)] + COMMITTED)
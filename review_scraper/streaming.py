@@ -0,0 +1,294 @@
+import argparse
+import importlib
+from datetime import date, datetime
+from itertools import count
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+
+from aggregates import review_day
+from checkpoints import review_hash
+from driver_pool import pool
+from extractors import get_extractor
+from full_text import expand_all, fetch_full_texts, truncated
+from http_fetch import ChallengeError, create_session, fetch_html
+from metrics import registry as metrics
+from rate_limiter import limiter, page_outcome
+from runner import SITES, site_for_url
+from waits import wait_for_count_growth, wait_for_dom_quiet
+
+
+def iter_reviews(site, movie_url, max_reviews=None, max_pages=None, since=None, lean=False):
+    """Yield one movie's reviews as Review records, a page at a time, as the pages load.
+
+    Nothing is written or checkpointed: the caller decides what to keep and
+    when to stop. A page (an HTTP page, an API batch, or one "load more" or
+    scroll of a browser list) is only fetched once the reviews before it
+    have been consumed, so breaking out of the loop, or hitting
+    `max_reviews` or `max_pages`, loads nothing further. `since` (a date,
+    datetime or "YYYY-MM-DD") switches to the site's newest-first listing,
+    skips reviews dated before it and stops after the page where the first
+    one appears; sites without such a listing raise ValueError. The rows
+    keep the scrapers' own movie_id and fields. A selector that stops
+    matching raises failures.SelectorBroken.
+    """
+    module = importlib.import_module(SITES[site][1])
+    movie_id = module.get_movie_id(movie_url)
+    cutoff = _day(since)
+    if cutoff:
+        if site not in _NEWEST_FIRST:
+            raise ValueError(f"{site} has no newest-first review listing to apply since={since!r} to")
+        movie_url = _NEWEST_FIRST[site](movie_url)
+    pages = _SOURCES[site](module, movie_url, lean)
+    seen = set()
+    yielded = 0
+    try:
+        for number, (movie, reviews) in enumerate(pages, start=1):
+            reached_cutoff = False
+            for review in reviews:
+                digest = review_hash(review["reviewer_name"], review["review_text"])
+                if not review["review_text"].strip() or digest in seen:
+                    continue
+                seen.add(digest)
+                row = module.review_row(review, movie_id, movie, site)
+                day = review_day(row.review_date)
+                if cutoff and day and day < cutoff:
+                    reached_cutoff = True
+                    continue
+                yield row
+                yielded += 1
+                if max_reviews is not None and yielded >= max_reviews:
+                    return
+            if reached_cutoff or (max_pages is not None and number >= max_pages):
+                return
+    finally:
+        # Releases the page source's browser or session right away
+        pages.close()
+
+
+def _day(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        value = value.date()
+    if isinstance(value, date):
+        return value.isoformat()
+    return review_day(value)
+
+
+# Listings sorted newest first, which `since` relies on to stop early
+
+def _letterboxd_by_added(movie_url):
+    base = movie_url.split("/reviews/")[0].rstrip("/")
+    return f"{base}/reviews/by/added/"
+
+
+def _imdb_by_date(movie_url):
+    parts = urlsplit(movie_url)
+    query = dict(parse_qsl(parts.query), sort="submission_date", dir="desc")
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+_NEWEST_FIRST = {
+    "letterboxd": _letterboxd_by_added,
+    "imdb": _imdb_by_date,
+    # Critic reviews are only ever listed newest first
+    "rottentomatoes": lambda movie_url: movie_url,
+}
+
+
+# Page sources: each yields (movie, review dicts) per page and loads the
+# next page only when asked for it
+
+def _letterboxd_pages(module, movie_url, lean):
+    extractor = get_extractor("letterboxd")
+    session = create_session(pool_size=2)
+    number = 1
+    try:
+        for number in count(1):
+            html = fetch_html(session, module.letterboxd_page_url(movie_url, number))
+            if html is None:
+                return
+            with metrics.stage("extract"):
+                tree = extractor.parse(html)
+                movie = extractor.extract_movie(tree)
+                reviews = extractor.extract_reviews(tree, movie_url)
+            if not movie["movie_name"]:
+                raise ChallengeError(f"No movie header on {movie_url}")
+            fetch_full_texts(session, reviews, movie_url, extractor.extract_full_text)
+            yield movie, reviews
+            if not extractor.next_page_url(tree):
+                return
+    except (ChallengeError, requests.RequestException) as e:
+        print(f"{e}; switching to the browser")
+    finally:
+        session.close()
+    yield from _letterboxd_browser_pages(module, extractor, movie_url, number, lean)
+
+
+def _letterboxd_browser_pages(module, extractor, movie_url, number, lean):
+    driver = pool.acquire(module.create_driver, lean=lean)
+    try:
+        while True:
+            limiter.acquire(movie_url)
+            with metrics.stage("navigation"):
+                driver.get(module.letterboxd_page_url(movie_url, number))
+            wait_for_dom_quiet(driver, timeout=module.PAGE_SETTLE, label="page_load")
+            if pool.first_visit(driver, "letterboxd"):
+                module.close_consent_popup(driver)
+            with metrics.stage("extract"):
+                html = driver.page_source
+                tree = extractor.parse(html)
+                movie = extractor.extract_movie(tree)
+                reviews = extractor.extract_reviews(tree, movie_url)
+            limiter.report(movie_url, page_outcome(html, len(reviews)))
+            if not movie["movie_name"] or not reviews:
+                return
+            if truncated(reviews) and expand_all(driver, module.EXPAND_LINKS):
+                with metrics.stage("extract"):
+                    reviews = extractor.extract_reviews(extractor.parse(driver.page_source), movie_url)
+            yield movie, reviews
+            if not extractor.next_page_url(tree):
+                return
+            number += 1
+    finally:
+        pool.release(driver)
+
+
+def _rottentomatoes_pages(module, movie_url, lean):
+    extractor = get_extractor("rottentomatoes")
+    session = create_session(pool_size=2)
+    try:
+        html = fetch_html(session, movie_url)
+        ems_id = module.find_ems_id(html)
+        if ems_id:
+            movie = {
+                "movie_name": module.rt_movie_name(movie_url),
+                "movie_release_year": extractor.extract_movie(extractor.parse(html))["movie_release_year"],
+            }
+            yield from ((movie, reviews) for reviews in module.iter_api_reviews(session, ems_id, movie_url))
+            return
+    except (ChallengeError, requests.RequestException) as e:
+        print(f"{e}; switching to the browser")
+    finally:
+        session.close()
+
+    def load_more(driver):
+        limiter.acquire(movie_url)
+        return module.click_load_more_shadow(driver)
+
+    def movie_fields(tree):
+        return {"movie_name": module.rt_movie_name(movie_url),
+                "movie_release_year": extractor.extract_movie(tree)["movie_release_year"]}
+
+    # Reviews the endpoint already gave before a bot check are dropped by iter_reviews
+    driver = pool.acquire(module.create_driver, lean=lean)
+    try:
+        yield from _browser_list_pages(driver, module, extractor, movie_url, "rottentomatoes",
+                                       boxes='//*[@id="reviews"]/div[1]/div', more=load_more,
+                                       timeout=module.LOAD_MORE, movie=movie_fields)
+    finally:
+        pool.release(driver)
+
+
+def _imdb_pages(module, movie_url, lean):
+    extractor = get_extractor("imdb")
+
+    def load_more(driver):
+        limiter.acquire(movie_url)
+        return bool(driver.execute_script(module._LOAD_MORE_JS))
+
+    def expand(driver):
+        expand_all(driver, module.EXPAND_BUTTONS,
+                   wait=lambda d: wait_for_dom_quiet(d, timeout=3, quiet_ms=150, label="expand"))
+
+    driver = pool.acquire(module.create_driver, lean=lean)
+    try:
+        yield from _browser_list_pages(driver, module, extractor, movie_url, "imdb",
+                                       boxes=extractor.review_boxes.path, more=load_more,
+                                       timeout=module.LOAD_MORE, expand=expand)
+    finally:
+        pool.release(driver)
+
+
+def _bookmyshow_pages(module, movie_url, lean):
+    extractor = get_extractor("bookmyshow")
+
+    def scroll(driver):
+        module.scroll_to_bottom(driver, movie_url)
+        return True
+
+    driver = pool.acquire(module.create_driver, lean=lean)
+    try:
+        yield from _browser_list_pages(driver, module, extractor, movie_url, "bookmyshow",
+                                       boxes=module.REVIEW_BOXES_XPATH, more=scroll, timeout=module.SCROLL_LOAD)
+    finally:
+        pool.release(driver)
+
+
+def _browser_list_pages(driver, module, extractor, movie_url, site, boxes, more, timeout, expand=None,
+                        movie=None):
+    """Pages of a list that grows in place ("load more" button or infinite scroll).
+
+    Yields the reviews each round added and only asks for the next round
+    (`more(driver)`, False when there is none) when the caller wants more.
+    `movie(tree)` overrides the extractor's movie fields.
+    """
+    limiter.acquire(movie_url)
+    with metrics.stage("navigation"):
+        driver.get(movie_url)
+    wait_for_dom_quiet(driver, timeout=module.PAGE_SETTLE, label="page_load")
+    if pool.first_visit(driver, site):
+        module.close_consent_popup(driver)
+    try:
+        WebDriverWait(driver, 20).until(EC.presence_of_element_located((By.XPATH, boxes)))
+    except Exception as e:
+        limiter.report(movie_url, page_outcome(driver.page_source, 0))
+        print(f"No reviews found for {movie_url}: {e}")
+        return
+
+    offset = 0
+    while True:
+        if expand is not None:
+            expand(driver)
+        with metrics.stage("extract"):
+            html = driver.page_source
+            tree = extractor.parse(html)
+            reviews = extractor.extract_reviews(tree, movie_url)
+            page_movie = movie(tree) if movie else extractor.extract_movie(tree)
+        limiter.report(movie_url, page_outcome(html, len(reviews)))
+        fresh = reviews[offset:]
+        offset = len(reviews)
+        if fresh:
+            yield page_movie, fresh
+        if not more(driver) or wait_for_count_growth(driver, boxes, offset, timeout=timeout,
+                                                     label="load_more") <= offset:
+            return
+
+
+_SOURCES = {
+    "letterboxd": _letterboxd_pages,
+    "rottentomatoes": _rottentomatoes_pages,
+    "imdb": _imdb_pages,
+    "bookmyshow": _bookmyshow_pages,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print a movie's reviews as they load.")
+    parser.add_argument("movie_url")
+    parser.add_argument("--max-reviews", type=int)
+    parser.add_argument("--max-pages", type=int)
+    parser.add_argument("--since", help="stop at reviews older than this date (YYYY-MM-DD)")
+    parser.add_argument("--lean", action="store_true", help="headless Chrome without images, fonts or ads")
+    args = parser.parse_args()
+
+    reviews = iter_reviews(site_for_url(args.movie_url), args.movie_url, max_reviews=args.max_reviews,
+                           max_pages=args.max_pages, since=args.since, lean=args.lean)
+    for review in reviews:
+        print(f"{review.review_date:12} {review.star_rating:3.1f} {review.reviewer_name[:20]:20} "
+              f"{review.review_text[:80]!r}")
@@ -11,3 +11,14 @@ supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
 
 def insert_review(data: dict):
     supabase.table("reviews").insert(data).execute()
+
+def insert_many(rows: list):
+    """Insert a list of review rows in a single request."""
+    if rows:
+        supabase.table("reviews").insert(rows).execute()
+
+def upsert_movies(rows: list):
+    """Insert or update `movies` rows (movie_id primary key, movie_name,
+    movie_release_year, source_site, language) in a single request."""
+    if rows:
+        supabase.table("movies").upsert(rows, on_conflict="movie_id").execute()
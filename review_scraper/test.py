@@ -1,17 +1,17 @@
-import time
-import undetected_chromedriver as uc
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+from browser import create_driver
+from driver_pool import pool
+from waits import wait_for_dom_quiet
 
-options = uc.ChromeOptions()
-# options.add_argument("--headless=new")  # For debugging, run with visible browser
-driver = uc.Chrome(options=options)
+# A warm Chrome from the pool when one is parked; create_driver(lean=False) keeps the browser visible
+driver = pool.acquire(create_driver)
 movie_url = "https://letterboxd.com/film/the-dark-knight/reviews/by/activity/"
 driver.get(movie_url)
-time.sleep(5)
+wait_for_dom_quiet(driver, timeout=10, label="page_load")
 driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-time.sleep(2)
+wait_for_dom_quiet(driver, timeout=5, label="scroll")
 
 # Save the page source for inspection
 with open("debug_page.html", "w", encoding="utf-8") as f:
@@ -27,4 +27,4 @@ try:
 except Exception as e:
     print(f"Error finding review articles: {e}")
 
-driver.quit()
+pool.release(driver)
@@ -0,0 +1,72 @@
+import argparse
+import os
+import time
+
+from review_writer import ReviewWriter
+from spool import DEFAULT_DIR, COMMITTED, SEALED, segments, read_segment, recover_stale, mark_committed
+
+
+def upload_segment(path, writer):
+    """Send one sealed segment through `writer`; True once every row is stored."""
+    rows = read_segment(path)
+    failed_before = writer.failed
+    writer.insert_many(rows)
+    writer.flush()
+    if writer.failed > failed_before:
+        print(f"{os.path.basename(path)}: {writer.failed - failed_before} rows failed, will retry later")
+        return False
+    mark_committed(path)
+    print(f"{os.path.basename(path)}: {len(rows)} rows committed")
+    return True
+
+
+def drain(directory=DEFAULT_DIR, writer=None, follow=False, poll_interval=5.0, replay=False,
+          stale_after=600.0, near_dup=None):
+    """Upload every sealed segment in `directory`, oldest first.
+
+    With follow=True keep polling for new segments until interrupted.
+    replay=True also re-sends committed segments; the writer's dedup index
+    drops rows that are already stored. near_dup, a similarity threshold,
+    also drops near-duplicate reviews of the same movie (see near_dup.py).
+    """
+    owns_writer = writer is None
+    if owns_writer:
+        near_duplicates = None
+        if near_dup:
+            from near_dup import NearDuplicateIndex
+            near_duplicates = NearDuplicateIndex(threshold=near_dup)
+        writer = ReviewWriter(batch_size=500, near_duplicates=near_duplicates)
+    if replay:
+        for path in segments(directory, COMMITTED):
+            os.replace(path, path[:-len(COMMITTED)] + SEALED)
+
+    uploaded = 0
+    try:
+        while True:
+            recover_stale(directory, stale_after)
+            for path in segments(directory, SEALED):
+                uploaded += upload_segment(path, writer)
+            if not follow:
+                break
+            time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if owns_writer:
+            writer.close()
+    return uploaded
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Upload spooled reviews to Supabase.")
+    parser.add_argument("--spool", default=DEFAULT_DIR, help="spool directory")
+    parser.add_argument("--follow", action="store_true", help="keep running and upload new segments")
+    parser.add_argument("--replay", action="store_true", help="re-send committed segments too")
+    parser.add_argument("--stale-after", type=float, default=600.0,
+                        help="where file locks are unavailable, seal .open segments untouched for this many seconds")
+    parser.add_argument("--near-dup", type=float, metavar="SIMILARITY",
+                        help="drop reviews this similar to one already uploaded for the same movie")
+    args = parser.parse_args()
+    count = drain(args.spool, follow=args.follow, replay=args.replay, stale_after=args.stale_after,
+                  near_dup=args.near_dup)
+    print(f"Uploaded {count} segments")
@@ -0,0 +1,181 @@
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+from metrics import registry as metrics
+
+# Each script runs inside the page and calls back once its condition holds,
+# so a wait costs one WebDriver round-trip instead of a polling loop.
+
+_DOM_QUIET_JS = """
+const [quietMs, timeoutMs] = arguments;
+const done = arguments[arguments.length - 1];
+let quietTimer = null;
+const finish = (settled) => {
+    observer.disconnect();
+    clearTimeout(quietTimer);
+    clearTimeout(hardTimer);
+    done(settled);
+};
+const observer = new MutationObserver(() => {
+    clearTimeout(quietTimer);
+    quietTimer = setTimeout(() => finish(true), quietMs);
+});
+const hardTimer = setTimeout(() => finish(false), timeoutMs);
+// Only nodes coming and going: ad slots and carousels rewrite attributes and
+// text for as long as the page is open
+observer.observe(document.documentElement, {childList: true, subtree: true});
+quietTimer = setTimeout(() => finish(true), quietMs);
+"""
+
+_NETWORK_IDLE_JS = """
+const [idleMs, timeoutMs] = arguments;
+const done = arguments[arguments.length - 1];
+performance.setResourceTimingBufferSize(10000);
+const start = performance.now();
+let last = performance.getEntriesByType('resource').length;
+let lastChange = start;
+const tick = () => {
+    const now = performance.now();
+    const count = performance.getEntriesByType('resource').length;
+    if (count !== last) {
+        last = count;
+        lastChange = now;
+    }
+    if (document.readyState === 'complete' && now - lastChange >= idleMs) return done(true);
+    if (now - start >= timeoutMs) return done(false);
+    setTimeout(tick, 50);
+};
+tick();
+"""
+
+_COUNT_GROWTH_JS = """
+const [xpath, previous, timeoutMs] = arguments;
+const done = arguments[arguments.length - 1];
+const count = () => document.evaluate(
+    xpath, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null
+).snapshotLength;
+const initial = count();
+if (initial > previous) return done(initial);
+let scheduled = false;
+const finish = (value) => {
+    observer.disconnect();
+    clearTimeout(hardTimer);
+    done(value);
+};
+const observer = new MutationObserver(() => {
+    if (scheduled) return;
+    scheduled = true;
+    setTimeout(() => {
+        scheduled = false;
+        const current = count();
+        if (current > previous) finish(current);
+    }, 50);
+});
+const hardTimer = setTimeout(() => finish(count()), timeoutMs);
+observer.observe(document.documentElement, {childList: true, subtree: true});
+"""
+
+
+class AdaptiveTimeout:
+    """A timeout that follows how long the condition has recently taken.
+
+    After a few observations the timeout becomes `factor` times the 90th
+    percentile of the last `window` waits, clamped to [floor, ceiling].
+    Until then `initial` is used. A wait that timed out counts as
+    `limit / factor`, which holds the timeout where it was rather than
+    raising it, and still pushes older samples out of the window.
+    """
+
+    def __init__(self, initial, floor=1.0, ceiling=60.0, factor=3.0, window=20):
+        self.initial = initial
+        self.floor = floor
+        self.ceiling = ceiling
+        self.factor = factor
+        self.samples = deque(maxlen=window)
+
+    def observe(self, seconds):
+        self.samples.append(seconds)
+
+    def observe_timeout(self, limit):
+        self.samples.append(limit / self.factor)
+
+    @property
+    def value(self):
+        if len(self.samples) < 3:
+            return self.initial
+        ordered = sorted(self.samples)
+        p90 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.9))]
+        return min(self.ceiling, max(self.floor, p90 * self.factor))
+
+
+class WaitStats:
+    """Accumulates time spent waiting, per kind of wait, against total run time."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.waited = defaultdict(float)
+        self.counts = defaultdict(int)
+        self.timeouts = defaultdict(int)
+
+    @contextmanager
+    def timed(self, label):
+        start_time = time.monotonic()
+        try:
+            yield
+        finally:
+            self.waited[label] += time.monotonic() - start_time
+            self.counts[label] += 1
+
+    def total_wait(self):
+        return sum(self.waited.values())
+
+    def report(self):
+        elapsed = time.monotonic() - self.started
+        waited = self.total_wait()
+        share = waited / elapsed * 100 if elapsed else 0.0
+        parts = ", ".join(
+            f"{label} {seconds:.1f}s/{self.counts[label]}"
+            + (f" ({self.timeouts[label]} timed out)" if self.timeouts[label] else "")
+            for label, seconds in sorted(self.waited.items(), key=lambda item: -item[1])
+        )
+        return f"Waited {waited:.1f}s of {elapsed:.1f}s ({share:.0f}%), worked {elapsed - waited:.1f}s: {parts}"
+
+
+stats = WaitStats()
+
+
+def _run(driver, label, timeout, script, *args):
+    """Run an async wait script and feed the outcome back into stats and `timeout`."""
+    limit = timeout.value if isinstance(timeout, AdaptiveTimeout) else timeout
+    start_time = time.monotonic()
+    with stats.timed(label), metrics.stage("wait"):
+        try:
+            result = driver.execute_async_script(script, *args, int(limit * 1000))
+        except Exception:
+            result = None
+    elapsed = time.monotonic() - start_time
+    timed_out = result in (None, False) or elapsed >= limit
+    if timed_out:
+        stats.timeouts[label] += 1
+    if isinstance(timeout, AdaptiveTimeout):
+        if timed_out:
+            timeout.observe_timeout(limit)
+        else:
+            timeout.observe(elapsed)
+    return result
+
+
+def wait_for_dom_quiet(driver, timeout=10, quiet_ms=300, label="dom_quiet"):
+    """Wait until the DOM has gone `quiet_ms` without mutations. Returns False on timeout."""
+    return bool(_run(driver, label, timeout, _DOM_QUIET_JS, quiet_ms))
+
+
+def wait_for_network_idle(driver, timeout=15, idle_ms=500, label="network_idle"):
+    """Wait until the page has loaded and no resource has finished for `idle_ms`."""
+    return bool(_run(driver, label, timeout, _NETWORK_IDLE_JS, idle_ms))
+
+
+def wait_for_count_growth(driver, xpath, previous_count, timeout=10, label="count_growth"):
+    """Wait until more than `previous_count` nodes match `xpath`; returns the new count."""
+    return _run(driver, label, timeout, _COUNT_GROWTH_JS, xpath, previous_count) or 0